@@ -0,0 +1,170 @@
+"""
+Runs a check over many files in parallel, for the checkUploads and checkLocalFiles commands.
+
+Each file is checked in a process pool, and timed. A failure doesn't stop the others: they are
+all listed at the end, along with the slowest files, and can be written to a JSON or CSV report.
+With a checkpoint, each result is appended to a file as soon as it's known: a run which was
+interrupted picks up where it left off instead of starting over, only checking the files which
+failed again.
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import CommandError
+from django.db import connections
+
+# How many of the slowest files are reported
+NUM_SLOWEST = 20
+
+
+def _time_check(check, name, arg):
+    """ Runs check(arg). Exceptions don't always pickle, so they're returned as strings. """
+    tic = time.monotonic()
+    try:
+        check(arg)
+        error = None
+    except Exception as exc:  # pylint: disable=broad-except
+        error = f'{type(exc).__name__}: {exc}'
+    return {'name': name, 'seconds': round(time.monotonic() - tic, 3), 'error': error}
+
+
+def _close_connections():
+    """ Forked workers must not share the parent's database connections """
+    connections.close_all()
+
+
+def _initialize_worker():
+    """
+    Workers which weren't forked (e.g. with the spawn start method, the default on macOS)
+    start with an unconfigured Django: set it up before the check is imported
+    """
+    django.setup()
+    _close_connections()
+
+
+class BatchValidator:
+    """
+    Checks a list of (name, arg) items, where check is a module-level function (so it can be
+    sent to the worker processes) which raises if arg is invalid.
+    """
+
+    def __init__(self, check, workers=None, checkpointPath=None, onResult=None):
+        self.check = check
+        self.workers = workers or os.cpu_count()
+        self.checkpointPath = checkpointPath
+        self.onResult = onResult
+        self.results = []
+
+    def _read_checkpoint(self):
+        """
+        The successful results of a previous run, by name. Failures are checked again, as
+        the bug may have been fixed since.
+        """
+        if not self.checkpointPath or not os.path.exists(self.checkpointPath):
+            return {}
+        with open(self.checkpointPath, 'r') as f:
+            results = [json.loads(line) for line in f if line.strip()]
+        # A failure which was checked again is listed after it: the last result is the one kept
+        latestResults = {result['name']: result for result in results}
+        return {name: result for name, result in latestResults.items() if result['error'] is None}
+
+    def _iter_results(self, items):
+        """ Yields the result of each item, as they complete """
+        if self.workers == 1:
+            for name, arg in items:
+                yield _time_check(self.check, name, arg)
+            return
+
+        _close_connections()
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_initialize_worker) as executor:
+            futures = [executor.submit(_time_check, self.check, name, arg)
+                       for name, arg in items]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def run(self, items):
+        """ Checks the items which didn't pass already, returning every result """
+        previousResults = self._read_checkpoint()
+        self.results = [previousResults[name] for name, _ in items if name in previousResults]
+        items = [(name, arg) for name, arg in items if name not in previousResults]
+
+        checkpoint = open(self.checkpointPath, 'a') if self.checkpointPath else None
+        try:
+            for i, result in enumerate(self._iter_results(items), 1):
+                self.results.append(result)
+                if checkpoint:
+                    checkpoint.write(json.dumps(result) + '\n')
+                    checkpoint.flush()
+                if self.onResult:
+                    self.onResult(i, len(items), result)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        return self.results
+
+    @property
+    def failures(self):
+        """ The results of the items which failed """
+        return [result for result in self.results if result['error'] is not None]
+
+    @property
+    def slowest(self):
+        """ The results of the slowest items, slowest first """
+        return sorted(self.results, key=lambda result: -result['seconds'])[:NUM_SLOWEST]
+
+    def write_report(self, path):
+        """ Writes the failures and slowest items to a .csv file, or else to a JSON file """
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['kind', 'name', 'seconds', 'error'])
+                for kind, results in (('failure', self.failures), ('slowest', self.slowest)):
+                    for result in results:
+                        writer.writerow([kind, result['name'], result['seconds'],
+                                         result['error'] or ''])
+        else:
+            with open(path, 'w') as f:
+                json.dump({'numChecked': len(self.results),
+                           'numFailed': len(self.failures),
+                           'failures': self.failures,
+                           'slowest': self.slowest}, f, indent=2)
+
+
+def add_arguments(parser):
+    """ The arguments of the commands which run a BatchValidator """
+    parser.add_argument('--workers', type=int, help='Defaults to the number of CPUs')
+    parser.add_argument('--checkpoint', help='A file to record progress in, to resume from')
+    parser.add_argument('--report', help='A .json or .csv file to list failures and slow files in')
+
+
+def run_in_command(command, check, items, options, describeSuccess):
+    """
+    Checks the items, writing each result to the management command's output.
+    Raises a CommandError listing the failures once every item has been checked.
+    """
+    def on_result(i, numItems, result):
+        if result['error'] is None:
+            command.stdout.write(command.style.SUCCESS(
+                f"{describeSuccess(result['name'])} in {result['seconds']}s"))
+        else:
+            command.stderr.write(f"[{i}/{numItems}] Could not load {result['name']}: "
+                                 + result['error'])
+
+    validator = BatchValidator(check,
+                               workers=options['workers'],
+                               checkpointPath=options['checkpoint'],
+                               onResult=on_result)
+    validator.run(items)
+    if options['report']:
+        validator.write_report(options['report'])
+
+    if validator.failures:
+        raise CommandError(f"Could not load {len(validator.failures)} of "
+                           f"{len(validator.results)}: "
+                           + ', '.join(result['name'] for result in validator.failures))
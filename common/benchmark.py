@@ -0,0 +1,154 @@
+"""
+Benchmarks of each stage of the rendering pipeline, over the files in testData/ and over
+synthetic elections of growing size (see common.electionGenerator). Run them with the
+benchmark management command.
+
+Each stage is timed on its own, over the output of the stages before it, and the fastest of
+a few repeats is kept: it's the least noisy. Results are a dict of
+{inputName: {stageName: seconds}}, which is saved as JSON to serve as a baseline for later runs.
+"""
+
+import copy
+import glob
+import io
+import json
+import os
+import platform
+import time
+
+from common.electionGenerator import generate_election
+from common.viewUtils import DefaultConfig
+from visualizer.bargraph.graphToD3 import D3Bargraph
+from visualizer.descriptors.faq import FAQGenerator
+from visualizer.descriptors.roundDescriber import Describer
+from visualizer.graph.graphCreator import make_graph_and_canonical_data, make_graph_with_file
+from visualizer.graph.graphSummary import GraphSummary
+from visualizer.graph.readRCVRCJSON import JSONReader
+from visualizer.sankey.graphToD3 import D3Sankey
+from visualizer.tabular.tabular import TabulateByRoundInteractive, \
+    TabulateByRound, \
+    TabulateByCandidate, \
+    SingleTableSummary
+
+DEFAULT_CORPUS = 'testData/*.json'
+
+# Sizes of the synthetic elections: (candidates, rounds, winners)
+DEFAULT_ELECTION_SIZES = ((10, 9, 1), (30, 25, 3), (100, 90, 1), (200, 150, 5))
+
+# Timings this much slower than the baseline are regressions...
+DEFAULT_THRESHOLD = 0.25
+# ...unless they're within this many seconds of it: below that it's noise
+NOISE_FLOOR_SECONDS = 0.002
+
+
+def _describe(graph, config):
+    describer = Describer(graph, config, summarizeAsParagraph=False)
+    describer.describe_all_rounds()
+    describer.describe_initial_summary(isForVideo=False)
+
+
+# Each stage, by name: a function of (graph, config), except for the first two
+RENDER_STAGES = {
+    'GraphSummary': lambda graph, config: GraphSummary(graph),
+    'D3Bargraph': lambda graph, config: D3Bargraph(graph),
+    'D3Sankey': lambda graph, config: D3Sankey(graph),
+    'TabulateByCandidate': TabulateByCandidate,
+    'SingleTableSummary': lambda graph, config: SingleTableSummary(graph),
+    'TabulateByRound': lambda graph, config: TabulateByRound(graph),
+    'TabulateByRoundInteractive': TabulateByRoundInteractive,
+    'Describer': _describe,
+    'FAQGenerator': lambda graph, config: FAQGenerator(graph, config).describe_all_rounds(),
+}
+
+
+def get_inputs(corpus=DEFAULT_CORPUS, electionSizes=DEFAULT_ELECTION_SIZES):
+    """ Returns the name and file contents of each input, files first """
+    inputs = []
+    for filename in sorted(glob.glob(corpus)):
+        with open(filename, 'r') as f:
+            inputs.append((os.path.basename(filename), f.read()))
+    for numCandidates, numRounds, numWinners in electionSizes:
+        election = generate_election(numCandidates, numRounds, numWinners)
+        inputs.append((f'synthetic-{numCandidates}c-{numRounds}r-{numWinners}w',
+                       json.dumps(election)))
+    return inputs
+
+
+def _time(function, repeat):
+    """ The fastest of the repeats, in seconds """
+    fastest = None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - tic
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+    return fastest
+
+
+def time_stages(contents, repeat=3):
+    """ Times each of the STAGES on the file contents. Returns {stageName: seconds}. """
+    config = DefaultConfig()
+    timings = {}
+
+    timings['make_graph_with_file'] = _time(
+        lambda: make_graph_with_file(io.StringIO(contents), False), repeat)
+
+    # Reading the migrated data builds the Graph, without converting or migrating it again
+    # Each repeat reads its own copy, as each request does, made before the timing starts
+    _, canonicalData = make_graph_and_canonical_data(io.StringIO(contents), False)
+    copies = [copy.deepcopy(canonicalData) for _ in range(repeat)]
+    timings['JSONReader'] = _time(lambda: JSONReader(copies.pop(), isMigrated=True), repeat)
+
+    graph = make_graph_with_file(io.StringIO(contents), False)
+    for name, function in RENDER_STAGES.items():
+        timings[name] = _time(lambda function=function: function(graph, config), repeat)
+    return timings
+
+
+def run(inputs, repeat=3, onResult=None):
+    """
+    Times the stages on each of the (name, contents) inputs. testData/ also has files which
+    aren't valid elections: those are skipped, and onResult is called with their error.
+    """
+    results = {}
+    for name, contents in inputs:
+        try:
+            results[name] = time_stages(contents, repeat)
+            error = None
+        except Exception as exc:  # pylint: disable=broad-except
+            error = exc
+        if onResult:
+            onResult(name, results.get(name), error)
+    return results
+
+
+def save_baseline(results, path):
+    """ Saves the results, with where they were measured: baselines only compare on one machine """
+    with open(path, 'w') as f:
+        json.dump({'machine': platform.node(),
+                   'python': platform.python_version(),
+                   'results': results}, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """ The results saved by save_baseline """
+    with open(path, 'r') as f:
+        return json.load(f)['results']
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns (inputName, stageName, baselineSeconds, seconds) for each timing which is more
+    than threshold (a fraction) slower than the baseline. Inputs or stages which aren't in
+    the baseline are skipped.
+    """
+    regressions = []
+    for inputName, timings in results.items():
+        for stageName, seconds in timings.items():
+            baselineSeconds = baseline.get(inputName, {}).get(stageName)
+            if baselineSeconds is None:
+                continue
+            if seconds > baselineSeconds * (1 + threshold) \
+                    and seconds - baselineSeconds > NOISE_FLOOR_SECONDS:
+                regressions.append((inputName, stageName, baselineSeconds, seconds))
+    return regressions
@@ -0,0 +1,108 @@
+"""
+Canonical JSON: the uploaded file of a JsonConfig after it was converted to the universal
+tabulator format and migrated, stored in a CanonicalJson next to the JsonConfig. Building the
+graph from it skips the converters (e.g. for CSV and xlsx files) and the migrations entirely.
+
+It is stored as zlib-compressed compact JSON, along with the name of the file it was
+created from. It is regenerated the next time it is read if the file is replaced, or if
+the code which converts and migrates uploads changes (see get_code_version).
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+from django.conf import settings
+
+from common import renderBundle, stageTiming
+from visualizer.graph.graphCreator import make_graph_and_canonical_data, \
+    make_graph_with_canonical_data
+from visualizer.models import CanonicalJson
+
+logger = logging.getLogger(__name__)
+
+# Changing either of these files changes the code version, invalidating every canonical JSON.
+# So does changing the version of rcvformats, which does the conversions.
+CODE_VERSION_PATHS = (
+    'visualizer/graph/graphCreator.py',
+    'visualizer/graph/readRCVRCJSON.py',
+)
+REQUIREMENTS_PATH = 'infra/requirements-core.txt'
+
+
+def _get_pinned_rcvformats():
+    """ The line of the requirements which pins rcvformats """
+    with open(os.path.join(settings.BASE_DIR, REQUIREMENTS_PATH), encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('rcvformats'):
+                return line.strip()
+    return ''
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version():
+    """ A hash of all code which affects the canonical JSON, like renderBundle's """
+    hasher = hashlib.sha1()
+    renderBundle.hash_files(hasher, CODE_VERSION_PATHS)
+    hasher.update(_get_pinned_rcvformats().encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def encode(jsonFileName, jsonData):
+    """ Encodes the canonical data of the file with the given name """
+    wrapper = {'jsonFile': jsonFileName, 'data': jsonData}
+    return zlib.compress(json.dumps(wrapper, separators=(',', ':')).encode('utf-8'))
+
+
+@stageTiming.timed('canonicalRead')
+def _decode(config):
+    """ Returns the canonical data of the config, or None if it's missing or outdated """
+    if config.pk is None:
+        return None
+    canonicalJson = CanonicalJson.objects.filter(
+        jsonConfig=config, codeVersion=get_code_version()).only('data').first()
+    if canonicalJson is None:
+        return None
+
+    try:
+        data = zlib.decompress(bytes(canonicalJson.data))
+        wrapper = json.loads(data.decode('utf-8'))
+    except Exception:  # pylint: disable=broad-except
+        # Treat corrupt data as missing data: it'll be regenerated and overwritten
+        logger.exception("Could not read the canonical JSON of %s", config.slug)
+        return None
+
+    if wrapper['jsonFile'] != config.jsonFile.name:
+        return None
+    return wrapper['data']
+
+
+def store(config, jsonData):
+    """ Stores the canonical data of the config's current jsonFile. Call this after saving. """
+    if config.pk is None:
+        # Not saved (e.g. in tests): there's nowhere to store it
+        return
+    CanonicalJson.objects.update_or_create(
+        jsonConfig=config,
+        defaults={'codeVersion': get_code_version(),
+                  'data': encode(config.jsonFile.name, jsonData)})
+
+
+def make_graph(config):
+    """
+    Creates the graph for the given config from its canonical data, first regenerating it
+    from the uploaded file if needed.
+    """
+    exclude = config.excludeFinalWinnerAndEliminatedCandidate
+    jsonData = _decode(config)
+    if jsonData is not None:
+        return make_graph_with_canonical_data(jsonData, exclude)
+
+    # The files may have already been read, e.g. by validators: (re)open them from the start
+    config.jsonFile.open()
+    graph, jsonData = make_graph_and_canonical_data(config.jsonFile, exclude)
+    store(config, jsonData)
+    return graph
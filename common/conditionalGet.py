@@ -0,0 +1,95 @@
+"""
+Conditional GET support: ETags and Last-Modified dates for the pages of a JsonConfig.
+
+A page's ETag hashes everything it is rendered from: the config's fields (which include the
+names of its files: re-uploading always creates a new name), the code which renders it (see
+renderBundle.get_code_version), the templates and static files, and the URL it was requested
+from. Computing it only needs the config's row, so revalidations are answered with a 304 Not
+Modified without reading the render bundle or building the graph.
+
+The Last-Modified date is when the render bundle was created, i.e. when the files, options or
+code last changed. It's less precise than the ETag, which takes precedence when both are sent.
+"""
+
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.views.decorators.http import condition
+
+from common import renderBundle
+from visualizer.common import make_complete_url
+from visualizer.models import JsonConfig, RenderBundle
+
+# Besides the code which renders the bundle, pages depend on these
+SITE_VERSION_PATHS = ('templates', 'static')
+
+
+@functools.lru_cache(maxsize=None)
+def get_site_version():
+    """ A hash of the templates and static files """
+    hasher = hashlib.sha1()
+    for relativePath in SITE_VERSION_PATHS:
+        for root, dirs, files in os.walk(os.path.join(settings.BASE_DIR, relativePath)):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                hasher.update(os.path.relpath(path, settings.BASE_DIR).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def _get_config(request, slug):
+    """ The config of the page, read once per request: both the ETag and the date need it """
+    if not hasattr(request, 'rcvisConditionalConfig'):
+        request.rcvisConditionalConfig = JsonConfig.objects.filter(slug=slug).first()
+    return request.rcvisConditionalConfig
+
+
+def _get_url(request):
+    """ Pages link to themselves with the host they were requested from, like this """
+    return make_complete_url(request, request.get_full_path())
+
+
+def _hash(parts):
+    hasher = hashlib.sha1()
+    for part in parts:
+        hasher.update(f'{part};'.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def get_etag(request, slug, **kwargs):  # pylint: disable=unused-argument
+    """ The ETag of a page of the config with the given slug, or None if there's no such config """
+    config = _get_config(request, slug)
+    if config is None:
+        return None
+
+    fields = [f'{field.attname}={getattr(config, field.attname)}'
+              for field in JsonConfig._meta.concrete_fields]  # pylint: disable=protected-access
+    return _hash([renderBundle.get_code_version(), get_site_version(),
+                  _get_url(request)] + fields)
+
+
+def get_last_modified(request, slug, **kwargs):  # pylint: disable=unused-argument
+    """ When the render bundle of the config with the given slug was created, if it has been """
+    config = _get_config(request, slug)
+    if config is None:
+        return None
+
+    bundle = RenderBundle.objects.filter(
+        jsonConfig=config,
+        codeVersion=renderBundle.get_code_version(),
+        inputsHash=renderBundle.get_inputs_hash(config)).only('createdAt').first()
+    return bundle.createdAt if bundle is not None else None
+
+
+def get_oembed_etag(request):
+    """ The oEmbed response only depends on the URL it was requested from """
+    return _hash([get_site_version(), _get_url(request)])
+
+
+# Decorators for views of a single config, whose URLs have a slug, and for the Oembed view
+config_condition = condition(etag_func=get_etag, last_modified_func=get_last_modified)
+oembed_condition = condition(etag_func=get_oembed_etag)
@@ -0,0 +1,277 @@
+"""
+Generates synthetic elections in the universal tabulator format, of any size, with matching
+sidecar files: for benchmarks and load tests, which need inputs far larger than the ones in
+testData/, and which reach every path of the readers, migrations and describers.
+
+The elections are single transferable vote tabulations, with:
+ - winners elected as soon as they reach the threshold, their surplus transferred
+   (with a residual surplus, as fractional transfers are rounded),
+ - batch eliminations of every candidate who can't catch up with the next one,
+ - inactive ballots, transferred to "exhausted",
+ - and optionally, the quirks of RankIt exports (see the FixRankit* migrations).
+"""
+
+import json
+import os
+import random
+
+from visualizer.common import INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT
+
+# Candidate names sort in the order they were generated in
+CANDIDATE_NAME_FORMAT = 'Candidate {:05d}'
+
+# Transfers are rounded to this many decimals
+NUM_DECIMALS = 4
+
+# How much of each surplus is lost to rounding by the tabulator
+RESIDUAL_SURPLUS_FRACTION = 0.001
+
+# In multi-winner elections, the frontrunner has this many thresholds' worth of votes
+FRONTRUNNER_THRESHOLDS = 1.2
+
+PARTIES = ('(Nonpartisan)', '(Democratic)', '(Republican)', '(Green)', '(Libertarian)')
+
+
+def _format(votes):
+    """ Tallies are strings in the universal tabulator format """
+    return f'{votes:.{NUM_DECIMALS}f}'.rstrip('0').rstrip('.')
+
+
+def _format_tally_result(tallyResult):
+    if 'transfers' not in tallyResult:
+        return tallyResult
+    transfers = {name: _format(votes) for name, votes in tallyResult['transfers'].items()}
+    return dict(tallyResult, transfers=transfers)
+
+
+class ElectionGenerator:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Generates an election of numCandidates, electing numWinners over at most numRounds.
+    The same arguments always generate the same election.
+    """
+
+    def __init__(self, numCandidates, numRounds, numWinners, seed=0,
+                 inactiveFraction=0.05, batchEliminations=True, isRankit=False):
+        # pylint: disable=too-many-arguments
+        if numWinners < 1 or numWinners > numCandidates:
+            raise ValueError(f"Cannot elect {numWinners} of {numCandidates} candidates")
+        if numRounds < 1:
+            raise ValueError("An election needs at least one round")
+        self.numCandidates = numCandidates
+        self.numRounds = numRounds
+        self.numWinners = numWinners
+        self.inactiveFraction = inactiveFraction
+        self.batchEliminations = batchEliminations
+        self.isRankit = isRankit
+        self.rng = random.Random(seed)
+
+        self.tally = {}
+        self.elected = []
+        self.threshold = 0
+
+    def _split_votes(self, votes, continuing):
+        """ Transfers the votes to a few of the continuing candidates, and to exhausted """
+        recipients = self.rng.sample(continuing, min(len(continuing), 5))
+        weights = [self.rng.random() for _ in recipients]
+        toTransfer = votes * (1 - self.inactiveFraction)
+
+        transfers = {}
+        for name, weight in zip(recipients, weights):
+            transferred = round(toTransfer * weight / sum(weights), NUM_DECIMALS)
+            if transferred > 0:
+                transfers[name] = transferred
+        exhausted = round(votes - sum(transfers.values()), NUM_DECIMALS)
+        if exhausted > 0:
+            transfers['exhausted'] = exhausted
+        return transfers
+
+    def _apply(self, transfers):
+        for name, transferred in transfers.items():
+            if name in self.tally:
+                self.tally[name] = round(self.tally[name] + transferred, NUM_DECIMALS)
+
+    def _elect_with_surplus(self, winner, continuing):
+        """ The surplus is transferred at a fraction of its value: the rest is residual """
+        surplus = self.tally[winner] - self.threshold
+        self.tally[winner] = self.threshold
+        self.elected.append(winner)
+
+        residual = round(surplus * RESIDUAL_SURPLUS_FRACTION, NUM_DECIMALS)
+        transfers = self._split_votes(surplus - residual, continuing)
+        if residual > 0:
+            transfers['residual surplus'] = residual
+        return {'elected': winner, 'transfers': transfers}
+
+    def _get_batch(self, continuing):
+        """ The lowest candidates whose votes, combined, can't catch up with the next one """
+        byVotes = sorted(continuing, key=lambda name: self.tally[name])
+        numWinnersLeft = self.numWinners - len(self.elected)
+        batchSize = 1
+        if self.batchEliminations:
+            combined = 0
+            for i, name in enumerate(byVotes[:-1]):
+                combined += self.tally[name]
+                if len(byVotes) - (i + 1) < numWinnersLeft:
+                    break
+                if combined < self.tally[byVotes[i + 1]]:
+                    batchSize = i + 1
+        return byVotes[:batchSize]
+
+    def _eliminate(self, eliminated, continuing):
+        remaining = [name for name in continuing if name not in eliminated]
+        tallyResults = []
+        for name in eliminated:
+            transfers = self._split_votes(self.tally.pop(name), remaining)
+            tallyResults.append({'eliminated': name,
+                                 'transfers': transfers})
+        return tallyResults
+
+    def _tabulate_round(self, isLastRound):
+        """ Elects or eliminates: returns the round's tallyResults, and whether it's the last """
+        continuing = [name for name in self.tally if name not in self.elected]
+        numWinnersLeft = self.numWinners - len(self.elected)
+        byVotes = sorted(continuing, key=lambda name: -self.tally[name])
+
+        if numWinnersLeft == 0:
+            # The round after the last winner's surplus was transferred
+            return [], True
+        if isLastRound or len(continuing) <= numWinnersLeft:
+            # Whoever is ahead at the end wins, as in a bottoms-up tabulation
+            self.elected.extend(byVotes[:numWinnersLeft])
+            return [{'elected': name} for name in byVotes[:numWinnersLeft]], True
+
+        if self.tally[byVotes[0]] >= self.threshold:
+            return [self._elect_with_surplus(byVotes[0], byVotes[1:])], False
+
+        return self._eliminate(self._get_batch(continuing), continuing), False
+
+    def _set_first_round(self):
+        """ The first round's tally, and the threshold """
+        names = [CANDIDATE_NAME_FORMAT.format(i) for i in range(self.numCandidates)]
+        # A long tail of weak candidates, as in real elections...
+        self.tally = {name: float(int(1000 * self.rng.paretovariate(1.2))) for name in names}
+        # ...ending with write-ins with next to no votes, which are eliminated in a batch
+        for name in names[self.numCandidates - self.numCandidates // 10:]:
+            self.tally[name] = float(self.rng.randint(0, 20))
+
+        if self.numWinners > 1:
+            # A frontrunner is elected in the first round, with a surplus to transfer
+            others = sum(self.tally.values()) - self.tally[names[0]]
+            frontrunnerShare = FRONTRUNNER_THRESHOLDS / (self.numWinners + 1)
+            self.tally[names[0]] = float(int(others * frontrunnerShare / (1 - frontrunnerShare)))
+        self.threshold = int(sum(self.tally.values()) / (self.numWinners + 1)) + 1
+
+    def generate(self):
+        """ Returns the election's data, in the universal tabulator format """
+        self._set_first_round()
+
+        results = []
+        for roundNum in range(1, self.numRounds + 1):
+            roundTally = {name: _format(votes) for name, votes in self.tally.items()}
+            tallyResults, isLastRound = self._tabulate_round(roundNum == self.numRounds)
+            results.append({'round': roundNum, 'tally': roundTally,
+                            'tallyResults': [_format_tally_result(tallyResult)
+                                             for tallyResult in tallyResults]})
+            if isLastRound:
+                break
+            for tallyResult in tallyResults:
+                self._apply(tallyResult['transfers'])
+
+        data = {
+            'config': {
+                'contest': f'Synthetic election: {self.numCandidates} candidates, '
+                           f'{len(results)} rounds, {self.numWinners} winners',
+                'date': '2020-01-01',
+                'jurisdiction': 'Synthetic',
+                'office': 'Benchmark',
+                'threshold': str(self.threshold)
+            },
+            'results': results
+        }
+        if self.isRankit:
+            add_rankit_quirks(data)
+        return data
+
+
+def add_rankit_quirks(data):
+    """
+    Modifies the election data the way RankIt exports it (see the FixRankit* migrations):
+    every other elimination is left out, winners drop out of the tallies after they win,
+    and an elimination is combined with a winner's tallyResult on the last round.
+    """
+    data['config']['jurisdiction'] = 'RankIt Export'
+    results = data['results']
+
+    numEliminations = 0
+    for result in results[:-1]:
+        kept = []
+        for tallyResult in result['tallyResults']:
+            if 'eliminated' in tallyResult:
+                numEliminations += 1
+                if numEliminations % 2 == 0:
+                    continue
+                # RankIt leaves out the transfers of eliminations
+                tallyResult.pop('transfers', None)
+            kept.append(tallyResult)
+        result['tallyResults'] = kept
+
+    previouslyElected = set()
+    for result in results:
+        for name in previouslyElected:
+            result['tally'].pop(name, None)
+        previouslyElected.update(tallyResult['elected'] for tallyResult in result['tallyResults']
+                                 if 'elected' in tallyResult)
+
+    lastRound = results[-1]
+    winners = [tallyResult for tallyResult in lastRound['tallyResults']
+               if 'elected' in tallyResult]
+    losers = [name for name in lastRound['tally'] if name not in previouslyElected]
+    if winners and losers:
+        winners[0]['eliminated'] = min(losers, key=lambda name: float(lastRound['tally'][name]))
+
+
+def generate_sidecar(data, seed=0):
+    """ A sidecar file for the election data, with info on each candidate """
+    rng = random.Random(seed)
+    names = list(data['results'][0]['tally'])
+    info = {name: {'incumbent': rng.random() < 0.2,
+                   'photo_url': '/static/visualizer/logo-white.png',
+                   'moreinfo_url': 'https://ballotpedia.org/Link',
+                   'party': rng.choice(PARTIES)}
+            for name in names}
+
+    # Every candidate the graph has must be in the order, including the migrations' ones
+    transferredTo = set()
+    for result in data['results']:
+        for tallyResult in result['tallyResults']:
+            transferredTo.update(tallyResult.get('transfers', {}))
+    if 'exhausted' in transferredTo:
+        names.append(INACTIVE_TEXT)
+    if 'residual surplus' in transferredTo:
+        names.append(RESIDUAL_SURPLUS_TEXT)
+
+    return {'version': '1.0', 'info': info, 'order': names}
+
+
+def generate_election(numCandidates, numRounds, numWinners, seed=0, **kwargs):
+    """ Returns the data of an election: see ElectionGenerator for the options """
+    return ElectionGenerator(numCandidates, numRounds, numWinners, seed, **kwargs).generate()
+
+
+def write_election(directory, numCandidates, numRounds, numWinners, seed=0, **kwargs):
+    """
+    Writes an election and its sidecar to the directory, named after the election's size.
+    Returns the paths of the election and of the sidecar.
+    """
+    data = generate_election(numCandidates, numRounds, numWinners, seed, **kwargs)
+    name = f'synthetic-{numCandidates}c-{numRounds}r-{numWinners}w-{seed}'
+    if kwargs.get('isRankit'):
+        name += '-rankit'
+
+    jsonPath = os.path.join(directory, name + '.json')
+    sidecarPath = os.path.join(directory, name + '-sidecar.json')
+    with open(jsonPath, 'w') as f:
+        json.dump(data, f)
+    with open(sidecarPath, 'w') as f:
+        json.dump(generate_sidecar(data, seed), f)
+    return jsonPath, sidecarPath
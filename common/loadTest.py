@@ -0,0 +1,261 @@
+"""
+A load-test harness for the visualize, embed, Ballotpedia and oEmbed endpoints: how many
+requests per second a single process serves, at each election size. Run it with the loadTest
+management command.
+
+Synthetic elections of graded sizes (see common.electionGenerator) are uploaded to the local
+database and file storage, then a mix of concurrent requests is sent to the app, served by
+a threaded WSGI server in this process. The mixes are:
+ - browse: mostly the visualize page, as shared links are,
+ - embed-heavy: mostly embedded visualizations and their oEmbed lookups, as on news sites,
+ - cold-cache: like browse, but each page is evicted from the page cache before it's requested,
+ - update-storm: like browse, while the elections' options keep changing: each update evicts
+   its pages and its render bundle, so readers race to re-render it.
+Latency percentiles and throughput are reported for each endpoint and election size.
+"""
+
+import json
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, \
+    get_internal_wsgi_application
+from django.db import connections
+from django.urls import reverse
+
+from common import electionGenerator, pageCache
+from visualizer import validators
+from visualizer.models import JsonConfig
+
+# Seeded elections are named and owned like this, so they can be found and deleted.
+# Uploads' slugs never start with an underscore (see JsonConfig._get_unique_slug).
+SLUG_PREFIX = '_loadtest-'
+USERNAME = 'loadtest'
+
+# Election sizes, by name: (candidates, rounds, winners)
+DEFAULT_SIZES = {
+    'small': (5, 4, 1),
+    'medium': (30, 25, 3),
+    'large': (150, 120, 5),
+}
+
+# The relative frequency of each endpoint in each mix. 'update' changes an election's options.
+MIXES = {
+    'browse': {'visualize': 6, 'embed': 2, 'ballotpedia': 1, 'oembed': 1},
+    'embed-heavy': {'visualize': 1, 'embed': 7, 'oembed': 2},
+    'cold-cache': {'visualize': 6, 'embed': 2, 'ballotpedia': 1, 'oembed': 1},
+    'update-storm': {'visualize': 6, 'embed': 2, 'ballotpedia': 1, 'oembed': 1, 'update': 2},
+}
+COLD_CACHE_MIXES = ('cold-cache',)
+
+EMBED_VISTYPES = ('barchart-interactive', 'sankey', 'tabular-by-round')
+
+PERCENTILES = (50, 90, 99)
+
+
+def seed_elections(directory, sizes):
+    """ Uploads a synthetic election of each size, returning their configs by size name """
+    owner, _ = get_user_model().objects.get_or_create(username=USERNAME)
+    configs = {}
+    for sizeName, (numCandidates, numRounds, numWinners) in sizes.items():
+        jsonPath, sidecarPath = electionGenerator.write_election(
+            directory, numCandidates, numRounds, numWinners)
+        with open(jsonPath, 'rb') as jsonFile, open(sidecarPath, 'rb') as sidecarFile:
+            # Uploaded like the Upload view does, so the bundle is rendered up front
+            config = JsonConfig(jsonFile=File(jsonFile, name=f'loadtest-{sizeName}.json'),
+                                candidateSidecarFile=File(sidecarFile,
+                                                          name=f'loadtest-{sizeName}-sc.json'),
+                                slug=f'{SLUG_PREFIX}{sizeName}',
+                                owner=owner)
+            loadedJsons = validators.try_to_load_jsons(config.jsonFile,
+                                                       config.candidateSidecarFile, config)
+            summary = loadedJsons.graph.summarize()
+            config.title = loadedJsons.graph.title
+            config.numRounds = len(summary.rounds)
+            config.numCandidates = len(summary.candidates)
+            config.save()
+            loadedJsons.store(config)
+        configs[sizeName] = config
+    return configs
+
+
+def delete_seeded_elections():
+    """ Deletes every election seed_elections created, in this run or an interrupted one """
+    seeded = JsonConfig.objects.filter(slug__startswith=SLUG_PREFIX, owner__username=USERNAME)
+    for config in seeded:
+        config.jsonFile.delete(save=False)
+        if config.candidateSidecarFile:
+            config.candidateSidecarFile.delete(save=False)
+        config.delete()
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """ The harness reports on the requests: don't log each one too """
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class LocalServer:
+    """ Serves the app from a thread, on a free port of localhost """
+
+    def __init__(self):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler)
+        self.server.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """ The root of the site """
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(sortedValues, percent):
+    """ The nearest-rank percentile of the sorted values """
+    if not sortedValues:
+        return None
+    rank = max(int(round(percent / 100 * len(sortedValues))) - 1, 0)
+    return sortedValues[min(rank, len(sortedValues) - 1)]
+
+
+class LoadTest:  # pylint: disable=too-many-instance-attributes
+    """
+    Sends numRequests requests of the given mix to the server at baseUrl, from numWorkers
+    concurrent clients, for the given configs. host is sent as the Host header.
+    """
+
+    def __init__(self, baseUrl, host, configs, mix, numRequests, numWorkers, seed=0):
+        # pylint: disable=too-many-arguments
+        self.baseUrl = baseUrl
+        self.host = host
+        self.configs = configs
+        self.weights = MIXES[mix]
+        self.isColdCache = mix in COLD_CACHE_MIXES
+        self.numRequests = numRequests
+        self.numWorkers = numWorkers
+        self.rng = random.Random(seed)
+
+        self.latencies = {}  # (endpoint, sizeName) to the seconds each request took
+        self.numErrors = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_path(self, endpoint, slug):
+        """ The path of the endpoint's page for the election, picking an embedded vistype """
+        if endpoint == 'visualize':
+            return reverse('visualize', args=(slug,))
+        if endpoint == 'embed':
+            vistype = self.rng.choice(EMBED_VISTYPES)
+            return reverse('visualizeEmbedded', args=(slug,)) + f'?vistype={vistype}'
+        if endpoint == 'ballotpedia':
+            return reverse('visualizeBallotpedia', args=(slug,))
+        pageUrl = f'https://{self.host}' + reverse('visualize', args=(slug,))
+        return reverse('oembed') + '?url=' + urllib.parse.quote(pageUrl, safe='')
+
+    def _get_session(self):
+        """ Each client keeps its connection alive, as browsers do """
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers['Host'] = self.host
+        return self.local.session
+
+    @staticmethod
+    def _update(config):
+        """ Changes an option, as an edit in the API would """
+        config.doDimPrevRoundColors = not config.doDimPrevRoundColors
+        config.save()
+
+    def _request(self, endpoint, sizeName):
+        config = self.configs[sizeName]
+        tic = time.perf_counter()
+        try:
+            if endpoint == 'update':
+                self._update(config)
+                isError = False
+            else:
+                if self.isColdCache:
+                    pageCache.invalidate(config.slug)
+                    tic = time.perf_counter()
+                url = self.baseUrl + self.get_path(endpoint, config.slug)
+                response = self._get_session().get(url, timeout=60)
+                isError = response.status_code != 200
+        except Exception:  # pylint: disable=broad-except
+            isError = True
+        elapsed = time.perf_counter() - tic
+
+        with self.lock:
+            key = (endpoint, sizeName)
+            self.latencies.setdefault(key, []).append(elapsed)
+            self.numErrors[key] = self.numErrors.get(key, 0) + isError
+
+    def _request_in_worker(self, endpoint, sizeName):
+        try:
+            self._request(endpoint, sizeName)
+        finally:
+            connections.close_all()
+
+    def pick_requests(self):
+        """ The (endpoint, size name) of each request to send, drawn from the mix """
+        endpoints = list(self.weights)
+        weights = [self.weights[endpoint] for endpoint in endpoints]
+        return [(self.rng.choices(endpoints, weights)[0], self.rng.choice(list(self.configs)))
+                for _ in range(self.numRequests)]
+
+    def warm_up(self):
+        """ Requests each page once, so the run measures a warm cache (unless it's cold) """
+        for sizeName in self.configs:
+            for endpoint in ('visualize', 'embed', 'ballotpedia', 'oembed'):
+                self._request(endpoint, sizeName)
+        self.latencies = {}
+        self.numErrors = {}
+
+    def run(self):
+        """ Sends the requests: returns the report """
+        requestsToSend = self.pick_requests()
+        tic = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.numWorkers) as executor:
+            for future in [executor.submit(self._request_in_worker, endpoint, sizeName)
+                           for endpoint, sizeName in requestsToSend]:
+                future.result()
+        return self.get_report(time.perf_counter() - tic)
+
+    def get_report(self, elapsed):
+        """ Latency percentiles and throughput of each endpoint and election size """
+        rows = []
+        for (endpoint, sizeName), latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            row = {'endpoint': endpoint,
+                   'size': sizeName,
+                   'numRequests': len(latencies),
+                   'numErrors': self.numErrors[(endpoint, sizeName)],
+                   'requestsPerSecond': round(len(latencies) / elapsed, 2)}
+            for percent in PERCENTILES:
+                row[f'p{percent}Ms'] = round(percentile(latencies, percent) * 1000, 1)
+            row['maxMs'] = round(latencies[-1] * 1000, 1)
+            rows.append(row)
+
+        numRequests = sum(row['numRequests'] for row in rows)
+        return {'seconds': round(elapsed, 2),
+                'numRequests': numRequests,
+                'requestsPerSecond': round(numRequests / elapsed, 2) if elapsed else None,
+                'rows': rows}
+
+
+def write_report(report, path):
+    """ Saves the report as JSON """
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
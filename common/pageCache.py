@@ -0,0 +1,216 @@
+"""
+Slug-scoped page caching.
+
+Every cached page and fragment belonging to a JsonConfig is stored under a namespace
+unique to its slug. Invalidating a slug replaces its namespace token, so all of its keys
+become unreachable at once and expire on their own, while every other election's cached
+pages are untouched. Pages that aren't tied to a single JsonConfig (the homepage, the
+sitemap, ...) share a site-wide namespace.
+
+The namespace tokens live in the cache itself, so this works across processes as long as
+the cache backend is shared (e.g. redis or memcached).
+
+Pages are stored compressed, once, when they're cached: with gzip and with brotli. Each response
+then serves the stored variant the client accepts, so pages aren't recompressed per request, and
+take less memory in the cache.
+"""
+
+import copy
+import gzip
+import hashlib
+import uuid
+
+import brotli
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.http.response import HttpResponseBase, ResponseHeaders
+from django.middleware.cache import FetchFromCacheMiddleware, UpdateCacheMiddleware
+from django.urls import resolve, Resolver404
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+NAMESPACE_KEY = 'rcvis.namespace.{}'
+SITE_NAMESPACE = None  # The namespace of pages which list many elections
+
+
+def _get_namespace_key(slug):
+    """ Slugs can be longer than some backends allow keys to be: hash them """
+    if slug is SITE_NAMESPACE:
+        return NAMESPACE_KEY.format('site')
+    return NAMESPACE_KEY.format(hashlib.md5(slug.encode('utf-8')).hexdigest())
+
+
+def get_namespace_token(slug):
+    """ Returns the current namespace token for the given slug, creating it if needed """
+    key = _get_namespace_key(slug)
+    token = cache.get(key)
+    if token is None:
+        # If another process creates it first, add() is a no-op and we use theirs
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token
+
+
+def invalidate(slug):
+    """
+    Evicts every cached page and fragment for the given slug, as well as the
+    site-wide pages which may list it.
+    """
+    cache.set(_get_namespace_key(slug), uuid.uuid4().hex, None)
+    cache.set(_get_namespace_key(SITE_NAMESPACE), uuid.uuid4().hex, None)
+
+
+def get_fragment_key(slug, fragmentName):
+    """ A cache key for any data belonging to the given slug, evicted by invalidate(slug) """
+    return f'rcvis.fragment.{get_namespace_token(slug)}.{fragmentName}'
+
+
+def get_slug_for_path(path):
+    """ Returns the JsonConfig slug a URL path belongs to, or SITE_NAMESPACE if none """
+    try:
+        resolverMatch = resolve(path)
+    except Resolver404:
+        return SITE_NAMESPACE
+    return resolverMatch.kwargs.get('slug', SITE_NAMESPACE)
+
+
+def _get_key_prefix(request, defaultPrefix):
+    """
+    The cache key prefix for this request. It's computed once per request, so the page
+    is stored under the namespace it was read from: if the slug is invalidated while the
+    page is rendering, the now-stale page is never served.
+    """
+    if not hasattr(request, 'rcvisCacheKeyPrefix'):
+        token = get_namespace_token(get_slug_for_path(request.path_info))
+        request.rcvisCacheKeyPrefix = f'{defaultPrefix}{token}'
+    return request.rcvisCacheKeyPrefix
+
+
+def _copy_with_key_prefix(middleware, request):
+    """ Middleware is shared between threads, so use a copy to set a per-request prefix """
+    middlewareCopy = copy.copy(middleware)
+    middlewareCopy.key_prefix = _get_key_prefix(request, middleware.key_prefix)
+    return middlewareCopy
+
+
+def _copy_response(response, content):
+    """ A copy of the response, e.g. a TemplateResponse, with its own headers and content """
+    responseCopy = copy.copy(response)
+    responseCopy.headers = ResponseHeaders(dict(response.items()))
+    responseCopy.content = content
+    responseCopy['Content-Length'] = str(len(content))
+    return responseCopy
+
+
+def compress_response(response):
+    """
+    Returns a gzip-compressed copy of the response, which also holds the brotli-compressed
+    content. Pass it to get_response_for to decide which to serve.
+    """
+    compressed = _copy_response(response, compress_string(response.content))
+    compressed['Content-Encoding'] = 'gzip'
+    if compressed.get('ETag', '').startswith('"'):
+        # The content isn't byte-for-byte what the ETag was computed for
+        compressed['ETag'] = 'W/' + compressed['ETag']
+
+    compressed.rcvisBrotliContent = brotli.compress(response.content)
+    return compressed
+
+
+def _get_accepted_encodings(request):
+    """ The quality of each encoding in the Accept-Encoding header, by encoding """
+    qualities = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, *params = [token.strip() for token in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if encoding:
+            qualities[encoding.lower()] = quality
+    return qualities
+
+
+def _accepts(request, encoding):
+    """ Whether the client accepts the encoding: q=0 refuses it, as does leaving it out """
+    qualities = _get_accepted_encodings(request)
+    return qualities.get(encoding, qualities.get('*', 0.0)) > 0
+
+
+def get_response_for(request, compressed, uncompressed=None):
+    """
+    The variant of a response from compress_response which the client accepts.
+    Pass the uncompressed response, if it's at hand, to serve it rather than decompressing.
+    """
+    # Pages cached before brotli was installed don't have a brotli variant
+    if compressed.rcvisBrotliContent is not None and _accepts(request, 'br'):
+        response = _copy_response(compressed, compressed.rcvisBrotliContent)
+        response['Content-Encoding'] = 'br'
+    elif _accepts(request, 'gzip'):
+        response = compressed
+    elif uncompressed is not None:
+        response = uncompressed
+    else:
+        # Rare enough that decompressing is cheaper than storing another copy
+        response = _copy_response(compressed, gzip.decompress(compressed.content))
+        del response['Content-Encoding']
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+class _CompressingCache():
+    """ Wraps the cache used by the cache middleware, to store pages compressed """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.compressedResponse = None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """ The middleware stores both the pages and the lists of headers they vary on """
+        if isinstance(value, HttpResponseBase):
+            value = self.compressedResponse = compress_response(value)
+        self.backend.set(key, value, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+# pylint:disable=too-few-public-methods
+class UpdateSlugCacheMiddleware(UpdateCacheMiddleware):
+    """
+    Replaces UpdateCacheMiddleware: caches each page in its slug's namespace, compressed,
+    and serves the compressed copy if the client accepts it
+    """
+
+    def process_response(self, request, response):
+        if not self._should_update_cache(request, response):
+            return response
+
+        middleware = _copy_with_key_prefix(self, request)
+        middleware.cache = _CompressingCache(self.cache)
+        response = UpdateCacheMiddleware.process_response(middleware, request, response)
+
+        compressed = middleware.cache.compressedResponse
+        if compressed is None:
+            # Not cached, or not rendered yet: serve it as-is
+            return response
+        return get_response_for(request, compressed, response)
+
+
+class FetchFromSlugCacheMiddleware(FetchFromCacheMiddleware):
+    """
+    Replaces FetchFromCacheMiddleware: reads each page from its slug's namespace, and
+    serves the variant the client accepts
+    """
+
+    def process_request(self, request):
+        middleware = _copy_with_key_prefix(self, request)
+        response = FetchFromCacheMiddleware.process_request(middleware, request)
+        if response is None:
+            return None
+        return get_response_for(request, response)
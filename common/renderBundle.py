@@ -0,0 +1,213 @@
+"""
+Render bundles: the output of the rendering pipeline (see viewUtils.get_data_for_graph),
+computed once when a JsonConfig is uploaded or updated, and stored so that a page view
+costs a single small read rather than a full parse of the uploaded file.
+
+A bundle is keyed by the JsonConfig, a hash of the rendering code, and a hash of the
+files and options it was rendered with. Changing any of those makes the bundle stale,
+and it will be recomputed the next time it is requested.
+
+Bundles are also kept in the cache, in front of the database. With a shared cache backend
+(see CACHES in settings.py), a bundle rendered by one worker is read by all of them.
+
+Each value in a bundle is pickled separately, and is only unpickled once it is used (see
+common.renderData): e.g. an embedded bar chart never unpickles the tabular views.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common import pageCache, stageTiming
+from common.renderData import LazyComponent, RenderData
+
+from visualizer.models import JsonConfig, RenderBundle
+
+logger = logging.getLogger(__name__)
+
+# Changing any file under these paths changes the code version, invalidating every bundle.
+CODE_VERSION_PATHS = (
+    'common/renderBundle.py',
+    'common/renderData.py',
+    'common/viewUtils.py',
+    'infra/requirements-core.txt',  # rcvformats is pinned here
+    'visualizer/bargraph',
+    'visualizer/common.py',
+    'visualizer/descriptors',
+    'visualizer/graph',
+    'visualizer/sankey',
+    'visualizer/sidecar',
+    'visualizer/tabular',
+    'visualizer/wikipedia',
+)
+
+# Values in a bundle smaller than this are unpickled as soon as it's read
+LAZY_UNPICKLE_MIN_BYTES = 1024
+
+
+def _enumerate_files_in(path):
+    """ Yields the path if it is a file, or every python file under it if it's a directory """
+    if os.path.isfile(path):
+        yield path
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.py'):
+                yield os.path.join(root, filename)
+
+
+def hash_files(hasher, relativePaths):
+    """ Adds the name and contents of each file under the paths (from BASE_DIR) to the hasher """
+    for relativePath in relativePaths:
+        absolutePath = os.path.join(settings.BASE_DIR, relativePath)
+        for filename in _enumerate_files_in(absolutePath):
+            hasher.update(os.path.relpath(filename, settings.BASE_DIR).encode('utf-8'))
+            with open(filename, 'rb') as f:
+                hasher.update(f.read())
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version():
+    """ A hash of all code which affects the contents of a render bundle """
+    hasher = hashlib.sha1()
+    hash_files(hasher, CODE_VERSION_PATHS)
+    return hasher.hexdigest()
+
+
+def get_inputs_hash(config):
+    """ A hash of the files and options of the given JsonConfig """
+    hasher = hashlib.sha1()
+    for field in JsonConfig.get_all_non_auto_fields():
+        # FileFields hash by their name: re-uploading always creates a new name
+        hasher.update(f'{field}={getattr(config, field)};'.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _get_cache_key(config):
+    """ The key of the bundle in the cache: evicted whenever the config is saved """
+    name = f'renderBundle.{get_code_version()}.{get_inputs_hash(config)}'
+    return pageCache.get_fragment_key(config.slug, name)
+
+
+def _encode(renderData):
+    """ Computes every value of the render data and compresses it into a bundle """
+    pickledValues = {key: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                     for key, value in renderData.resolved_items()}
+    return zlib.compress(pickle.dumps(pickledValues, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _unpickle_or_rerender(config, key, pickledValue, fallback):
+    """
+    Unpickles a value of the bundle. If it's corrupt, or was pickled by incompatible code,
+    the bundle is evicted and the value is rendered from the config instead.
+    fallback is shared by the values of a bundle, so they are rendered at most once.
+    """
+    try:
+        return pickle.loads(pickledValue)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Could not read %s from the render bundle of %s", key, config.slug)
+        evict(config)
+        if 'renderData' not in fallback:
+            # viewUtils stores its renders in bundles: it can't be imported before this module
+            from common import viewUtils  # pylint: disable=import-outside-toplevel,cyclic-import
+            fallback['renderData'] = viewUtils.get_render_data(config)
+        return fallback['renderData'][key]
+
+
+def _unpickle_lazily_if_large(config, key, pickledValue, fallback):
+    """ Small values, e.g. the title, aren't worth deferring """
+    if len(pickledValue) < LAZY_UNPICKLE_MIN_BYTES:
+        return _unpickle_or_rerender(config, key, pickledValue, fallback)
+    return LazyComponent(_unpickle_or_rerender, config, key, pickledValue, fallback)
+
+
+def _decode(data, config):
+    """ Returns the render data from a compressed bundle, or None if it's unreadable """
+    try:
+        pickledValues = pickle.loads(zlib.decompress(data))
+    except Exception:  # pylint: disable=broad-except
+        # Treat a corrupt bundle as a missing one: it'll be recomputed and overwritten
+        logger.exception("Could not read a render bundle")
+        return None
+    fallback = {}
+    return RenderData({key: _unpickle_lazily_if_large(config, key, pickledValue, fallback)
+                       for key, pickledValue in pickledValues.items()})
+
+
+def evict(config):
+    """ Deletes every bundle of the given config, e.g. because one is unreadable """
+    RenderBundle.objects.filter(jsonConfig=config).delete()
+    cache.delete(_get_cache_key(config))
+
+
+@stageTiming.timed('bundleRead')
+def load(config):
+    """ Returns the render data for the given config, or None if there is no fresh bundle """
+    cacheKey = _get_cache_key(config)
+    data = cache.get(cacheKey)
+    if data is None:
+        bundle = RenderBundle.objects.filter(
+            jsonConfig=config,
+            codeVersion=get_code_version(),
+            inputsHash=get_inputs_hash(config)).only('data').first()
+        if bundle is None:
+            return None
+        data = bytes(bundle.data)
+        cache.set(cacheKey, data)
+
+    renderData = _decode(data, config)
+    if renderData is None:
+        cache.delete(cacheKey)
+    return renderData
+
+
+def _decode_eagerly(data):
+    """ Returns the render data from a compressed bundle with every value unpickled, or None """
+    try:
+        pickledValues = pickle.loads(zlib.decompress(data))
+        return RenderData({key: pickle.loads(pickledValue)
+                           for key, pickledValue in pickledValues.items()})
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Could not read a render bundle rendered by older code", exc_info=True)
+        return None
+
+
+@stageTiming.timed('bundleRead')
+def load_stale(config):
+    """
+    Returns the render data of the newest bundle for the given config, even if it was
+    rendered with older options or by older code, or None if there are no readable bundles.
+    Values pickled by older code may not unpickle with the current code (e.g. if a class
+    gained __slots__), so those bundles are unpickled up front rather than while rendering.
+    """
+    bundles = RenderBundle.objects.filter(jsonConfig=config).order_by('-createdAt')
+    bundle = bundles.only('codeVersion', 'data').first()
+    if bundle is None:
+        return None
+    if bundle.codeVersion == get_code_version():
+        return _decode(bytes(bundle.data), config)
+    return _decode_eagerly(bytes(bundle.data))
+
+
+@stageTiming.timed('bundleWrite')
+def save(config, renderData):
+    """ Stores the render data for the given config, replacing any older bundles """
+    data = _encode(renderData)
+    bundle, _ = RenderBundle.objects.update_or_create(
+        jsonConfig=config,
+        codeVersion=get_code_version(),
+        inputsHash=get_inputs_hash(config),
+        defaults={'data': data})
+
+    # Stale bundles will never be read again
+    RenderBundle.objects.filter(jsonConfig=config).exclude(pk=bundle.pk).delete()
+
+    cache.set(_get_cache_key(config), data)
@@ -0,0 +1,57 @@
+"""
+The output of the rendering pipeline, computed lazily.
+
+Each component of a visualization (the bar chart's JS, the tabular views, the round
+descriptions, ...) is only computed when it is first used. Templates call a LazyComponent
+when they look it up, so a page only pays for the components it includes: for example,
+an embedded visualization includes just one.
+"""
+
+
+class LazyComponent():  # pylint: disable=too-few-public-methods
+    """ A value which is computed by calling function(*args), once, the first time it's needed """
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+        self.isComputed = False
+        self.value = None
+
+    def __call__(self):
+        if not self.isComputed:
+            self.value = self.function(*self.args)
+            self.isComputed = True
+
+            # Release the inputs, e.g. the graph, which are no longer needed
+            self.function = None
+            self.args = None
+        return self.value
+
+
+class RenderData(dict):
+    """
+    A dict of the rendered data, whose values may be LazyComponents: looking one up
+    computes it. Django copies the dict into the template context as-is, so templates
+    get the LazyComponent itself, and call it only if they use it.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyComponent):
+            return value()
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def resolve_all(self):
+        """ Computes every component, e.g. to check that each can be rendered. Returns self. """
+        for key in self:
+            self[key]  # pylint: disable=pointless-statement
+        return self
+
+    def resolved_items(self):
+        """ Like items(), but with every component computed """
+        return [(key, self[key]) for key in self]
@@ -0,0 +1,149 @@
+"""
+Per-stage timing of requests: how long each stage of the rendering pipeline took (reading the
+bundle or the file, converting it, migrating it, building the graph, each renderer...), and
+how much it allocated.
+
+A sample of requests (see settings.STAGE_TIMING_SAMPLE_RATE) is timed. Their stages are sent
+in a Server-Timing header, which browsers show in their developer tools, and logged as JSON.
+Outside of a sampled request, stages cost next to nothing.
+
+Allocations are the net number of memory blocks the stage allocated, and the net bytes if
+tracemalloc is tracing (e.g. with PYTHONTRACEMALLOC=1). Both are counted for the whole
+process: with a threaded server, they include the other threads' allocations.
+Stages can be nested, e.g. the graph is built while rendering: each is timed on its own.
+Stages which run more than once in a request, such as reading several bundles, are summed.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_currentTimings = contextvars.ContextVar('stageTimings', default=None)
+
+
+def _get_traced_bytes():
+    if not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0]
+
+
+class StageTimings:
+    """ The stages of a single request, in the order they were first entered """
+
+    def __init__(self):
+        self.stages = {}
+
+    def enter(self, name):
+        """ Lists the stage, so that outer stages are listed before the stages they include """
+        self.stages.setdefault(name, {'ms': 0.0, 'count': 0, 'allocatedBlocks': 0})
+
+    def add(self, name, seconds, numBlocks, numBytes):
+        """ Records a run of the stage """
+        times = self.stages[name]
+        times['ms'] += seconds * 1000
+        times['count'] += 1
+        times['allocatedBlocks'] += numBlocks
+        if numBytes is not None:
+            times['allocatedBytes'] = times.get('allocatedBytes', 0) + numBytes
+
+    def get_server_timing(self):
+        """ The value of the Server-Timing header """
+        return ', '.join(f'{name};dur={times["ms"]:.1f}' for name, times in self.stages.items())
+
+    def as_dict(self):
+        """ Each stage, by name, with its time rounded for logging """
+        return {name: dict(times, ms=round(times['ms'], 2)) for name, times in self.stages.items()}
+
+
+@contextlib.contextmanager
+def stage(name):
+    """ Times the code in the with block as the given stage of the current request, if any """
+    timings = _currentTimings.get()
+    if timings is None:
+        yield
+        return
+
+    timings.enter(name)
+    startBlocks = sys.getallocatedblocks()
+    startBytes = _get_traced_bytes()
+    tic = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - tic
+        endBytes = _get_traced_bytes()
+        numBytes = endBytes - startBytes if None not in (startBytes, endBytes) else None
+        timings.add(name, seconds, sys.getallocatedblocks() - startBlocks, numBytes)
+
+
+def timed(name):
+    """ A decorator which times each call of the function as the given stage """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def iter_timed(name, iterable):
+    """
+    Yields from the iterable, timing the production of each item as the given stage.
+    Streamed responses are iterated after the request is timed: those aren't recorded.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextlib.contextmanager
+def timing_stages():
+    """ Times the stages run in the with block: yields their StageTimings """
+    timings = StageTimings()
+    token = _currentTimings.set(timings)
+    try:
+        yield timings
+    finally:
+        _currentTimings.reset(token)
+
+
+class StageTimingMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    Times a sample of the requests. It must come before the page cache middleware, so that
+    cached pages don't keep the Server-Timing header of the request which rendered them.
+    """
+
+    def __init__(self, getResponse):
+        self.getResponse = getResponse
+
+    def __call__(self, request):
+        if random.random() >= settings.STAGE_TIMING_SAMPLE_RATE:
+            return self.getResponse(request)
+
+        with timing_stages() as timings:
+            with stage('total'):
+                response = self.getResponse(request)
+
+        response['Server-Timing'] = timings.get_server_timing()
+        logger.info("Stage timings: %s", json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'stages': timings.as_dict()}))
+        return response
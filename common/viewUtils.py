@@ -1,14 +1,18 @@
 """ Utility functions shared across views, in either movie or visualizer apps """
 
 import json
+import logging
+import time
 
+from django.core.cache import cache
 from django.shortcuts import render
 
+from common import canonicalJson, pageCache, renderBundle, stageTiming
+from common.renderData import LazyComponent, RenderData
 from rcvis.settings import OFFLINE_MODE
 from visualizer.bargraph.graphToD3 import D3Bargraph
 from visualizer.descriptors.faq import FAQGenerator
 from visualizer.descriptors.roundDescriber import Describer
-from visualizer.graph.graphCreator import make_graph_with_file
 from visualizer.models import TextForWinner
 from visualizer.sankey.graphToD3 import D3Sankey
 from visualizer.tabular.tabular import TabulateByRoundInteractive,\
@@ -16,6 +20,16 @@ from visualizer.tabular.tabular import TabulateByRoundInteractive,\
     TabulateByCandidate,\
     SingleTableSummary
 
+logger = logging.getLogger(__name__)
+
+# While one request renders a config, others for the same config wait rather than
+# rendering it too. After this long, assume the renderer died and render it anyway.
+# The lock is a cache.add, so this only coalesces renders across processes with a shared
+# cache whose add is atomic, i.e. redis: LocMemCache is per-process, and FileBasedCache's
+# add can race. With those, concurrent requests may each render the config.
+RENDER_LOCK_SECONDS = 30
+RENDER_WAIT_POLL_SECONDS = 0.2
+
 
 class DefaultConfig():  # pylint: disable=too-few-public-methods
     """
@@ -28,6 +42,8 @@ class DefaultConfig():  # pylint: disable=too-few-public-methods
         self.onlyShowWinnersTabular = False
         self.textForWinner = TextForWinner.ELECTED
         self.isPreferentialBlock = False
+        self.excludeFinalWinnerAndEliminatedCandidate = False
+        self.candidateSidecarFile = None
 
 
 def get_embed_html(embedUrl, request, vistype, maxwidth, maxheight):
@@ -49,73 +65,178 @@ def get_embed_html(embedUrl, request, vistype, maxwidth, maxheight):
     return html
 
 
+def _describe_rounds(graph, config):
+    return Describer(graph, config, summarizeAsParagraph=False).describe_all_rounds()
+
+
+def _describe_summary(graph, config):
+    describer = Describer(graph, config, summarizeAsParagraph=False)
+    return describer.describe_initial_summary(isForVideo=False)
+
+
+def _describe_faqs(graph, config):
+    return json.dumps(FAQGenerator(graph, config).describe_all_rounds())
+
+
+# Each component of the visualizations, by the name templates use for it:
+# a function of (graph, config). See get_data_for_graph.
+COMPONENTS = {
+    'bargraphjs': lambda graph, config: D3Bargraph(graph).js,
+    'sankeyjs': lambda graph, config: D3Sankey(graph).js,
+    'tabularByCandidate': TabulateByCandidate,
+    'singleTableSummary': lambda graph, config: SingleTableSummary(graph),
+    'tabularByRound': lambda graph, config: TabulateByRound(graph),
+    'tabularByRoundInteractive': TabulateByRoundInteractive,
+    'humanFriendlyEventsPerRound': _describe_rounds,
+    'humanFriendlySummary': _describe_summary,
+    'faqsPerRound': _describe_faqs,
+}
+
+
 def get_data_for_graph(graph, config):
     """
     Helper function for get_data_for_view:
     convert the graph to data to be passed on to JS.
+    Each of the COMPONENTS is only computed once it is used, e.g. by a template.
+    The graph itself isn't kept: callers which need it use make_graph.
     """
-    d3Bargraph = D3Bargraph(graph)
-    d3Sankey = D3Sankey(graph)
-    tabularByCandidate = TabulateByCandidate(graph, config)
-    singleTableSummary = SingleTableSummary(graph)
-    tabularByRound = TabulateByRound(graph)
-    tabularByRoundInteractive = TabulateByRoundInteractive(graph, config)
-    graphData = {
+    rounds = graph.summarize().rounds
+    graphData = RenderData({
         'title': graph.title,
         'date': graph.dateString,
-        'bargraphjs': d3Bargraph.js,
-        'sankeyjs': d3Sankey.js,
-        'tabularByCandidate': tabularByCandidate,
-        'singleTableSummary': singleTableSummary,
-        'tabularByRound': tabularByRound,
-        'tabularByRoundInteractive': tabularByRoundInteractive,
-        'graph': graph
-    }
-    roundDescriberData = get_data_for_round_describer(graph, config)
-    graphData.update(roundDescriberData)
+        'numRounds': len(rounds),
+        'numVotesFirstRound': rounds[0].totalActiveVotes
+    })
+    for name, function in COMPONENTS.items():
+        timedFunction = stageTiming.timed(f'render.{name}')(function)
+        graphData[name] = LazyComponent(timedFunction, graph, config)
     return graphData
 
 
-def get_data_for_round_describer(graph, config):
+def get_render_data(config):
     """
-    Helper function for get_data_for_view:
-    convert the round describer to data to be passed on to JS
+    Runs the full rendering pipeline for the given config: loads the canonical JSON, builds
+    the graph, and renders everything the views need. Prefer get_data_for_view, which reads
+    this from the render bundle when it can.
     """
-    roundDescriber = Describer(graph, config, summarizeAsParagraph=False)
-    humanFriendlyEventsPerRound = roundDescriber.describe_all_rounds()
-    humanFriendlySummary = roundDescriber.describe_initial_summary(isForVideo=False)
-    faqsPerRound = json.dumps(FAQGenerator(graph, config).describe_all_rounds())
+    return get_render_data_for_graph(canonicalJson.make_graph(config), config)
 
-    return {
-        'humanFriendlyEventsPerRound': humanFriendlyEventsPerRound,
-        'humanFriendlySummary': humanFriendlySummary,
-        'faqsPerRound': faqsPerRound
-    }
+
+def make_graph(config):
+    """
+    The config's graph, as it is rendered. Only for what isn't in the render data,
+    e.g. the wikicode export: the render bundles don't keep the graph.
+    """
+    graph = canonicalJson.make_graph(config)
+    _apply_sidecar(graph, config)
+    return graph
+
+
+def _apply_sidecar(graph, config):
+    """ Applies the config's sidecar file, if it has one, to the graph and returns its data """
+    if not config.candidateSidecarFile:
+        return None
+
+    # The file may have already been read, e.g. by validators: reopen it from the start
+    config.candidateSidecarFile.open()
+    candidateSidecarDataPyObj = json.load(config.candidateSidecarFile)
+
+    # TODO this doesn't feel good - the graph should load this natively,
+    # not have it snuck here.
+    orderedItems = graph.get_items_for_names(candidateSidecarDataPyObj['order'])
+    graph.set_elimination_order(orderedItems)
+    return candidateSidecarDataPyObj
+
+
+def get_render_data_for_graph(graph, config):
+    """
+    Helper function for get_render_data: applies the config's sidecar file to the graph,
+    then renders it with the config's options.
+    """
+    candidateSidecarDataPyObj = _apply_sidecar(graph, config)
+    candidateSidecarData = json.dumps(candidateSidecarDataPyObj)
+
+    graphData = get_data_for_graph(graph, config)
+    graphData.update({
+        'candidateSidecarDataPyObj': candidateSidecarDataPyObj,
+        'candidateSidecarData': candidateSidecarData
+    })
+    return graphData
+
+
+def create_render_bundle(config):
+    """
+    Renders the given (saved) config and stores the result. Uploads don't need this:
+    they store what was rendered while validating (see validators.LoadedJsons).
+    """
+    renderData = get_render_data(config)
+    renderBundle.save(config, renderData)
+    return renderData
+
+
+def _wait_for_render_bundle(config, lockKey):
+    """
+    Waits for another request to finish rendering the config, returning its bundle,
+    or None if the render lock timed out or was released without creating a bundle.
+    """
+    deadline = time.monotonic() + RENDER_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(RENDER_WAIT_POLL_SECONDS)
+        graphData = renderBundle.load(config)
+        if graphData is not None:
+            return graphData
+        if cache.get(lockKey) is None:
+            return None
+    logger.warning("Timed out waiting for %s to render", config.slug)
+    return None
+
+
+def _load_or_create_render_bundle(config):
+    """
+    Loads the render bundle, or creates it if it's missing or stale.
+    Concurrent requests are coalesced: only one renders the config, and the others serve
+    the stale bundle if there is one (marked with 'isStale'), or wait for the new one.
+    """
+    graphData = renderBundle.load(config)
+    if graphData is not None:
+        return graphData
+
+    lockKey = pageCache.get_fragment_key(config.slug, 'renderLock')
+    if cache.add(lockKey, True, RENDER_LOCK_SECONDS):
+        try:
+            return create_render_bundle(config)
+        finally:
+            cache.delete(lockKey)
+
+    graphData = renderBundle.load_stale(config)
+    if graphData is not None:
+        graphData['isStale'] = True
+        return graphData
+
+    graphData = _wait_for_render_bundle(config, lockKey)
+    if graphData is not None:
+        return graphData
+
+    # The other renderer failed or is taking too long: give up on coalescing
+    return create_render_bundle(config)
 
 
 def get_data_for_view(config):
-    """ All data needed to pass on to the visualize or visualizeembedded view """
-    graph = make_graph_with_file(config.jsonFile,
-                                 config.excludeFinalWinnerAndEliminatedCandidate)
-    if config.candidateSidecarFile:
-        candidateSidecarDataPyObj = json.load(config.candidateSidecarFile)
-
-        # TODO this doesn't feel good - the graph should load this natively,
-        # not have it snuck here.
-        orderedItems = graph.get_items_for_names(candidateSidecarDataPyObj['order'])
-        graph.set_elimination_order(orderedItems)
+    """
+    All data needed to pass on to the visualize or visualizeembedded view.
+    If 'isStale' is set, the data is from an outdated bundle and must not be cached.
+    """
+    if config.pk is None:
+        # Not saved (e.g. in tests): there's nowhere to store a bundle
+        graphData = get_render_data(config)
     else:
-        candidateSidecarDataPyObj = None
-    candidateSidecarData = json.dumps(candidateSidecarDataPyObj)
+        graphData = _load_or_create_render_bundle(config)
 
     offlineMode = OFFLINE_MODE
 
-    graphData = get_data_for_graph(graph, config)
     additionalData = {
         'config': config,
-        'offlineMode': offlineMode,
-        'candidateSidecarDataPyObj': candidateSidecarDataPyObj,
-        'candidateSidecarData': candidateSidecarData
+        'offlineMode': offlineMode
     }
     graphData.update(additionalData)
     return graphData
@@ -0,0 +1,81 @@
+"""
+Cached wikicode exports (see visualizer.wikipedia).
+
+The wikicode is only generated when it is first asked for, then kept in the cache, in the
+namespace of its slug: it is evicted whenever the election changes. Featured elections are
+visited the most, so theirs never expires, and is generated as soon as they're featured or
+updated, and by the warmCache command.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.urls import reverse
+
+from common import pageCache, renderBundle, stageTiming, viewUtils
+from visualizer.common import make_complete_url
+from visualizer.models import HomepageFeaturedElection
+from visualizer.wikipedia.wikipedia import WikipediaExport
+
+
+def get_reference_url(request, slug):
+    """ The wikicode cites the single table summary on the visualize page """
+    referenceUrl = make_complete_url(request, reverse("visualize", args=(slug,)))
+    return referenceUrl + "#tabular-candidate-by-round"
+
+
+def get_reference_url_for_host(host, slug, secure=True):
+    """ Like get_reference_url, for requests to the given host, e.g. outside of a request """
+    scheme = 'https' if secure else 'http'
+    return f"{scheme}://{host}{reverse('visualize', args=(slug,))}#tabular-candidate-by-round"
+
+
+def _get_cache_key(config, referenceUrl):
+    """ The reference URL is part of the key: each host the site is served from cites itself """
+    hasher = hashlib.sha1()
+    for part in (renderBundle.get_code_version(), renderBundle.get_inputs_hash(config),
+                 referenceUrl):
+        hasher.update(f'{part};'.encode('utf-8'))
+    return pageCache.get_fragment_key(config.slug, f'wikicode.{hasher.hexdigest()}')
+
+
+def _get_timeout(config):
+    """ Featured elections keep their wikicode until they change """
+    if HomepageFeaturedElection.objects.filter(jsonConfig=config).exists():
+        return None
+    return DEFAULT_TIMEOUT
+
+
+def iter_wikicode(config, referenceUrl):
+    """
+    Yields the wikicode of the config a piece at a time, for streaming. If it isn't cached,
+    it's generated from the config's graph, and cached once it's complete.
+    """
+    cacheKey = _get_cache_key(config, referenceUrl)
+    wikicode = cache.get(cacheKey)
+    if wikicode is not None:
+        yield wikicode
+        return
+
+    pieces = []
+    wikicode = WikipediaExport(viewUtils.make_graph(config), referenceUrl).iter_wikicode()
+    for piece in stageTiming.iter_timed('wikipediaExport', wikicode):
+        pieces.append(piece)
+        yield piece
+    cache.set(cacheKey, ''.join(pieces), _get_timeout(config))
+
+
+def get_wikicode(config, referenceUrl):
+    """ Returns the wikicode of the config, from the cache if it's there """
+    return ''.join(iter_wikicode(config, referenceUrl))
+
+
+def precompute_if_featured(config, referenceUrl):
+    """ Generates and caches the wikicode of the (saved) config if it's a featured election """
+    if not HomepageFeaturedElection.objects.filter(jsonConfig=config).exists():
+        return
+    graph = viewUtils.make_graph(config)
+    with stageTiming.stage('wikipediaExport'):
+        wikicode = WikipediaExport(graph, referenceUrl).create_wikicode()
+    cache.set(_get_cache_key(config, referenceUrl), wikicode, None)
@@ -14,10 +14,10 @@ from moviepy.editor import AudioFileClip, CompositeVideoClip, ImageClip, TextCli
     concatenate_videoclips
 import selenium
 
+from common import canonicalJson
 from common.viewUtils import get_script_to_disable_animations
 from rcvis.settings import MOVIE_FONT_NAME
 from visualizer.descriptors.roundDescriber import Describer
-from visualizer.graph.graphCreator import make_graph_with_file
 from movie import models
 from movie.creation.textToSpeech import TextToSpeechFactory
 
@@ -36,8 +36,7 @@ class SingleMovieCreator():
         """ Initialize all class data. """
         self.browser = browser
         self.textToSpeechFactory = textToSpeechFactory
-        self.graph = make_graph_with_file(jsonconfig.jsonFile,
-                                          jsonconfig.excludeFinalWinnerAndEliminatedCandidate)
+        self.graph = canonicalJson.make_graph(jsonconfig)
         self.config = jsonconfig
         self.size = size
 
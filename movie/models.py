@@ -1,10 +1,12 @@
 """ Models for storing data about a movie """
 from django.conf import settings
 from django.contrib import admin
-from django.core.cache import cache
 from django.core.files.storage import get_storage_class
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Q
+
+from common import pageCache
 
 
 # pylint:disable=abstract-method,too-few-public-methods
@@ -37,9 +39,13 @@ class Movie(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        # Clear the cache. Otherwise, you'll continue to get the cached result
-        # of the old model.
-        cache.clear()
+        # Clear the cache of the elections showing this movie. Otherwise, you'll
+        # continue to get the cached result of the old model.
+        # Imported here: visualizer.models refers to this model
+        from visualizer.models import JsonConfig  # pylint: disable=import-outside-toplevel
+        configs = JsonConfig.objects.filter(Q(movieHorizontal=self) | Q(movieVertical=self))
+        for slug in configs.values_list('slug', flat=True):
+            pageCache.invalidate(slug)
 
 
 class TextToSpeechCachedFile(models.Model):
@@ -79,10 +79,17 @@ MIDDLEWARE = [
 
     'django.contrib.sessions.middleware.SessionMiddleware',
 
+    # Adds a Server-Timing header to a sample of responses: must come before the page cache
+    'common.stageTiming.StageTimingMiddleware',
+
+    # Answers If-None-Match with a 304, including for pages served from the cache below
+    'django.middleware.http.ConditionalGetMiddleware',
+
     # Order of the next 3 is important
-    'django.middleware.cache.UpdateCacheMiddleware',
+    # (cached pages are namespaced by slug, see common/pageCache.py)
+    'common.pageCache.UpdateSlugCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    'common.pageCache.FetchFromSlugCacheMiddleware',
 
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -277,12 +284,46 @@ CLOUDFLARE_AUTH_TOKEN = os.environ.get('CLOUDFLARE_AUTH_TOKEN')
 
 AWS_DEFAULT_ACL = None
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# The cache holds rendered pages and render bundles (see common/pageCache.py).
+# Use a cache shared by all workers in production: with a per-process cache, the hit
+# rate drops with each worker added.
+if os.environ.get('REDIS_URL'):
+    # Redis, shared by every worker and dyno. Pages and render bundles are stored
+    # compressed already, so redis doesn't compress them again.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                # Serve pages uncached rather than failing if redis goes down
+                'IGNORE_EXCEPTIONS': True,
+            }
+        }
     }
-}
+elif os.environ.get('RCVIS_CACHE_DIR'):
+    # A directory, shared by every worker on this machine. Entries are zlib-compressed.
+    # Its add() isn't atomic, so concurrent renders aren't coalesced (see viewUtils).
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['RCVIS_CACHE_DIR'],
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+            }
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+CACHE_MIDDLEWARE_SECONDS = int(os.environ.get('RCVIS_CACHE_SECONDS', 600))
+
+# The fraction of requests whose stages are timed, from 0 to 1 (see common/stageTiming.py)
+STAGE_TIMING_SAMPLE_RATE = float(os.environ.get('RCVIS_STAGE_TIMING_SAMPLE_RATE', 0))
 
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
@@ -307,6 +348,10 @@ REST_FRAMEWORK = {
 
 }
 
+# Uploaded files are streamed while parsing, so this can be raised without loading
+# the whole file into memory
+MAX_UPLOAD_SIZE_BYTES = int(float(os.environ.get('RCVIS_MAX_UPLOAD_SIZE_MB', 2)) * 1024 * 1024)
+
 MOVIE_FONT_NAME = os.environ.get("MOVIE_FONT_NAME", "Roboto")
 
 if not OFFLINE_MODE:
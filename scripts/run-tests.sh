@@ -37,6 +37,7 @@ elif [ "$CI_NODE_TOTAL" -eq 3 ]; then
 
     echo "Starting tests"
     python3 manage.py test visualizer/tests/testBallotpediaRestApi.py\
+                           visualizer/tests/testCaching.py\
                            visualizer/tests/testFaq.py\
                            visualizer/tests/testModelDeletion.py\
                            visualizer/tests/testRestApi.py\
@@ -393,3 +393,36 @@ function fitSankeyViewboxToContents() {
   const p = 10; // padding
   svg.setAttribute("viewBox", (bbox.x-p) + " " + (bbox.y-p) + " " + (bbox.width+p) + " " + (bbox.height+p));
 }
+
+function makeSankeyGraph(columns) {
+  // The server sends the nodes and links as columns: one array per attribute.
+  // Turn them into the list of node and link objects that d3-sankey expects.
+  const nodeColumns = columns.nodes;
+  const linkColumns = columns.links;
+
+  const nodes = new Array(nodeColumns.candidate.length);
+  for (let i = 0; i < nodes.length; i++) {
+    const candidateIndex = nodeColumns.candidate[i];
+    nodes[i] = {
+      "name": nodeColumns.name[candidateIndex],
+      "round": nodeColumns.round[i],
+      "value": nodeColumns.value[i],
+      "isWinner": nodeColumns.isWinner[i],
+      "isEliminated": nodeColumns.isEliminated[i],
+      "index": candidateIndex
+    };
+  }
+
+  const links = new Array(linkColumns.source.length);
+  for (let i = 0; i < links.length; i++) {
+    const source = linkColumns.source[i];
+    links[i] = {
+      "source": source,
+      "target": linkColumns.target[i],
+      "candidateIndex": nodes[source].index,
+      "value": linkColumns.value[i]
+    };
+  }
+
+  return {"nodes": nodes, "links": links};
+}
@@ -0,0 +1,56 @@
+// Loads the parts of a page which aren't needed until they're shown, e.g. the hidden tabs.
+// Each placeholder has a data-fragment-url pointing to a VisualizeFragment (see views.py),
+// and optionally a data-fragment-callback: the name of a function called with the fragment.
+
+const fragmentPromises = {};
+var numFragmentsLoading = 0;  // Read by the integration tests
+
+function loadFragment(url) {
+  // Each fragment is fetched once, however many times it's asked for
+  if (!(url in fragmentPromises)) {
+    numFragmentsLoading++;
+    fragmentPromises[url] = fetch(url, {credentials: 'same-origin'})
+      .then(response => {
+        if (!response.ok) {
+          throw new Error('Could not load ' + url + ': ' + response.status);
+        }
+        return response.json();
+      })
+      .catch(error => {
+        // Try again next time it's needed
+        delete fragmentPromises[url];
+        throw error;
+      })
+      .finally(() => numFragmentsLoading--);
+  }
+  return fragmentPromises[url];
+}
+
+function runFragmentScript(js) {
+  // Runs the script in the global scope, like an inline <script> would
+  const script = document.createElement('script');
+  script.text = js;
+  document.head.appendChild(script).remove();
+}
+
+function loadFragmentsIn(element) {
+  // Fills in every placeholder in the element. Returns a promise, resolved once they're done.
+  const placeholders = element.querySelectorAll('[data-fragment-url]:not([data-fragment-loaded])');
+  return Promise.all(Array.from(placeholders).map(placeholder => {
+    placeholder.dataset.fragmentLoaded = 'loading';
+    return loadFragment(placeholder.dataset.fragmentUrl)
+      .then(fragment => {
+        placeholder.innerHTML = fragment.html || '';
+        const callback = placeholder.dataset.fragmentCallback;
+        if (callback) {
+          window[callback](fragment);
+        }
+        placeholder.dataset.fragmentLoaded = 'loaded';
+      })
+      .catch(error => {
+        console.error(error);
+        placeholder.innerHTML = '<p class="text-muted text-center">Could not load this tab. Please try again.</p>';
+        delete placeholder.dataset.fragmentLoaded;
+      });
+  }));
+}
@@ -37,12 +37,17 @@ function goToTab(newTabName) {
   const canBeDynamic = newTabName == 'barchart' || newTabName == 'round-by-round';
   document.getElementById('toggle-dynamic').style.display = canBeDynamic ? 'block' : 'none';
 
-  animateIfNeeded(newTabName);
+  // Only the first tab is on the page: the others are fetched when they're first shown
+  loadFragmentsIn(document.getElementById('id-' + newTabName)).then(() => {
+    if (newTabName != currentTabName) return;  // Moved on while it was loading
 
-  // Sankey wants a special resize
-  if (newTabName == 'sankey') {
-    fitSankeyViewboxToContents();
-  }
+    animateIfNeeded(newTabName);
+
+    // Sankey wants a special resize
+    if (newTabName == 'sankey') {
+      fitSankeyViewboxToContents();
+    }
+  });
 }
 
 function loadTabFromTag() {
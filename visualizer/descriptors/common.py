@@ -48,14 +48,6 @@ def get_redistribution_data(graph, roundNum):
     """
     Returns a {names: list, sum: float} dictionary representing the surplus transfers this round.
     """
-    candidates = graph.summarize().candidates
-    redistributedNames = []
-    redistributedSum = 0
-    for item, candidateInfo in candidates.items():
-        if roundNum >= len(candidateInfo.votesAddedPerRound):
-            continue
-        votesAdded = candidateInfo.votesAddedPerRound[roundNum]
-        if votesAdded < 0:
-            redistributedNames.append(item.name)
-            redistributedSum -= votesAdded
+    redistributedItems, redistributedSum = graph.summarize().get_redistributions(roundNum)
+    redistributedNames = [item.name for item in redistributedItems]
     return {'names': redistributedNames, 'sum': redistributedSum}
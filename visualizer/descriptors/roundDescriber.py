@@ -61,20 +61,13 @@ class Describer:
     def _describe_most_nonwinner_votes_this_round(self, roundNum):
         """ e.g. "Foo received the most votes. "
             Returns empty string if there are any winners this round. """
-        candidates = self.graph.summarize().candidates
-        rounds = self.graph.summarize().rounds
+        summary = self.graph.summarize()
 
         # Don't return who has the most votes if there are winners
-        if rounds[roundNum].winnerNames:
+        if summary.rounds[roundNum].winnerNames:
             return ""
 
-        def _num_votes_this_round(item):
-            # Gets the number of votes for this item on this round
-            candidateInfo = candidates[item]
-            if roundNum >= len(candidateInfo.totalVotesPerRound):
-                return 0  # already eliminated
-            return candidateInfo.totalVotesPerRound[roundNum]
-        mostVotes = max(candidates, key=_num_votes_this_round)
+        mostVotes = summary.get_item_with_most_votes(roundNum)
 
         return mostVotes.name + " received the most votes. "
 
@@ -5,6 +5,7 @@
 
 import datetime
 
+from common import stageTiming
 from visualizer.graph import rcvResult
 from visualizer.graph.graphSummary import GraphSummary
 
@@ -12,6 +13,8 @@ from visualizer.graph.graphSummary import GraphSummary
 #pylint: disable=too-few-public-methods
 class LinkData:
     """ Data about a single "link": a transfer from the source to target """
+    # There can be tens of thousands of these: __slots__ saves the memory of a __dict__ each
+    __slots__ = ('source', 'target', 'value')
 
     def __init__(self, source, target, value):
         self.source = source
@@ -21,6 +24,8 @@ class LinkData:
 
 class NodeData:
     """ Data about a single "node": a candidate in a single round """
+    __slots__ = ('item', 'label', 'count', 'roundNum', 'isWinner', 'isEliminated')
+
     #pylint: disable=too-many-arguments
 
     def __init__(self, item, label, count, roundNum):
@@ -53,8 +58,12 @@ class Graph:
         self.dateString = ""
         self.threshold = None
 
+        # Which reader loaded the file: a graphCreator.ParsePath
+        self.parsePath = None
+
         # This must be set manually by calling set_elimination_order
         self.eliminationOrder = None
+        self.eliminationOrderIndices = None  # Map: Item to its index in eliminationOrder
 
         # Used while building the graph only
         self.nodesPerRound = []
@@ -77,13 +86,21 @@ class Graph:
     def summarize(self):
         """ Returns the graph summary - or creates it if it hasn't been requested yet """
         if self.summary is None:
-            self.summary = GraphSummary(self)
+            with stageTiming.stage('summary'):
+                self.summary = GraphSummary(self)
         return self.summary
 
     def get_items_for_names(self, listOfNames):
         """ Given a list of all names, returns the corresponding Item for each naem """
-        allItems = list(set(n.item for n in self.nodes))
-        return sorted(allItems, key=lambda item: -listOfNames.index(item.name))
+        nameIndices = {}
+        for i, name in enumerate(listOfNames):
+            nameIndices.setdefault(name, i)
+
+        allItems = set(n.item for n in self.nodes)
+        missingNames = [item.name for item in allItems if item.name not in nameIndices]
+        if missingNames:
+            raise ValueError(f"Names not in the list: {missingNames}")
+        return sorted(allItems, key=lambda item: -nameIndices[item.name])
 
     def set_elimination_order(self, orderedItems):
         """
@@ -92,7 +109,10 @@ class Graph:
         several errors here or elsewhere if you pass bad data.
         """
         self.eliminationOrder = orderedItems
-        self.nodes = sorted(self.nodes, key=lambda x: -orderedItems.index(x.item))
+        self.eliminationOrderIndices = {item: i for i, item in enumerate(orderedItems)}
+
+        # Sorted once here, so every visualizer can iterate self.nodes in this order
+        self.nodes = sorted(self.nodes, key=lambda x: -self.eliminationOrderIndices[x.item])
 
         # Reset summary: it's no longer accurate
         self.summary = None
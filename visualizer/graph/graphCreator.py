@@ -1,25 +1,87 @@
 """ Helper functions to load a graph from a file """
 
 import logging
-import json
+import re
+import time
 
 from rcvformats.schemas.universaltabulator import SchemaV0
 from rcvformats.conversions.automatic import AutomaticConverter
 from rcvformats.conversions.base import CouldNotConvertException
+from rcvformats.conversions.dominion import DominionConverter
+from rcvformats.conversions.electionbuddy import ElectionBuddyConverter
+from rcvformats.conversions.opavote import OpavoteConverter
 
+from common import stageTiming
+import visualizer.graph.jsonStream as jsonStream
 import visualizer.graph.readRCVRCJSON as rcvrcJson
 
 logger = logging.getLogger(__name__)
 
 
+# How much of the file to look at to guess its format
+SNIFF_SIZE = 4096
+
+
 class BadJSONError(Exception):
     """ An exception to be thrown if the JSON has errors """
 
 
-def convert_to_standardized_format(fileObject):
-    """ Loops through each of the three readers trying to find one that works on this file """
+class ParsePath():  # pylint: disable=too-few-public-methods
+    """ The reader used to parse a file, as guessed by sniff_format """
+    UNIVERSAL_TABULATOR = 'universal-tabulator'
+    DOMINION = 'dominion'
+    ELECTIONBUDDY = 'electionbuddy'
+    OPAVOTE = 'opavote'
+
+    # Sniffing was wrong: every converter was tried
+    AUTOMATIC = 'automatic'
+
+    # Read from the stored canonical JSON: no conversion was needed
+    CANONICAL = 'canonical'
+
+
+CONVERTERS = {
+    ParsePath.DOMINION: DominionConverter,
+    ParsePath.ELECTIONBUDDY: ElectionBuddyConverter,
+    ParsePath.OPAVOTE: OpavoteConverter,
+    ParsePath.AUTOMATIC: AutomaticConverter,
+}
+
+
+def sniff_format(fileObject):
+    """
+    Guesses the format of the file from its first few KB, without parsing it,
+    and rewinds the file. Returns a ParsePath.
+    """
+    head = fileObject.read(SNIFF_SIZE)
+    fileObject.seek(0)
+    if isinstance(head, str):
+        head = head.encode('utf-8')
+
+    # xlsx files are zip files
+    if head.startswith(b'PK\x03\x04'):
+        return ParsePath.DOMINION
+
+    head = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if not head.startswith(b'{'):
+        return ParsePath.ELECTIONBUDDY
+
+    # Opavote files have "candidates" and "rounds", but neither "config" nor "results"
+    if re.search(rb'"(config|results)"\s*:', head):
+        return ParsePath.UNIVERSAL_TABULATOR
+    if re.search(rb'"(n_seats|candidates)"\s*:', head):
+        return ParsePath.OPAVOTE
+    return ParsePath.UNIVERSAL_TABULATOR
+
+
+@stageTiming.timed('convert')
+def convert_to_standardized_format(fileObject, parsePath=ParsePath.AUTOMATIC):
+    """
+    Converts the file with the converter for the given ParsePath. By default, loops
+    through each of the three readers trying to find one that works on this file.
+    """
     try:
-        return AutomaticConverter().convert_to_ut(fileObject)
+        return CONVERTERS[parsePath]().convert_to_ut(fileObject)
     except CouldNotConvertException as exc:
         logger.info("The file was not valid. Reason: %s", str(exc))
         raise BadJSONError(exc) from exc
@@ -68,25 +130,43 @@ def initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate):
     return graph
 
 
-def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
-    """ Load the given fileObject, create and return a graph """
+def _load_json_reader(fileObject, parsePath):
+    """
+    Loads the file with the reader for the given ParsePath, falling back to trying
+    every converter if that fails. Returns the raw data, the reader, and the ParsePath used.
+    """
     try:
-        # First, try to load it directly, assuming it is a valid format
-        # This circumvents jsonschema validation needlessly
-        jsonData = json.load(fileObject)
-        jsonReader = rcvrcJson.JSONReader(jsonData)
+        if parsePath == ParsePath.UNIVERSAL_TABULATOR:
+            # Load it directly: this circumvents jsonschema validation needlessly.
+            # The file is streamed, so large files are never entirely in memory as text.
+            with stageTiming.stage('fileRead'):
+                jsonData = jsonStream.load(fileObject)
+        else:
+            with stageTiming.stage('convert'):
+                jsonData = CONVERTERS[parsePath]().convert_to_ut(fileObject)
+        return jsonData, rcvrcJson.JSONReader(jsonData), parsePath
     except Exception:  # pylint: disable=broad-except
-        # If the loading failed, then attempt to convert it
+        # If that failed, then attempt every converter
         fileObject.seek(0)
 
-        # First, try to convert
-        jsonData = convert_to_standardized_format(fileObject)
+    # First, try to convert
+    jsonData = convert_to_standardized_format(fileObject)
 
-        # Then, try to load
-        try:
-            jsonReader = rcvrcJson.JSONReader(jsonData)
-        except Exception as exc:  # pylint: disable=broad-except
-            raise BadJSONError("File schema was valid, but we could not interpret it") from exc
+    # Then, try to load
+    try:
+        jsonReader = rcvrcJson.JSONReader(jsonData)
+    except Exception as exc:  # pylint: disable=broad-except
+        raise BadJSONError("File schema was valid, but we could not interpret it") from exc
+    return jsonData, jsonReader, ParsePath.AUTOMATIC
+
+
+def make_graph_and_canonical_data(fileObject, excludeFinalWinnerAndEliminatedCandidate):
+    """
+    Like make_graph_with_file, but also returns the file's data after it was converted
+    and migrated, which make_graph_with_canonical_data reads without any more work.
+    """
+    startTime = time.perf_counter()
+    jsonData, jsonReader, parsePath = _load_json_reader(fileObject, sniff_format(fileObject))
 
     try:
         graph = initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate)
@@ -99,4 +179,24 @@ def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
         # We don't know why the data was invalid
         raise exc
 
+    graph.parsePath = parsePath
+    logger.debug("Parsed file as %s in %.3fs", parsePath, time.perf_counter() - startTime)
+    return graph, jsonReader.get_migrated_data()
+
+
+def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
+    """
+    Load the given fileObject, create and return a graph.
+    The reader which was used is stored in graph.parsePath.
+    """
+    graph, _ = make_graph_and_canonical_data(fileObject,
+                                             excludeFinalWinnerAndEliminatedCandidate)
+    return graph
+
+
+def make_graph_with_canonical_data(jsonData, excludeFinalWinnerAndEliminatedCandidate):
+    """ Creates a graph from the data returned by make_graph_and_canonical_data """
+    jsonReader = rcvrcJson.JSONReader(jsonData, isMigrated=True)
+    graph = initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate)
+    graph.parsePath = ParsePath.CANONICAL
     return graph
@@ -1,9 +1,9 @@
 """ Summarize the graph to provide helper functions to different visualizers """
 
-from visualizer.graph import rcvResult
+import numpy as np
 
 
-#pylint: disable=too-few-public-methods
+#pylint: disable=too-few-public-methods,too-many-instance-attributes
 class GraphSummary:
     """ A class which organizes a Graph into data that makes it easier to visualize """
 
@@ -15,35 +15,64 @@ class GraphSummary:
     numWinners: int
     numEliminated: int
 
-    def __init__(self, graph):
+    # The vote tallies as (rounds x candidates) matrices. Column i is self.items[i].
+    # Once a candidate is eliminated, they are not present, and their tally is zero.
+    items: list
+    itemIndices: dict  # Map: Graph.Item to its column
+    tallies: np.ndarray
+    votesAdded: np.ndarray
+    isPresent: np.ndarray
+
+    def __init__(self, graph):  # pylint: disable=too-many-locals
         numRounds = len(graph.nodesPerRound)
 
         rounds = [RoundInfo(i) for i in range(numRounds)]
 
-        # Accumulate the votes gained by each candidate in each node (into candidates dict)
-        # and what happened in each round (into rounds list)
-        candidates = {}
+        # Fill in the tally matrix, and what happened in each round (into rounds list)
+        itemIndices = {}
+        for node in graph.nodes:
+            itemIndices.setdefault(node.item, len(itemIndices))
+        tallies = np.zeros((numRounds, len(itemIndices)))
+        isPresent = np.zeros((numRounds, len(itemIndices)), dtype=bool)
+
         alreadyWonInPreviousRound = []
+        alreadyWonSet = set()  # for fast lookups
         for node in graph.nodes:
             item = node.item
-            if item not in candidates:
-                candidates[item] = CandidateInfo(item.name)
-
-            currRound = len(candidates[item].votesAddedPerRound)
-            candidates[item].add_votes(node.count)
-            rounds[currRound].add_votes(item, node.count)
+            currRound = node.roundNum
+            tallies[currRound, itemIndices[item]] = node.count
+            isPresent[currRound, itemIndices[item]] = True
 
             if node.isWinner:
                 # Only count winner the first time they win
-                if item not in alreadyWonInPreviousRound:
+                if item not in alreadyWonSet:
                     rounds[currRound].add_winner(item.name)
                     alreadyWonInPreviousRound.append(item)
+                    alreadyWonSet.add(item)
             if node.isEliminated:
                 # Eliminate the next round: in the sankey representation,
                 # eliminated candidates are shown on the previous round
                 # so they don't ever show zero-vote bars. Account for that.
                 rounds[currRound + 1].add_eliminated(item.name)
 
+        # Each round's change in votes: the first round is all "added"
+        votesAdded = np.diff(tallies, axis=0, prepend=0) * isPresent
+
+        # Inactive ballots are not counted as active votes
+        isActive = np.array([item.isActive for item in itemIndices], dtype=bool)
+        totalActiveVotes = tallies[:, isActive].sum(axis=1).tolist()
+        for roundInfo, total in zip(rounds, totalActiveVotes):
+            roundInfo.totalActiveVotes = total
+
+        # Per-candidate views of the matrices, only for the rounds they are present in
+        numRoundsPerItem = isPresent.sum(axis=0).tolist()
+        candidates = {}
+        for item, i in itemIndices.items():
+            numRoundsForItem = numRoundsPerItem[i]
+            candidates[item] = CandidateInfo(item.name,
+                                             tallies[:numRoundsForItem, i].tolist(),
+                                             votesAdded[:numRoundsForItem, i].tolist())
+
         # Create linksByNode
         linksByTargetNode = {}
         for link in graph.links:
@@ -51,6 +80,14 @@ class GraphSummary:
                 linksByTargetNode[link.target] = []
             linksByTargetNode[link.target].append(link)
 
+        self.graph = graph
+        self.items = list(itemIndices)
+        self.itemIndices = itemIndices
+        self.tallies = tallies
+        self.votesAdded = votesAdded
+        self.isPresent = isPresent
+        self._transfers = None
+
         self.rounds = rounds
         self.candidates = candidates
         self.linksByTargetNode = linksByTargetNode
@@ -58,6 +95,34 @@ class GraphSummary:
         self.numWinners = len(self.winnerNames)
         self.numEliminated = sum([len(r.eliminatedNames) for r in rounds])
 
+    @property
+    def transfers(self):
+        """
+        The votes transferred between candidates as a (rounds x source x target) tensor,
+        with candidates indexed as in self.items. Created on first use: it can be large.
+        """
+        if self._transfers is None:
+            numItems = len(self.items)
+            transfers = np.zeros((len(self.graph.transfersPerRound), numItems, numItems))
+            for round_i, transfersThisRound in enumerate(self.graph.transfersPerRound):
+                for transfer in transfersThisRound:
+                    source = self.itemIndices[transfer.item]
+                    for targetItem, count in transfer.transfersByItem.items():
+                        transfers[round_i, source, self.itemIndices[targetItem]] = count
+            self._transfers = transfers
+        return self._transfers
+
+    def get_redistributions(self, roundNum):
+        """ Returns the items which lost votes in the given round, and the votes they lost """
+        votesLost = -self.votesAdded[roundNum]
+        isRedistributing = votesLost > 0
+        redistributed = [self.items[i] for i in np.flatnonzero(isRedistributing)]
+        return redistributed, float(votesLost[isRedistributing].sum())
+
+    def get_item_with_most_votes(self, roundNum):
+        """ Returns the item with the most votes in the given round (the first, if tied) """
+        return self.items[int(np.argmax(self.tallies[roundNum]))]
+
 
 class RoundInfo:
     """ Summarizes a single round, with functions to build the round """
@@ -80,32 +145,12 @@ class RoundInfo:
         """ Adds the name to the list of names elected this round """
         self.winnerNames.append(name)
 
-    def add_votes(self, candidateItem, numVotes):
-        """ Notes that the given Candidate received numVotes votes - unless they're
-            not an "active" candidate. """
-        assert isinstance(candidateItem, rcvResult.Item)
-        if not candidateItem.isActive:
-            return
-
-        self.totalActiveVotes += numVotes
-
 
 class CandidateInfo:
-    """ Summarizes a single candidate over each round """
+    """ Summarizes a single candidate over each round they are present in """
 
-    def __init__(self, name):
+    def __init__(self, name, totalVotesPerRound, votesAddedPerRound):
         self.name = name
-        self.votesAddedPerRound = []
-        self.totalVotesPerRound = []
-        self.numRounds = 0
-
-    def add_votes(self, amount):
-        """ Adds the given votes to the current round """
-        if len(self.totalVotesPerRound) == 0:
-            lastRoundTotalVotes = 0
-        else:
-            lastRoundTotalVotes = self.totalVotesPerRound[-1]
-        lastRoundAddedVotes = amount - lastRoundTotalVotes
-        self.totalVotesPerRound.append(amount)
-        self.votesAddedPerRound.append(lastRoundAddedVotes)
-        self.numRounds += 1
+        self.totalVotesPerRound = totalVotesPerRound
+        self.votesAddedPerRound = votesAddedPerRound
+        self.numRounds = len(totalVotesPerRound)
@@ -0,0 +1,127 @@
+"""
+Incrementally parses a JSON file, reading the results of a universal tabulator file
+one round at a time. Only a small buffer of the file's text is in memory at once,
+rather than the entire file plus its parsed contents, and a file that is not JSON
+(e.g. a spreadsheet to be converted) fails after reading a single chunk.
+"""
+
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class JSONStream():
+    """ A buffer over a file, which reads more of the file as values are decoded """
+
+    def __init__(self, fileObject):
+        self.fileObject = fileObject
+        self.textDecoder = None
+        self.buffer = ''
+        self.pos = 0
+        self.isExhausted = False
+
+    def _read_more(self, size):
+        """ Drops everything before pos from the buffer, then appends a chunk of the file """
+        chunk = self.fileObject.read(size)
+        self.isExhausted = not chunk
+        if isinstance(chunk, bytes):
+            # Files opened in binary mode, e.g. uploads. Tolerate a byte order mark.
+            if self.textDecoder is None:
+                self.textDecoder = codecs.getincrementaldecoder('utf-8-sig')()
+            chunk = self.textDecoder.decode(chunk, final=self.isExhausted)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def make_error(self, message):
+        """ An error at the current position """
+        return json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def peek(self):
+        """ Skips whitespace and returns the next character, or '' at the end of the file """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.isExhausted:
+                break
+            self._read_more(CHUNK_SIZE)
+
+        if self.pos == len(self.buffer):
+            return ''
+        return self.buffer[self.pos]
+
+    def expect(self, characters):
+        """ Consumes the next character, which must be one of the given characters """
+        character = self.peek()
+        if not character or character not in characters:
+            raise self.make_error(f'Expecting one of {characters!r}')
+        self.pos += 1
+        return character
+
+    def decode_value(self):
+        """ Decodes the next complete JSON value, reading as much of the file as needed """
+        self.peek()
+        readSize = CHUNK_SIZE
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                isComplete = end < len(self.buffer) or self.isExhausted
+            except json.JSONDecodeError:
+                if self.isExhausted:
+                    raise
+                isComplete = False
+
+            if isComplete:
+                self.pos = end
+                return value
+
+            # Read larger chunks each time so a huge value is read in linear time
+            self._read_more(readSize)
+            readSize *= 2
+
+    def iterate_array(self):
+        """ Yields each element of the JSON array which comes next, one at a time """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield self.decode_value()
+            if self.expect(',]') == ']':
+                return
+
+
+def load(fileObject):
+    """
+    Parses the JSON object in the file. Equivalent to json.load, but reads the 'results'
+    array one element at a time. Raises json.JSONDecodeError if the file is not a JSON object.
+    """
+    stream = JSONStream(fileObject)
+    data = {}
+
+    stream.expect('{')
+    if stream.peek() == '}':
+        stream.pos += 1
+    else:
+        while True:
+            key = stream.decode_value()
+            if not isinstance(key, str):
+                raise stream.make_error('Expecting property name')
+            stream.expect(':')
+
+            if key == 'results' and stream.peek() == '[':
+                data[key] = list(stream.iterate_array())
+            else:
+                data[key] = stream.decode_value()
+
+            if stream.expect(',}') == '}':
+                break
+
+    if stream.peek():
+        raise stream.make_error('Extra data')
+    return data
@@ -6,6 +6,7 @@ from visualizer import common
 #pylint: disable=too-few-public-methods
 class Item:
     """ A single Item, also known as a Candidate elsewhere in the Code. """
+    __slots__ = ('name', 'isActive')
 
     def __init__(self, name):
         self.name = name
@@ -18,6 +19,7 @@ class Item:
 
 class Transfer:
     """ Transfers is a mapping from Item objects to a number of transferred votes. """
+    __slots__ = ('item', 'transfersByItem')
 
     def __init__(self, item, transfersByItem):
         self.item = item
@@ -28,18 +30,21 @@ class Transfer:
 
 class Elimination(Transfer):
     """ Syntactic sugar for an Elimination, which is kind of like a transfer """
+    __slots__ = ()
 
 #pylint: disable=too-few-public-methods
 
 
 class WinTransfer(Transfer):
     """ Syntactic sugar for a Win, which is kind of like a transfer """
+    __slots__ = ()
 
 #pylint: disable=too-few-public-methods
 
 
 class Round:
     """ A single Round, with data about who won and where votes were transferred """
+    __slots__ = ('winners', 'transfers', 'itemsToVotes')
 
     def __init__(self):
         self.winners = []
@@ -1,62 +1,74 @@
 """ Class which reads an RCVRC-formatted JSON file """
-import abc
 import datetime
 
+from common import stageTiming
 from visualizer import common
 from . import rcvResult
 from .graph import Graph
 
 
+def is_rankit_data(jsonData):
+    """ Is the jsonData from RankIt? """
+    if 'jurisdiction' not in jsonData['config']:
+        return False
+    return jsonData['config']['jurisdiction'] == 'RankIt Export'
+
+
 class JSONMigrateTask():
-    """ An abstract base class to "fix" JSONs. Each migration "task" should override this."""
+    """
+    An abstract base class to "fix" JSONs. Each migration "task" should override one or more
+    of the visit_* functions and finish(), which are called by JSONMigrator.
+    """
+    isRankitOnly = False  # If set, the task is skipped unless the data is from RankIt
 
     def __init__(self, jsonData):
         self.data = jsonData
+        self.numRounds = len(jsonData['results'])
 
-    def _enumerate_tally_results(self):
-        results = self.data['results']
-        for result in results:
-            for tallyResult in result['tallyResults']:
-                yield tallyResult
+    def visit_tally_result(self, round_i, tallyResult):
+        """ Called on each tallyResult of each round, in order """
 
-    def is_rankit_data(self):
-        """ Is the jsonData from RankIt? """
-        if 'jurisdiction' not in self.data['config']:
-            return False
-        return self.data['config']['jurisdiction'] == 'RankIt Export'
+    def visit_round(self, round_i, result):
+        """ Called on each round, after each of its tallyResults has been visited """
 
-    def rename(self, fromStr, toStr):
-        """ A helper function to rename a candidate s/fromStr/toStr throughout the JSON """
-        results = self.data['results']
-        for result in results:
-            if fromStr in result['tally']:
-                result['tally'][toStr] = result['tally'][fromStr]
-                del result['tally'][fromStr]
+    def finish(self):
+        """ Called once every round has been visited """
 
-            for tallyResult in result['tallyResults']:
-                if fromStr in tallyResult['transfers']:
-                    tallyResult['transfers'][toStr] = tallyResult['transfers'][fromStr]
-                    del tallyResult['transfers'][fromStr]
 
-    @abc.abstractmethod
-    def do(self):
-        """ Run the migration. Put your subclass' logic here. """
+class RenameTask(JSONMigrateTask):
+    """ A base class to rename a candidate s/fromStr/toStr throughout the JSON """
+    fromStr: str
+    toStr: str
+
+    @staticmethod
+    def _rename_key(dictionary, fromStr, toStr):
+        if fromStr in dictionary:
+            dictionary[toStr] = dictionary[fromStr]
+            del dictionary[fromStr]
+
+    def visit_tally_result(self, round_i, tallyResult):
+        self._rename_key(tallyResult['transfers'], self.fromStr, self.toStr)
+
+    def finish(self):
+        # Tallies are renamed last: other tasks look for the original names in them
+        for result in self.data['results']:
+            self._rename_key(result['tally'], self.fromStr, self.toStr)
 
 
 class FixUndeclaredUWITask(JSONMigrateTask):
     """ Undeclared votes are sometimes marked as 'UWI' instead of 'Undeclared' """
 
-    def do(self):
-        """ Run the migration """
-        results = self.data['results']
+    def visit_round(self, round_i, result):
+        """ Only the first round needs fixing """
+        if round_i != 0:
+            return
 
         firstEliminated = []
-        firstTally = results[0]['tallyResults']
-        for tallyResult in firstTally:
+        for tallyResult in result['tallyResults']:
             if 'eliminated' in tallyResult:
                 firstEliminated.append(tallyResult['eliminated'])
 
-        firstTally = results[0]['tally']
+        firstTally = result['tally']
         if 'UWI' in firstTally and \
                 'Undeclared' not in firstTally and \
                 'Undeclared' in firstEliminated:
@@ -67,137 +79,142 @@ class FixUndeclaredUWITask(JSONMigrateTask):
 class FixNoTransfersTask(JSONMigrateTask):
     """ The JSON prefers no key named "transfers" instead of an empty list. We do not. """
 
-    def do(self):
-        """ Run the migration """
-        for tallyResult in self._enumerate_tally_results():
-            if 'transfers' not in tallyResult:
-                tallyResult['transfers'] = {}
+    def visit_tally_result(self, round_i, tallyResult):
+        if 'transfers' not in tallyResult:
+            tallyResult['transfers'] = {}
 
 
 class FixIgnoreResidualSurplus(JSONMigrateTask):
     """ Creates a "residual surplus" candidate in the first round if we find it in other rounds,
         since we look to the first round for all candidates (or places votes can be transferred) """
 
-    def do(self):
-        """ Run the migration """
-        for tallyResult in self._enumerate_tally_results():
-            if 'residual surplus' in tallyResult['transfers']:
-                self.data['results'][0]['tally']['residual surplus'] = 0
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        self.isFound = False
+
+    def visit_tally_result(self, round_i, tallyResult):
+        if 'residual surplus' in tallyResult['transfers']:
+            self.isFound = True
+
+    def finish(self):
+        if self.isFound:
+            self.data['results'][0]['tally']['residual surplus'] = 0
 
 
 class MakeTalliesANumber(JSONMigrateTask):
     """ Converts tally strings to numbers """
 
-    def do(self):
-        """ Run the migration """
-        results = self.data['results']
-        for result in results:
-            tally = result['tally']
-            for name in tally:
-                tally[name] = float(tally[name])
+    def visit_tally_result(self, round_i, tallyResult):
+        xfers = tallyResult['transfers']
+        for name in xfers:
+            xfers[name] = float(xfers[name])
 
-        for tallyResult in self._enumerate_tally_results():
-            xfers = tallyResult['transfers']
-            for name in xfers:
-                xfers[name] = float(xfers[name])
+    def visit_round(self, round_i, result):
+        tally = result['tally']
+        for name in tally:
+            tally[name] = float(tally[name])
 
 
 class HideDecimalsTask(JSONMigrateTask):
     """ If the config desired it - remove all decimal places """
 
-    def do(self):
-        """ Run the migration """
-        results = self.data['results']
-        for result in results:
-            tally = result['tally']
-            for name in tally:
-                tally[name] = round(tally[name])
+    def visit_tally_result(self, round_i, tallyResult):
+        xfers = tallyResult['transfers']
+        for name in xfers:
+            xfers[name] = round(xfers[name])
 
-        for tallyResult in self._enumerate_tally_results():
-            xfers = tallyResult['transfers']
-            for name in xfers:
-                xfers[name] = round(xfers[name])
+    def visit_round(self, round_i, result):
+        tally = result['tally']
+        for name in tally:
+            tally[name] = round(tally[name])
 
 
 class MakeExhaustedAndSurplusACandidate(JSONMigrateTask):
     """ If there are "exhausted" ballots, make them a first-class citizen candidate """
 
+    searchTexts = (common.INACTIVE_TEXT, common.RESIDUAL_SURPLUS_TEXT)
+
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        self.isInTransfers = {searchText: False for searchText in self.searchTexts}
+        # The votes transferred to each searchText in each round, in order
+        self.transfersPerRound = {searchText: [[] for _ in range(self.numRounds)]
+                                  for searchText in self.searchTexts}
+
+    def _note_transfers(self, round_i, tallyResult):
+        for searchText in self.searchTexts:
+            if searchText in tallyResult['transfers']:
+                self.isInTransfers[searchText] = True
+                self.transfersPerRound[searchText][round_i].append(
+                    tallyResult['transfers'][searchText])
+
+    def visit_tally_result(self, round_i, tallyResult):
+        # The last round may still lose some tallyResults (see FixRankitNoElimOnLastRound).
+        # Its transfers never add to a tally, so only check whether they exist, in finish().
+        if round_i != self.numRounds - 1:
+            self._note_transfers(round_i, tallyResult)
+
     def _make_it_a_candidate(self, searchText):
         """ Call this if exhausted was found. """
         numExhausted = 0
-        results = self.data['results']
-        for result in results:
+        for result, transfersThisRound in zip(self.data['results'],
+                                              self.transfersPerRound[searchText]):
             result['tally'][searchText] = numExhausted
-            for tallyResult in result['tallyResults']:
-                if searchText in tallyResult['transfers']:
-                    numExhausted += tallyResult['transfers'][searchText]
+            for numTransferred in transfersThisRound:
+                numExhausted += numTransferred
 
-    def _make_it_a_candidate_if_in_transfers(self, searchText):
-        """ Looks for searchText in transfers. If it exists, makes it a candidate. """
-        for tallyResult in self._enumerate_tally_results():
-            if searchText in tallyResult['transfers']:
-                self._make_it_a_candidate(searchText)
-                return
-
-    def do(self):
+    def finish(self):
         """ Run the migration, ensuring they are not already marked as candidates """
+        for tallyResult in self.data['results'][-1]['tallyResults']:
+            self._note_transfers(self.numRounds - 1, tallyResult)
+
         if common.INACTIVE_TEXT not in self.data['results'][0]['tally']:
-            self._make_it_a_candidate_if_in_transfers(common.INACTIVE_TEXT)
+            if self.isInTransfers[common.INACTIVE_TEXT]:
+                self._make_it_a_candidate(common.INACTIVE_TEXT)
         if common.RESIDUAL_SURPLUS_TEXT not in self.data['results'][0]:
-            self._make_it_a_candidate_if_in_transfers(common.RESIDUAL_SURPLUS_TEXT)
+            if self.isInTransfers[common.RESIDUAL_SURPLUS_TEXT]:
+                self._make_it_a_candidate(common.RESIDUAL_SURPLUS_TEXT)
 
 
-class RenameCapitalizeResidualSurplus(JSONMigrateTask):
+class RenameCapitalizeResidualSurplus(RenameTask):
     """ s/residual surplus/Residual Surplus """
-
-    def do(self):
-        """ Run the migration """
-        self.rename('residual surplus', common.RESIDUAL_SURPLUS_TEXT)
+    fromStr = 'residual surplus'
+    toStr = common.RESIDUAL_SURPLUS_TEXT
 
 
-class RenameExhaustedToInactive(JSONMigrateTask):
+class RenameExhaustedToInactive(RenameTask):
     """ s/exhausted/Inactive Ballots """
-
-    def do(self):
-        """ Run the migration """
-        self.rename('exhausted', common.INACTIVE_TEXT)
+    fromStr = 'exhausted'
+    toStr = common.INACTIVE_TEXT
 
 
 class FixRankitMissingTransfers(JSONMigrateTask):
     """ Rankit often forgets to eliminate candidates, they just drop them """
+    isRankitOnly = True
 
-    def _get_eliminations(self, round_i):
-        eliminatedNames = set()
-        for result in self.data['results'][round_i]['tallyResults']:
-            if 'eliminated' in result:
-                eliminatedNames.add(result['eliminated'])
-        return eliminatedNames
-
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
+    def visit_round(self, round_i, result):
+        """ Compares this round to the previous one, and fixes the previous one """
+        if round_i == 0:
             return
 
-        results = self.data['results']
-        for round_i in range(1, len(results)):
-            prevRound = results[round_i - 1]['tally']
-            thisRound = results[round_i]['tally']
-            eliminations = self._get_eliminations(round_i - 1)
+        prevResult = self.data['results'][round_i - 1]
+        eliminations = set()
+        for tallyResult in prevResult['tallyResults']:
+            if 'eliminated' in tallyResult:
+                eliminations.add(tallyResult['eliminated'])
 
-            for name in prevRound:
-                if name not in thisRound and name not in eliminations:
-                    newElimination = {'eliminated': name, 'transfers': {}}
-                    results[round_i - 1]['tallyResults'].append(newElimination)
+        thisRound = result['tally']
+        for name in prevResult['tally']:
+            if name not in thisRound and name not in eliminations:
+                newElimination = {'eliminated': name, 'transfers': {}}
+                prevResult['tallyResults'].append(newElimination)
 
 
 class FixRankitNoElimOnLastRound(JSONMigrateTask):
     """ Rankit incorrectly eliminates on the last round """
+    isRankitOnly = True
 
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
-            return
-
+    def finish(self):
         results = self.data['results']
         lastRoundTally = results[-1]['tallyResults']
         lastRoundTally = [r for r in lastRoundTally if 'eliminated' not in r]
@@ -206,43 +223,85 @@ class FixRankitNoElimOnLastRound(JSONMigrateTask):
 
 class FixRankitCombinedTallyResults(JSONMigrateTask):
     """ Rankit includes eliminations and elected on the same tallyResult """
+    isRankitOnly = True
 
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
-            return
+    @staticmethod
+    def _split_tally_results(result):
+        toAppendAtEnd = []
+        for tallyResult in result['tallyResults']:
+            if 'elected' not in tallyResult or 'eliminated' not in tallyResult:
+                continue
+            toSplit = tallyResult['elected']
+            del tallyResult['elected']
+            toAppendAtEnd.append({'elected': toSplit, 'transfers': {}})
+        result['tallyResults'].extend(toAppendAtEnd)
 
-        results = self.data['results']
-        for result in results:
-            toAppendAtEnd = []
-            for tallyResult in result['tallyResults']:
-                if 'elected' not in tallyResult or 'eliminated' not in tallyResult:
-                    continue
-                toSplit = tallyResult['elected']
-                del tallyResult['elected']
-                toAppendAtEnd.append({'elected': toSplit, 'transfers': {}})
-            result['tallyResults'].extend(toAppendAtEnd)
+    def visit_round(self, round_i, result):
+        """ Fixes the previous round, once FixRankitMissingTransfers is done with it """
+        if round_i > 0:
+            self._split_tally_results(self.data['results'][round_i - 1])
+
+    def finish(self):
+        self._split_tally_results(self.data['results'][-1])
 
 
 class FixRankitMissingWinners(JSONMigrateTask):
     """ Rankit stops including Winner in tally after they win """
+    isRankitOnly = True
 
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
-            return
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        self.winnerNamesToLastNumVotes = {}
 
-        winnerNamesToLastNumVotes = {}
-        for result in self.data['results']:
+    def visit_round(self, round_i, result):
+        for tallyResult in result['tallyResults']:
+            if 'elected' not in tallyResult:
+                continue
+            name = tallyResult['elected']
+            self.winnerNamesToLastNumVotes[name] = result['tally'][name]
+
+        for name in self.winnerNamesToLastNumVotes:
+            if name not in result['tally']:
+                result['tally'][name] = self.winnerNamesToLastNumVotes[name]
+
+
+class JSONMigrator():  # pylint: disable=too-few-public-methods
+    """
+    Applies a list of migration tasks in a single pass over the results. For each round,
+    each task visits each of its tallyResults, then the round itself; then each task
+    finishes, in order. A task must only rely on the tasks listed before it having
+    visited the same tallyResult or round.
+    """
+
+    def __init__(self, jsonData, taskClasses):
+        self.data = jsonData
+
+        # Check this once, rather than once per task
+        isRankit = is_rankit_data(jsonData)
+        self.tasks = [taskClass(jsonData) for taskClass in taskClasses
+                      if isRankit or not taskClass.isRankitOnly]
+
+    def _get_overridden(self, functionName):
+        """ The tasks' implementations of the given function, skipping the no-op default """
+        default = getattr(JSONMigrateTask, functionName)
+        return [getattr(task, functionName) for task in self.tasks
+                if getattr(type(task), functionName) is not default]
+
+    @stageTiming.timed('migrate')
+    def migrate(self):
+        """ Runs each task, modifying the data in-place """
+        tallyResultVisitors = self._get_overridden('visit_tally_result')
+        roundVisitors = self._get_overridden('visit_round')
+
+        for round_i, result in enumerate(self.data['results']):
             for tallyResult in result['tallyResults']:
-                if 'elected' not in tallyResult:
-                    continue
-                name = tallyResult['elected']
-                winnerNamesToLastNumVotes[name] = result['tally'][name]
+                for visit in tallyResultVisitors:
+                    visit(round_i, tallyResult)
+            for visit in roundVisitors:
+                visit(round_i, result)
 
-            for name in winnerNamesToLastNumVotes:
-                if name not in result['tally']:
-                    result['tally'][name] = winnerNamesToLastNumVotes[name]
+        for task in self.tasks:
+            task.finish()
 
 
 class JSONReader:
@@ -257,14 +316,19 @@ class JSONReader:
     rounds: list
     items: list
     eliminationOrder: list
-
-    def __init__(self, data):
-        self.parse_data(data)
-        self.graph.create_graph_from_rounds(self.rounds)
-        self.set_elimination_order(self.rounds, self.graph.items)
-
-    def parse_data(self, data):
-        """ Parses the JSON data, or raises an exception on failure """
+    migratedData: dict
+
+    def __init__(self, data, isMigrated=False):
+        self.parse_data(data, isMigrated)
+        with stageTiming.stage('graph'):
+            self.graph.create_graph_from_rounds(self.rounds)
+            self.set_elimination_order(self.rounds, self.graph.items)
+
+    def parse_data(self, data, isMigrated=False):
+        """
+        Parses the JSON data, or raises an exception on failure.
+        Pass isMigrated if the data is from get_migrated_data, to skip the migrations.
+        """
         def get_migration_tasks():
             return [FixNoTransfersTask,
                     FixUndeclaredUWITask,
@@ -341,15 +405,21 @@ class JSONReader:
 
         # Apply migrations and configuration adjustments
         self.tasks = get_migration_tasks()
-        for task in self.tasks:
-            task(data).do()
+        if not isMigrated:
+            JSONMigrator(data, self.tasks).migrate()
 
-        graph = load_graph(data)
-        items = initialize_items(data)
-        rounds = load_rounds(data)
+        with stageTiming.stage('graph'):
+            graph = load_graph(data)
+            items = initialize_items(data)
+            rounds = load_rounds(data)
 
         self.graph = graph
         self.rounds = rounds
+        self.migratedData = data
+
+    def get_migrated_data(self):
+        """ Returns the JSON data after the migrations were applied """
+        return self.migratedData
 
     def get_graph(self):
         """ Returns the Graph object """
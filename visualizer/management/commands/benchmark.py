@@ -0,0 +1,75 @@
+"""
+Managament script to benchmark each stage of the rendering pipeline (see common.benchmark).
+Save a baseline before a change, then compare against it after:
+
+    python manage.py benchmark --save baseline.json
+    python manage.py benchmark --compare baseline.json
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from common import benchmark
+
+
+def parse_election_size(value):
+    """ CANDIDATES,ROUNDS,WINNERS """
+    try:
+        numCandidates, numRounds, numWinners = (int(part) for part in value.split(','))
+    except ValueError as exc:
+        raise CommandError(f"Election sizes are CANDIDATES,ROUNDS,WINNERS, not {value}") from exc
+    return numCandidates, numRounds, numWinners
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Times each stage of the rendering pipeline, and compares them to a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=benchmark.DEFAULT_CORPUS,
+                            help='A glob of the files to benchmark')
+        parser.add_argument('--election', action='append', type=parse_election_size,
+                            dest='electionSizes', metavar='CANDIDATES,ROUNDS,WINNERS',
+                            help='A synthetic election to benchmark. Can be repeated.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='How many times to time each stage: the fastest is kept')
+        parser.add_argument('--save', help='Save the results as a baseline to this file')
+        parser.add_argument('--compare', help='Fail if slower than the baseline in this file')
+        parser.add_argument('--threshold', type=float, default=benchmark.DEFAULT_THRESHOLD,
+                            help='How much slower than the baseline is a regression, e.g. 0.25')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        electionSizes = options['electionSizes']
+        if electionSizes is None:
+            electionSizes = benchmark.DEFAULT_ELECTION_SIZES
+
+        def on_result(name, timings, error):
+            if error is not None:
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"{name}: skipped, it isn't a valid election")
+                return
+            if options['verbosity'] >= 1:
+                self.stdout.write(f"{name}: {sum(timings.values()) * 1000:.1f}ms")
+            if options['verbosity'] >= 2:
+                for stageName, seconds in timings.items():
+                    self.stdout.write(f"    {stageName}: {seconds * 1000:.2f}ms")
+
+        inputs = benchmark.get_inputs(options['corpus'], electionSizes)
+        results = benchmark.run(inputs, options['repeat'], on_result)
+
+        if options['save']:
+            benchmark.save_baseline(results, options['save'])
+            self.stdout.write(self.style.SUCCESS(f"Saved the baseline to {options['save']}"))
+
+        if options['compare']:
+            baseline = benchmark.load_baseline(options['compare'])
+            regressions = benchmark.find_regressions(results, baseline, options['threshold'])
+            for inputName, stageName, baselineSeconds, seconds in regressions:
+                self.stderr.write(f"{inputName} {stageName}: {baselineSeconds * 1000:.2f}ms "
+                                  f"-> {seconds * 1000:.2f}ms")
+            if regressions:
+                raise CommandError(f"{len(regressions)} stages are more than "
+                                   f"{options['threshold']:.0%} slower than the baseline")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -3,35 +3,42 @@ Managament script to ensure the last N uploads can still be loaded.
 If you need something more heavy-handed than the unit tests, check this
 against the production database.
 """
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
 
+from common import batchValidation
+from common.viewUtils import get_render_data
 from visualizer.models import JsonConfig
-from common.viewUtils import get_data_for_view
+
+
+def check_upload(jsonConfigId):
+    """ Raises if the config can't be loaded. Runs in a worker process. """
+    jsonConfig = JsonConfig.objects.get(id=jsonConfigId)  # pylint: disable=no-member
+    # Render it with the current code, rather than reading (and storing) its render bundle.
+    # Components are rendered lazily: render them all
+    get_render_data(jsonConfig).resolve_all()
 
 
 class Command(BaseCommand):
     """
     Runs the management script
     """
-    help = 'Closes the specified poll for voting'
+    help = 'Checks that the most recent uploads can still be loaded'
 
     def add_arguments(self, parser):
         parser.add_argument('start', type=int)  # Allow you to skip some if you've fixed em
         parser.add_argument('count', type=int)  # Max number to look at
+        batchValidation.add_arguments(parser)
 
     def handle(self, *args, **options):
         start = options['start']
         count = options['count']
         end = start + count
         allJsonConfigs = JsonConfig.objects.all().order_by('-id')  # pylint: disable=no-member
-        allJsonConfigs = allJsonConfigs[start:end]
-        for i, jsonConfig in enumerate(allJsonConfigs):
-            index = start + i
-            try:
-                get_data_for_view(jsonConfig)
-                self.stdout.write(self.style.SUCCESS(
-                    f"{index}: Successfully loaded {jsonConfig.slug}"))
-            except Exception as exc:  # pylint: disable=broad-except
-                raise CommandError(f'Could not load {jsonConfig.slug}: ' + str(exc)) from exc
+        allJsonConfigs = allJsonConfigs[start:end].values_list('slug', 'id')
+
+        indices = {slug: start + i for i, (slug, _) in enumerate(allJsonConfigs)}
+        batchValidation.run_in_command(
+            self, check_upload, list(allJsonConfigs), options,
+            lambda slug: f"{indices[slug]}: Successfully loaded {slug}")
 
         self.stdout.write(self.style.SUCCESS("Successfully loaded configs"))
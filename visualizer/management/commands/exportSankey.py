@@ -0,0 +1,55 @@
+"""
+Managament script to export sankey diagrams as standalone HTML pages or images,
+for offline reporting.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from visualizer.models import JsonConfig
+from visualizer.sankey.graphToPlotly import PlotlySankey
+from common.viewUtils import make_graph
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Exports the sankey diagram of each election to an HTML or PNG file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Elections to export')
+        parser.add_argument('--all', action='store_true', help='Export every election')
+        parser.add_argument('--format', choices=['html', 'png'], default='html')
+        parser.add_argument('--output-dir', default='.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            jsonConfigs = JsonConfig.objects.all().order_by('-id')
+        elif options['slugs']:
+            jsonConfigs = JsonConfig.objects.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(jsonConfigs.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"No such elections: {', '.join(sorted(missing))}")
+        else:
+            raise CommandError("Pass the slugs to export, or --all")
+
+        outputDir = options['output_dir']
+        fileFormat = options['format']
+        os.makedirs(outputDir, exist_ok=True)
+
+        # iterator(): don't hold every config in memory when exporting them all
+        for jsonConfig in jsonConfigs.iterator():
+            filename = os.path.join(outputDir, f'{jsonConfig.slug}.{fileFormat}')
+            try:
+                plotlySankey = PlotlySankey(make_graph(jsonConfig))
+                if fileFormat == 'html':
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        f.write(plotlySankey.to_html())
+                else:
+                    with open(filename, 'wb') as f:
+                        plotlySankey.write_image(f)
+            except Exception as exc:  # pylint: disable=broad-except
+                raise CommandError(f'Could not export {jsonConfig.slug}: ' + str(exc)) from exc
+
+            self.stdout.write(self.style.SUCCESS(f"Exported {filename}"))
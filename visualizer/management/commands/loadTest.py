@@ -0,0 +1,93 @@
+"""
+Managament script to load-test the visualize, embed and oEmbed endpoints (see common.loadTest).
+Only run it against a local database and file storage: it uploads and deletes elections.
+
+    python manage.py loadTest --mix embed-heavy --requests 1000 --concurrency 16
+"""
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common import loadTest
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Measures the latency and throughput of the visualizations under load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', choices=sorted(loadTest.MIXES), default='browse',
+                            help='Which requests to send')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='How many requests to send')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='How many requests to send at once')
+        parser.add_argument('--size', action='append', choices=sorted(loadTest.DEFAULT_SIZES),
+                            dest='sizeNames', help='An election size to test. Can be repeated.')
+        parser.add_argument('--url', help='Load-test the server at this URL instead of starting '
+                                          'one. It must use the same database and cache.')
+        parser.add_argument('--host', help='The Host header to send. Defaults to the first of '
+                                           'the ALLOWED_HOSTS.')
+        parser.add_argument('--report', help='Also save the report to this JSON file')
+        parser.add_argument('--keep', action='store_true',
+                            help="Don't delete the elections which were uploaded for the test")
+
+    @staticmethod
+    def _check_is_local():
+        if not settings.OFFLINE_MODE:
+            raise CommandError("Load tests upload files: only run them with OFFLINE_MODE=True")
+        if settings.CLOUDFLARE_AUTH_TOKEN:
+            raise CommandError("Updates would purge the Cloudflare cache: "
+                               "unset CLOUDFLARE_AUTH_TOKEN first")
+
+    def _write_report(self, report):
+        self.stdout.write(f"{'endpoint':<12}{'size':<8}{'requests':>9}{'errors':>8}{'req/s':>9}"
+                          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for row in report['rows']:
+            self.stdout.write(
+                f"{row['endpoint']:<12}{row['size']:<8}{row['numRequests']:>9}"
+                f"{row['numErrors']:>8}{row['requestsPerSecond']:>9}{row['p50Ms']:>9}"
+                f"{row['p90Ms']:>9}{row['p99Ms']:>9}{row['maxMs']:>9}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['numRequests']} requests in {report['seconds']}s: "
+            f"{report['requestsPerSecond']} requests per second"))
+
+    def _run(self, baseUrl, configs, options):
+        host = options['host'] or settings.ALLOWED_HOSTS[0].replace('*', 'localhost')
+        test = loadTest.LoadTest(baseUrl, host, configs, options['mix'],
+                                 options['requests'], options['concurrency'])
+        if options['mix'] not in loadTest.COLD_CACHE_MIXES:
+            test.warm_up()
+        return test.run()
+
+    def handle(self, *args, **options):
+        self._check_is_local()
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        sizes = {sizeName: loadTest.DEFAULT_SIZES[sizeName]
+                 for sizeName in options['sizeNames'] or loadTest.DEFAULT_SIZES}
+
+        # Elections left behind by an interrupted run would take the seeded slugs
+        loadTest.delete_seeded_elections()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                configs = loadTest.seed_elections(directory, sizes)
+
+            if options['url']:
+                report = self._run(options['url'].rstrip('/'), configs, options)
+            else:
+                with loadTest.LocalServer() as server:
+                    report = self._run(server.url, configs, options)
+        finally:
+            if not options['keep']:
+                loadTest.delete_seeded_elections()
+
+        self._write_report(report)
+        if options['report']:
+            loadTest.write_report(report, options['report'])
+        numErrors = sum(row['numErrors'] for row in report['rows'])
+        if numErrors:
+            raise CommandError(f"{numErrors} requests failed")
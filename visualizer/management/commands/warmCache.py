@@ -0,0 +1,167 @@
+"""
+Managament script to warm the caches, e.g. after a deploy or a cache.clear().
+Renders the elections which get the most traffic - the featured elections, the most recent
+uploads and optionally the most visited ones - into the render bundle store and the page cache,
+along with the wikicode of the featured elections.
+Pages can only be warmed into a cache shared with the web workers (see CACHES in settings.py):
+with a process-local cache, pass --bundles-only, as the bundles are stored in the database.
+"""
+import collections
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from common import pageCache, wikicodeCache
+from common.viewUtils import get_data_for_view
+from visualizer.models import HomepageFeaturedElection, JsonConfig
+from visualizer.views import FRAGMENTS, NUM_MOST_RECENT
+
+# The path of a request in a common (e.g. nginx) or a heroku router log line
+ACCESS_LOG_PATH_RE = re.compile(r'(?:"(?:GET|HEAD) |\bpath=")([^\s"?]+)')
+
+# Pages cached by these backends would only be cached in this command's own process
+PROCESS_LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def get_paths_to_warm(slug):
+    """ The pages of an election, and the fragments its visualize page fetches """
+    paths = [reverse('visualize', args=(slug,)),
+             reverse('visualizeEmbedded', args=(slug,)),
+             reverse('visualizeBallotpedia', args=(slug,))]
+    paths += [reverse('visualizeFragment', args=(slug, fragment)) for fragment in FRAGMENTS]
+    return paths
+
+
+def get_most_visited_slugs(accessLogFilename, count):
+    """ The slugs of the elections with the most requests in the access log """
+    numVisits = collections.Counter()
+    with open(accessLogFilename, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = ACCESS_LOG_PATH_RE.search(line)
+            if match is None:
+                continue
+            slug = pageCache.get_slug_for_path(match.group(1))
+            if slug is not pageCache.SITE_NAMESPACE:
+                numVisits[slug] += 1
+    return [slug for slug, _ in numVisits.most_common(count)]
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Renders the featured, most recent and most visited elections into the caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recent', type=int, default=NUM_MOST_RECENT,
+                            help='How many of the most recent uploads to warm')
+        parser.add_argument('--top', type=int, default=0,
+                            help='Also warm the N most visited elections in --access-log')
+        parser.add_argument('--access-log', help='A web server access log to count visits in')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='How many elections to render at once')
+        parser.add_argument('--host',
+                            help="The host pages are served from. Defaults to the Site's domain.")
+        parser.add_argument('--http', action='store_true',
+                            help='Warm the pages served over http rather than https')
+        parser.add_argument('--bundles-only', action='store_true',
+                            help='Only render the bundles, not the pages. Required if the '
+                                 'cache is local to each process, e.g. LocMemCache.')
+
+    @classmethod
+    def _get_slugs(cls, options):
+        """ The slugs to warm, in order of importance, without duplicates """
+        featured = HomepageFeaturedElection.objects.values_list('jsonConfig__slug', flat=True)
+        recent = JsonConfig.objects.order_by('-uploadedAt').values_list('slug', flat=True)
+        slugs = list(featured) + list(recent[:options['recent']])
+        if options['top']:
+            slugs += get_most_visited_slugs(options['access_log'], options['top'])
+
+        # The access log may have slugs which were since deleted
+        existing = set(JsonConfig.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        return [slug for slug in dict.fromkeys(slugs) if slug in existing]
+
+    def _warm(self, slug, options):
+        """ Renders the election with the given slug into the caches """
+        config = JsonConfig.objects.get(slug=slug)
+        if options['bundles_only']:
+            get_data_for_view(config)
+            return
+
+        # First, so that the pages' wikicode fragment is served from it
+        referenceUrl = wikicodeCache.get_reference_url_for_host(
+            options['host'], slug, secure=not options['http'])
+        wikicodeCache.precompute_if_featured(config, referenceUrl)
+
+        client = Client(HTTP_HOST=options['host'])
+        for path in get_paths_to_warm(slug):
+            response = client.get(path, secure=not options['http'])
+            if response.status_code != 200:
+                raise CommandError(f'{path} returned {response.status_code}')
+
+    def _warm_in_worker(self, slug, options):
+        """ Like _warm, but in a worker thread: it must close its own database connections """
+        try:
+            self._warm(slug, options)
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, **options):
+        if options['top'] and not options['access_log']:
+            raise CommandError("--top needs an --access-log to count the visits in")
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        pageCacheBackend = caches[settings.CACHE_MIDDLEWARE_ALIAS]
+        if not options['bundles_only'] and isinstance(pageCacheBackend,
+                                                      PROCESS_LOCAL_CACHE_BACKENDS):
+            raise CommandError(f"The {type(pageCacheBackend).__name__} cache isn't shared with "
+                               "the web workers: the warmed pages would never be served. Use a "
+                               "shared cache, or pass --bundles-only.")
+        if not options['host']:
+            options['host'] = Site.objects.get_current().domain
+
+        slugs = self._get_slugs(options)
+        if not options['bundles_only']:
+            # The homepage lists the featured and recent elections: it's visited the most
+            Client(HTTP_HOST=options['host']).get(reverse('index'), secure=not options['http'])
+
+        tic = time.monotonic()
+        failures = []
+
+        def report(i, slug, exception):
+            if exception is None:
+                if options['verbosity'] >= 1:
+                    self.stdout.write(self.style.SUCCESS(f"[{i}/{len(slugs)}] Warmed {slug}"))
+            else:
+                failures.append(slug)
+                self.stderr.write(f"[{i}/{len(slugs)}] Could not warm {slug}: {exception}")
+
+        if options['workers'] == 1:
+            for i, slug in enumerate(slugs, 1):
+                try:
+                    self._warm(slug, options)
+                    report(i, slug, None)
+                except Exception as exc:  # pylint: disable=broad-except
+                    report(i, slug, exc)
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = {executor.submit(self._warm_in_worker, slug, options): slug
+                           for slug in slugs}
+                for i, future in enumerate(as_completed(futures), 1):
+                    report(i, futures[future], future.exception())
+
+        if failures:
+            raise CommandError(f"Could not warm {len(failures)} of {len(slugs)} elections: "
+                               + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(slugs)} elections in {time.monotonic() - tic:.1f}s"))
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.5 on 2026-10-17 18:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0027_alter_jsonconfig_textforwinner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderBundle', fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False, verbose_name='ID')), ('codeVersion', models.CharField(
+                        max_length=40)), ('inputsHash', models.CharField(
+                            max_length=40)), ('createdAt', models.DateTimeField(
+                                auto_now_add=True)), ('data', models.BinaryField()), ('jsonConfig', models.ForeignKey(
+                                    on_delete=django.db.models.deletion.CASCADE, related_name='renderBundles', to='visualizer.jsonconfig')), ], options={
+                'unique_together': {
+                    (
+                        'jsonConfig', 'codeVersion', 'inputsHash')}, }, ), ]
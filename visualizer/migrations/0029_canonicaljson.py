@@ -0,0 +1,35 @@
+# Generated by Django 3.2.5 on 2026-10-17 20:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0028_renderbundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalJson',
+            fields=[
+                ('id',
+                 models.AutoField(
+                     auto_created=True,
+                     primary_key=True,
+                     serialize=False,
+                     verbose_name='ID')),
+                ('codeVersion',
+                 models.CharField(
+                     max_length=40)),
+                ('data',
+                 models.BinaryField()),
+                ('jsonConfig',
+                 models.OneToOneField(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     related_name='canonicalJson',
+                     to='visualizer.jsonconfig')),
+            ],
+        ),
+    ]
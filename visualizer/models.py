@@ -1,12 +1,13 @@
 """ The django object models """
 
 from django.conf import settings
-from django.core.cache import cache
+from django.contrib.sites.models import Site
 from django.db import models
 from django.urls import reverse
 from django.utils.text import slugify
 from django.utils.translation import ugettext as _
 
+from common import pageCache
 from common.cloudflare import CloudflareAPI
 
 
@@ -153,25 +154,71 @@ class JsonConfig(models.Model):
         if not self.slug:
             self.slug = self._get_unique_slug()
         else:
-            # Model is being updated, not created. Clear the cache.
-
-            # A) Local mem cache clearing.
-            # This is not useful in most cases, but is useful when:
-            # 1. The admin page changes something
-            # 2. In unit tests, where the db gets cleared for each test, and you don't want to see
-            #    the previous test's cached results
-            # TODO - this is overkill, how can we just clear the cache for this model?
-            # 3. API updates
-            cache.clear()
-
-            # B) Cloudflare cache clearing
+            # Model is being updated, not created. Clear the cloudflare cache.
             # Should only occur in production. Doesn't clear all possible cache keys
             # (that would require an enterprise cloudflare connection), but hits the
             # common URLs.
             CloudflareAPI.purge_vis_cache(self.slug)
 
+        # Clear the local cache for this slug only - every other election keeps its cached
+        # pages. Also done on creation, in case a deleted election's slug is reused.
+        # This is useful when:
+        # 1. The admin page changes something
+        # 2. In unit tests, where the db gets cleared for each test, and you don't want to see
+        #    the previous test's cached results
+        # 3. API updates
+        pageCache.invalidate(self.slug)
+
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):  # pylint: disable=signature-differs
+        pageCache.invalidate(self.slug)
+        return super().delete(*args, **kwargs)
+
+
+class RenderBundle(models.Model):
+    """
+    The precomputed output of the rendering pipeline for a single JsonConfig.
+    Page views read this instead of re-parsing and re-rendering the uploaded file.
+    Use common.renderBundle to read and write these - the data is an opaque blob.
+    """
+    jsonConfig = models.ForeignKey(JsonConfig,
+                                   related_name='renderBundles',
+                                   on_delete=models.CASCADE)
+
+    # A hash of the rendering code: a deploy that changes the output invalidates the bundle
+    codeVersion = models.CharField(max_length=40)
+
+    # A hash of the uploaded files and options the bundle was rendered with
+    inputsHash = models.CharField(max_length=40)
+
+    createdAt = models.DateTimeField(auto_now_add=True)
+    data = models.BinaryField()
+
+    class Meta:
+        """ Only one bundle per config and version """
+        unique_together = ('jsonConfig', 'codeVersion', 'inputsHash')
+
+    def __str__(self):
+        return '%s: %s-%s' % (self.jsonConfig.slug, self.codeVersion, self.inputsHash)
+
+
+class CanonicalJson(models.Model):
+    """
+    The jsonFile of a JsonConfig, converted and migrated: see common.canonicalJson.
+    Kept out of JsonConfig so that listing configs doesn't read it.
+    """
+    jsonConfig = models.OneToOneField(JsonConfig,
+                                      related_name='canonicalJson',
+                                      on_delete=models.CASCADE)
+
+    # Regenerated when it is read if this is outdated (see canonicalJson.get_code_version)
+    codeVersion = models.CharField(max_length=40)
+    data = models.BinaryField()
+
+    def __str__(self):
+        return '%s: %s' % (self.jsonConfig.slug, self.codeVersion)
+
 
 class HomepageFeaturedElectionColumn(models.Model):
     """ Represents a column of links on the homepage. """
@@ -214,3 +261,14 @@ class HomepageFeaturedElection(models.Model):
 
     def __str__(self):
         return str(self.title)
+
+    #pylint: disable=signature-differs
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # Featured elections get the most visits: have their wikicode ready for them.
+        # Imported here: common.wikicodeCache refers to this model
+        from common import wikicodeCache  # pylint: disable=import-outside-toplevel,cyclic-import
+        referenceUrl = wikicodeCache.get_reference_url_for_host(
+            Site.objects.get_current().domain, self.jsonConfig.slug)
+        wikicodeCache.precompute_if_featured(self.jsonConfig, referenceUrl)
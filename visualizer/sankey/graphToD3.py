@@ -13,24 +13,29 @@ class D3Sankey:
         js += 'numCandidates = %d;\n' % len(graph.nodesPerRound[0])
         js += 'longestLabelApxWidth = %f;\n' % longestLabelApxWidth
         js += f'totalVotesPerRound = {totalVotesPerRound};\n'
-        js += 'graph = {"nodes" : [], "links" : []};\n'
 
         # Maps Items to a unique index. Used for color indexing.
-        indices = {item: i for i, item in enumerate(graph.eliminationOrder)}
+        indices = graph.eliminationOrderIndices
 
+        # The nodes and links are sent as columns - one list per attribute - which is far
+        # smaller than a list of objects. makeSankeyGraph turns them back into objects.
+        nodeColumns = {'name': [str(item.name) for item in graph.eliminationOrder],
+                       'candidate': [], 'round': [], 'value': [],
+                       'isWinner': [], 'isEliminated': []}
         nodeIndices = {}
-        for i, node in enumerate(graph.nodes):
+        for node in graph.nodes:
             # Skip inactive (exhausted) nodes
             if not node.item.isActive:
                 continue
 
-            nodeIndices[node] = i
-            js += 'graph.nodes.push({ "name": %s,\n' % json.dumps(node.label)
-            js += '                   "round": %d,\n' % node.roundNum
-            js += '                   "value": %f,\n' % node.count
-            js += '                   "isWinner": %d,\n' % node.isWinner
-            js += '                   "isEliminated": %d,\n' % node.isEliminated
-            js += '                   "index": "%s"});\n' % indices[node.item]
+            nodeIndices[node] = len(nodeIndices)
+            nodeColumns['candidate'].append(indices[node.item])
+            nodeColumns['round'].append(node.roundNum)
+            nodeColumns['value'].append(compact_number(node.count, 6))
+            nodeColumns['isWinner'].append(int(node.isWinner))
+            nodeColumns['isEliminated'].append(int(node.isEliminated))
+
+        linkColumns = {'source': [], 'target': [], 'value': []}
         for link in graph.links:
             # Skip inactive (exhausted) nodes
             if not link.source.item.isActive:
@@ -38,10 +43,18 @@ class D3Sankey:
             if not link.target.item.isActive:
                 continue
 
-            sourceIndex = nodeIndices[link.source]
-            targetIndex = nodeIndices[link.target]
-            js += 'graph.links.push({ "source": %d,\n' % sourceIndex
-            js += '                   "target": %d,\n' % targetIndex
-            js += '           "candidateIndex": %d,\n' % indices[link.source.item]
-            js += '                    "value": %0.3f });\n' % link.value
+            linkColumns['source'].append(nodeIndices[link.source])
+            linkColumns['target'].append(nodeIndices[link.target])
+            linkColumns['value'].append(compact_number(link.value, 3))
+
+        columns = {'nodes': nodeColumns, 'links': linkColumns}
+        js += 'graph = makeSankeyGraph(%s);\n' % json.dumps(columns, separators=(',', ':'))
         self.js = js
+
+
+def compact_number(number, numDigits):
+    """ Rounds the number, dropping the decimal point if it's an integer """
+    number = round(number, numDigits)
+    if number == int(number):
+        return int(number)
+    return number
@@ -1,12 +1,24 @@
-import plotly.offline as py
-
-
-# Use this instead to render to the web
-# import plotly.plotly as py
+import plotly.io
+import plotly.offline
 
 
 class PlotlySankey:
+    """
+    Converts the graph to a Plotly sankey figure, which can be exported to a standalone
+    HTML page or to an image. See the exportSankey management command.
+    """
+
     def __init__(self, graph):
+        # Maps Items to a unique index. Used for color indexing.
+        indices = graph.eliminationOrderIndices
+        colors = [get_color(i, len(indices), 1.0) for i in range(len(indices))]
+        linkColors = [get_color(i, len(indices), 0.4) for i in range(len(indices))]
+
+        # Like the D3 sankey, skip inactive (exhausted) nodes
+        nodes = [n for n in graph.nodes if n.item.isActive]
+        nodeIndices = {node: i for i, node in enumerate(nodes)}
+        links = [l for l in graph.links if l.source in nodeIndices and l.target in nodeIndices]
+
         data_trace = dict(
             type='sankey',
             domain=dict(
@@ -21,14 +33,14 @@ class PlotlySankey:
                 line=dict(
                     width=0
                 ),
-                label=[n.label for n in graph.nodes],
-                color=[n.color for n in graph.nodes]
+                label=[n.label for n in nodes],
+                color=[colors[indices[n.item]] for n in nodes]
             ),
             link=dict(
-                source=[graph.nodes.index(l.source) for l in graph.links],
-                target=[graph.nodes.index(l.target) for l in graph.links],
-                value=[l.value for l in graph.links],
-                color=[l.color for l in graph.links]
+                source=[nodeIndices[l.source] for l in links],
+                target=[nodeIndices[l.target] for l in links],
+                value=[l.value for l in links],
+                color=[linkColors[indices[l.source.item]] for l in links]
             )
         )
 
@@ -43,4 +55,19 @@ class PlotlySankey:
         self.figure = dict(data=[data_trace], layout=layout)
 
     def draw(self):
-        py.plot(self.figure, validate=True)
+        """ Opens the figure in a browser """
+        plotly.offline.plot(self.figure, validate=True)
+
+    def to_html(self):
+        """ A standalone HTML page: plotly.js is embedded, so it can be viewed offline """
+        return plotly.io.to_html(self.figure, include_plotlyjs=True, full_html=True)
+
+    def write_image(self, fileObject, imageFormat='png'):
+        """ Writes a static image. Requires the optional kaleido package. """
+        plotly.io.write_image(self.figure, fileObject, format=imageFormat)
+
+
+def get_color(index, numColors, alpha):
+    """ Evenly spaced hues, one per candidate """
+    hue = round(360 * index / max(numColors, 1))
+    return f'hsla({hue}, 70%, 50%, {alpha})'
@@ -1,5 +1,7 @@
 """ Data serializers - used for the REST API """
 
+import contextlib
+import copy
 import traceback
 
 from django.contrib.auth import get_user_model
@@ -11,7 +13,27 @@ from visualizer.graph.graphCreator import BadJSONError
 from visualizer.models import TextForWinner
 from visualizer.sidecar.reader import BadSidecarError
 from .models import JsonConfig
-from .validators import try_to_load_jsons
+from .validators import load_jsons
+
+
+@contextlib.contextmanager
+def raise_validation_errors():
+    """ Converts any errors loading or rendering the files into ValidationErrors """
+    try:
+        yield
+    except BadJSONError as exception:
+        errorMessage = traceback.format_exc()
+        raise serializers.ValidationError(
+            {'jsonFile': ["JSON is not valid: " + errorMessage]}) from exception
+    except BadSidecarError as exception:
+        errorMessage = traceback.format_exc()
+        raise serializers.ValidationError(
+            {'candidateSidecarFile': ["Sidecar JSON is not valid: " + errorMessage]}) \
+            from exception
+    except Exception as exception:
+        # Don't print full traceback here - we don't control this message as closely,
+        # and it might (?) contain keys.
+        raise serializers.ValidationError({'jsonFile': ["Unknown error: " + str(exception)]})
 
 
 class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
@@ -35,6 +57,9 @@ class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
         read_only_but_validate_fields = ('numRounds', 'numCandidates', 'title')
         fields = read_only_fields + read_only_but_validate_fields
 
+    # Set by to_internal_value: a validators.LoadedJsons to store once the instance is saved
+    loadedJsons = None
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         request = self.context['request']
@@ -72,35 +97,37 @@ class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
             # Creating: if the field is not provided, it does not exist. Treat it as None.
             jsonFile = data.get('jsonFile')
             candidateSidecarFile = data.get('candidateSidecarFile')
-        graph = self.load_graph_or_errors(jsonFile, candidateSidecarFile)
+        loadedJsons = self.load_graph_or_errors(jsonFile, candidateSidecarFile)
 
         if 'jsonFile' in data:
             # Only update these fields if the jsonFile changed
-            self.populate_model_with_json_data(data, graph)
+            self.populate_model_with_json_data(data, loadedJsons.graph)
 
         # Now run all other validations
         data = super().to_internal_value(data)
 
+        # Sanity check that the entire pipeline works with these options.
+        # The output is stored as the render bundle once the instance is saved.
+        with raise_validation_errors():
+            loadedJsons.render(self.get_config_to_render(data))
+        self.loadedJsons = loadedJsons
+
         return data
 
         # validations happen after this point...
 
     @classmethod
     def load_graph_or_errors(cls, jsonFile, candidateSidecarFile):
-        """ Returns the graph, or raises an error if it cannot. """
-        try:
-            return try_to_load_jsons(jsonFile, candidateSidecarFile)
-        except BadJSONError as exception:
-            errorMessage = traceback.format_exc()
-            raise serializers.ValidationError({'jsonFile': ["JSON is not valid: " + errorMessage]})
-        except BadSidecarError as exception:
-            errorMessage = traceback.format_exc()
-            raise serializers.ValidationError(
-                {'candidateSidecarFile': ["Sidecar JSON is not valid: " + errorMessage]})
-        except Exception as exception:
-            # Don't print full traceback here - we don't control this message as closely,
-            # and it might (?) contain keys.
-            raise serializers.ValidationError({'jsonFile': ["Unknown error: " + str(exception)]})
+        """ Returns the validators.LoadedJsons, or raises an error if it cannot. """
+        with raise_validation_errors():
+            return load_jsons(jsonFile, candidateSidecarFile)
+
+    def get_config_to_render(self, validatedData):
+        """ The JsonConfig as it will be saved, without saving it """
+        config = copy.copy(self.instance) if self.instance else JsonConfig()
+        for field, value in validatedData.items():
+            setattr(config, field, value)
+        return config
 
     def check_for_superfluous_fields_before_modification(self, data):
         """ Raises a ValidationError if the data does not have superfluous fields. """
@@ -229,6 +229,10 @@ class LiveServerTestBaseClass(StaticLiveServerTestCase):
     def _go_to_tab(self, tabId):
         self.browser.find_elements_by_id(tabId)[0].click()
 
+        # Tabs are fetched when they're first shown: wait for them (see fragments.js)
+        self._ensure_eventually_asserts(lambda: self.assertEqual(
+            self.browser.execute_script("return window.numFragmentsLoading || 0"), 0))
+
     def _debug_screenshot(self):
         """ Saves a screenshot in the current directory for debugging """
         # First, ensure we're not on Travis. This is only for local debugging.
@@ -0,0 +1,659 @@
+"""
+Tests for render bundles and caching of the rendered pages
+"""
+
+import gzip
+import json
+import pickle
+import tempfile
+import zlib
+from io import StringIO
+
+import brotli
+from mock import patch
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.text import compress_string
+
+from common import canonicalJson, pageCache, renderBundle, viewUtils, wikicodeCache
+from common.renderData import LazyComponent
+from common.testUtils import TestHelpers
+from common.viewUtils import get_data_for_view
+from visualizer.graph.graphCreator import ParsePath
+from visualizer.models import CanonicalJson, HomepageFeaturedElection, \
+    HomepageFeaturedElectionColumn, RenderBundle
+from visualizer.tests import filenames
+from visualizer.wikipedia.wikipedia import WikipediaExport
+
+TestHelpers.silence_logging_spam()
+
+
+class RenderBundleTests(TestCase):
+    """ Tests for the precomputed render bundle """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+    def tearDown(self):
+        TestHelpers.logout(self.client)
+
+    def test_upload_creates_bundle(self):
+        """ Uploading precomputes the bundle, so viewing doesn't re-parse the file """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        self.assertEqual(RenderBundle.objects.filter(jsonConfig=config).count(), 1)
+
+        with patch('common.canonicalJson.make_graph') as mockMakeGraph:
+            response = self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(response.status_code, 200)
+            mockMakeGraph.assert_not_called()
+
+        self.assertEqual(response.context['title'], config.title)
+
+    def test_upload_renders_once(self):
+        """ The render done to validate the upload is the one stored in the bundle """
+        with patch('common.viewUtils.get_data_for_graph',
+                   wraps=viewUtils.get_data_for_graph) as mockRender:
+            TestHelpers.get_multiwinner_upload_response(self.client)
+            config = TestHelpers.get_latest_upload()
+            self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(mockRender.call_count, 1)
+
+        # It was stored for the uploaded options, not the defaults
+        self.assertIsNotNone(renderBundle.load(config))
+
+    def test_embedded_view_only_reads_its_component(self):
+        """ The components a page doesn't show are never unpickled from the bundle """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+
+        url = reverse('visualizeEmbedded', args=(config.slug,)) + '?vistype=sankey'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['bargraphjs'].isComputed)
+        self.assertFalse(response.context['tabularByCandidate'].isComputed)
+        self.assertFalse(response.context['faqsPerRound'].isComputed)
+
+    def test_bundle_matches_pipeline(self):
+        """ The bundle holds exactly what the pipeline would render """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+
+        fromBundle = renderBundle.load(config)
+        fromPipeline = get_data_for_view(config)
+        for key in ('title', 'bargraphjs', 'sankeyjs', 'faqsPerRound', 'candidateSidecarData'):
+            self.assertEqual(fromBundle[key], fromPipeline[key])
+
+    def test_options_change_invalidates_bundle(self):
+        """ Changing an option renders a new bundle and removes the stale one """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        oldHash = RenderBundle.objects.get(jsonConfig=config).inputsHash
+
+        config.onlyShowWinnersTabular = not config.onlyShowWinnersTabular
+        config.save()
+        self.assertIsNone(renderBundle.load(config))
+
+        self.client.get(reverse('visualize', args=(config.slug,)))
+        bundles = RenderBundle.objects.filter(jsonConfig=config)
+        self.assertEqual(bundles.count(), 1)
+        self.assertNotEqual(bundles[0].inputsHash, oldHash)
+
+    @patch('common.renderBundle.get_code_version')
+    def test_code_change_invalidates_bundle(self, mockGetCodeVersion):
+        """ A deploy which changes the rendering code must not serve old bundles """
+        mockGetCodeVersion.return_value = 'old-version'
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        self.assertIsNotNone(renderBundle.load(config))
+
+        mockGetCodeVersion.return_value = 'new-version'
+        self.assertIsNone(renderBundle.load(config))
+
+        self.client.get(reverse('visualize', args=(config.slug,)))
+        bundle = RenderBundle.objects.get(jsonConfig=config)
+        self.assertEqual(bundle.codeVersion, 'new-version')
+
+    def test_corrupt_bundle_is_recomputed(self):
+        """ An unreadable bundle is treated as missing """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        RenderBundle.objects.filter(jsonConfig=config).update(data=b'not a bundle')
+        cache.clear()
+        self.assertIsNone(renderBundle.load(config))
+
+        response = self.client.get(reverse('visualize', args=(config.slug,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(renderBundle.load(config))
+
+    def test_corrupt_component_is_rerendered(self):
+        """ An unreadable value inside a readable bundle is rendered again, and evicts it """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        bundle = RenderBundle.objects.get(jsonConfig=config)
+        pickledValues = pickle.loads(zlib.decompress(bytes(bundle.data)))
+        pickledValues['bargraphjs'] = b'not a pickle' * renderBundle.LAZY_UNPICKLE_MIN_BYTES
+        bundle.data = zlib.compress(pickle.dumps(pickledValues))
+        bundle.save()
+        cache.clear()
+
+        response = self.client.get(reverse('visualize', args=(config.slug,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['bargraphjs'](),
+                         viewUtils.get_render_data(config)['bargraphjs'])
+        self.assertFalse(RenderBundle.objects.filter(jsonConfig=config).exists())
+
+        # The next render stores a readable bundle again
+        get_data_for_view(config)
+        self.assertEqual(renderBundle.load(config)['bargraphjs'],
+                         response.context['bargraphjs']())
+
+
+class CanonicalJsonTests(TestCase):
+    """ Tests for the converted and migrated JSON stored with each upload """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+    def tearDown(self):
+        TestHelpers.logout(self.client)
+
+    def _upload_electionbuddy(self):
+        """ A CSV file, which must be converted to be read """
+        with open(filenames.ELECTIONBUDDY) as f:
+            self.client.post('/upload.html', {'jsonFile': f})
+        return TestHelpers.get_latest_upload()
+
+    def test_upload_stores_canonical_json(self):
+        """ Reading the stored canonical JSON needs no conversion and gives the same graph """
+        config = self._upload_electionbuddy()
+        self.assertEqual(config.canonicalJson.codeVersion, canonicalJson.get_code_version())
+
+        with patch('common.canonicalJson.make_graph_and_canonical_data') as mockConvert:
+            graph = canonicalJson.make_graph(config)
+            mockConvert.assert_not_called()
+        self.assertEqual(graph.parsePath, ParsePath.CANONICAL)
+        fromCanonical = viewUtils.get_render_data_for_graph(graph, config)
+
+        CanonicalJson.objects.filter(jsonConfig=config).delete()
+        graph = canonicalJson.make_graph(config)
+        self.assertEqual(graph.parsePath, ParsePath.ELECTIONBUDDY)
+        fromFile = viewUtils.get_render_data_for_graph(graph, config)
+        for key in ('title', 'bargraphjs', 'sankeyjs', 'faqsPerRound'):
+            self.assertEqual(fromCanonical[key], fromFile[key])
+
+    def test_outdated_canonical_json_is_regenerated(self):
+        """ When the conversion code changes, the canonical JSON is regenerated on its next read """
+        config = self._upload_electionbuddy()
+        CanonicalJson.objects.filter(jsonConfig=config).update(codeVersion='old code')
+
+        graph = canonicalJson.make_graph(config)
+        self.assertEqual(graph.parsePath, ParsePath.ELECTIONBUDDY)
+        self.assertEqual(CanonicalJson.objects.get(jsonConfig=config).codeVersion,
+                         canonicalJson.get_code_version())
+
+        # The file is replaced, e.g. in the admin
+        config.jsonFile.name = 'another-file.csv'
+        self.assertIsNone(canonicalJson._decode(config))  # pylint: disable=protected-access
+
+
+class PageCacheTests(TestCase):
+    """ Tests for the slug-scoped page cache """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.otherConfig = TestHelpers.get_latest_upload()
+
+        # Cached pages are only served to anonymous users
+        TestHelpers.logout(self.client)
+
+    def _is_served_from_cache(self, config):
+        """ Requests the visualization, returning True if it was not rendered """
+        with patch('common.viewUtils.get_data_for_view') as mockGetData:
+            mockGetData.side_effect = get_data_for_view
+            response = self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(response.status_code, 200)
+            return not mockGetData.called
+
+    def test_pages_are_cached(self):
+        """ The second request of a page is served from the cache """
+        self.assertFalse(self._is_served_from_cache(self.config))
+        self.assertTrue(self._is_served_from_cache(self.config))
+
+    def test_save_only_invalidates_its_slug(self):
+        """ Saving one election must not evict every other election's pages """
+        self._is_served_from_cache(self.config)
+        self._is_served_from_cache(self.otherConfig)
+
+        self.config.save()
+        self.assertFalse(self._is_served_from_cache(self.config))
+        self.assertTrue(self._is_served_from_cache(self.otherConfig))
+
+    def test_save_invalidates_site_pages(self):
+        """ Pages listing many elections, such as the sitemap, are invalidated too """
+        oldToken = pageCache.get_namespace_token(pageCache.SITE_NAMESPACE)
+        otherToken = pageCache.get_namespace_token(self.otherConfig.slug)
+        self.config.save()
+        self.assertNotEqual(pageCache.get_namespace_token(pageCache.SITE_NAMESPACE), oldToken)
+        self.assertEqual(pageCache.get_namespace_token(self.otherConfig.slug), otherToken)
+
+        self.assertEqual(pageCache.get_slug_for_path('/sitemap.xml'), pageCache.SITE_NAMESPACE)
+        self.assertEqual(pageCache.get_slug_for_path('/not/a/page'), pageCache.SITE_NAMESPACE)
+        self.assertEqual(pageCache.get_slug_for_path(
+            reverse('visualizeEmbedded', args=(self.config.slug,))), self.config.slug)
+
+    def test_fragment_keys(self):
+        """ Fragments are evicted along with their slug's pages """
+        key = pageCache.get_fragment_key(self.config.slug, 'fragment')
+        otherKey = pageCache.get_fragment_key(self.otherConfig.slug, 'fragment')
+        self.assertNotEqual(key, otherKey)
+        self.assertEqual(key, pageCache.get_fragment_key(self.config.slug, 'fragment'))
+
+        pageCache.invalidate(self.config.slug)
+        self.assertNotEqual(key, pageCache.get_fragment_key(self.config.slug, 'fragment'))
+        self.assertEqual(otherKey, pageCache.get_fragment_key(self.otherConfig.slug, 'fragment'))
+
+    def test_pages_are_stored_compressed(self):
+        """ Pages are compressed once, and served compressed to clients which accept it """
+        url = reverse('visualize', args=(self.config.slug,))
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        with patch('common.pageCache.compress_string', wraps=compress_string) as mockCompress:
+            for _ in range(2):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(gzip.decompress(response.content), plain.content)
+            mockCompress.assert_not_called()
+
+        # Clients which accept neither get it decompressed
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, plain.content)
+
+    def test_brotli_variant(self):
+        """ Clients which accept brotli get the brotli variant """
+        url = reverse('visualize', args=(self.config.slug,))
+        plain = self.client.get(url)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_refused_encodings(self):
+        """ An encoding with a quality of zero is refused, even if it's listed """
+        url = reverse('visualize', args=(self.config.slug,))
+        plain = self.client.get(url)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content, plain.content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, *;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_warm_cache_command(self):
+        """ The warmCache command renders the most recent elections into the page cache """
+        cache.clear()
+        RenderBundle.objects.all().delete()
+        log = tempfile.NamedTemporaryFile('w', suffix='.log')
+        log.write(f'"GET {reverse("visualize", args=(self.config.slug,))} HTTP/1.1" 200\n')
+        log.flush()
+
+        stdout = StringIO()
+        # The tests' cache is local to this process, as the web workers' caches would be
+        with self.assertRaises(CommandError):
+            call_command('warmCache', recent=1, workers=1, stdout=stdout)
+        self.assertEqual(RenderBundle.objects.count(), 0)
+
+        with patch('visualizer.management.commands.warmCache.PROCESS_LOCAL_CACHE_BACKENDS', ()):
+            call_command('warmCache', recent=1, top=1, access_log=log.name, workers=1,
+                         host='testserver', http=True, stdout=stdout)
+        self.assertIn('Warmed 2 elections', stdout.getvalue())
+        self.assertEqual(RenderBundle.objects.count(), 2)
+        self.assertTrue(self._is_served_from_cache(self.config))
+        self.assertTrue(self._is_served_from_cache(self.otherConfig))
+
+        # Bundles are stored in the database, whatever the cache
+        RenderBundle.objects.all().delete()
+        cache.clear()
+        call_command('warmCache', recent=2, workers=1, bundles_only=True, stdout=stdout)
+        self.assertEqual(RenderBundle.objects.count(), 2)
+
+        with self.assertRaises(CommandError):
+            call_command('warmCache', top=1, stdout=stdout)
+
+    def test_evicted_namespace_invalidates(self):
+        """ If the backend evicts a namespace token, its pages must not be served """
+        self._is_served_from_cache(self.config)
+        # pylint: disable=protected-access
+        cache.delete(pageCache._get_namespace_key(self.config.slug))
+        self.assertFalse(self._is_served_from_cache(self.config))
+
+
+class SharedCacheTests(TestCase):
+    """ Tests for using a cache shared between worker processes """
+
+    def setUp(self):
+        self.cacheDir = tempfile.TemporaryDirectory()
+        self.settingsOverride = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.cacheDir.name,
+            }
+        })
+        self.settingsOverride.enable()
+
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+
+    def tearDown(self):
+        TestHelpers.logout(self.client)
+        self.settingsOverride.disable()
+        self.cacheDir.cleanup()
+
+    @staticmethod
+    def _create_other_worker_cache():
+        """ A new connection to the same cache, as another process would have """
+        return caches.create_connection('default')
+
+    def test_bundle_is_read_from_cache(self):
+        """ Once cached, loading a bundle doesn't touch the database """
+        expected = renderBundle.load(self.config)
+        with self.assertNumQueries(0):
+            self.assertEqual(renderBundle.load(self.config)['title'], expected['title'])
+
+    def test_invalidation_reaches_other_workers(self):
+        """ Saving a config in one worker evicts its pages from every worker """
+        otherWorkerCache = self._create_other_worker_cache()
+        # pylint: disable=protected-access
+        namespaceKey = pageCache._get_namespace_key(self.config.slug)
+        oldToken = pageCache.get_namespace_token(self.config.slug)
+        self.assertEqual(otherWorkerCache.get(namespaceKey), oldToken)
+
+        self.config.save()
+        self.assertNotEqual(otherWorkerCache.get(namespaceKey), oldToken)
+
+
+class RenderCoalescingTests(TestCase):
+    """ Tests for coalescing concurrent renders of the same config """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+        TestHelpers.logout(self.client)
+
+    def _get_lock_key(self):
+        """ The key of the render lock, which changes when the cache is cleared """
+        return pageCache.get_fragment_key(self.config.slug, 'renderLock')
+
+    def _make_bundle_stale(self):
+        """ As if the code changed since the bundle was rendered """
+        RenderBundle.objects.filter(jsonConfig=self.config).update(codeVersion='old-version')
+        cache.clear()
+
+    def test_lock_is_released(self):
+        """ The render lock is released after rendering, even if rendering fails """
+        self._make_bundle_stale()
+        viewUtils.get_data_for_view(self.config)
+        self.assertIsNone(cache.get(self._get_lock_key()))
+
+        self._make_bundle_stale()
+        with patch('common.viewUtils.get_data_for_graph', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                viewUtils.get_data_for_view(self.config)
+        self.assertIsNone(cache.get(self._get_lock_key()))
+
+    @patch('common.viewUtils.create_render_bundle')
+    def test_stale_bundle_served_while_rendering(self, mockCreate):
+        """ While another request renders, the stale bundle is served but not cached """
+        self._make_bundle_stale()
+        cache.add(self._get_lock_key(), True)
+
+        response = self.client.get(reverse('visualize', args=(self.config.slug,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['isStale'])
+        self.assertIn('max-age=0', response['Cache-Control'])
+        mockCreate.assert_not_called()
+
+    def test_incompatible_stale_bundle_is_not_served(self):
+        """ A bundle from older code is only served if all of it can be read now """
+        self._make_bundle_stale()
+        staleData = renderBundle.load_stale(self.config)
+        self.assertNotIsInstance(dict.get(staleData, 'bargraphjs'), LazyComponent)
+
+        # e.g. a pickled class gained __slots__ since
+        bundle = RenderBundle.objects.get(jsonConfig=self.config)
+        pickledValues = pickle.loads(zlib.decompress(bytes(bundle.data)))
+        pickledValues['tabularByRound'] = b'not a pickle' * renderBundle.LAZY_UNPICKLE_MIN_BYTES
+        bundle.data = zlib.compress(pickle.dumps(pickledValues))
+        bundle.save()
+        self.assertIsNone(renderBundle.load_stale(self.config))
+
+        # So the request renders it rather than serving it
+        cache.add(self._get_lock_key(), True)
+        with patch('common.viewUtils.RENDER_LOCK_SECONDS', 0):
+            response = self.client.get(reverse('visualize', args=(self.config.slug,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('isStale', response.context)
+
+    @patch('common.viewUtils.time.sleep')
+    @patch('common.viewUtils.get_render_data')
+    def test_waits_for_other_renderer(self, mockRender, mockSleep):
+        """ Without a stale bundle, wait for the other request's bundle """
+        bundleData = renderBundle.load(self.config)
+        RenderBundle.objects.filter(jsonConfig=self.config).delete()
+        cache.clear()
+        cache.add(self._get_lock_key(), True)
+
+        # The other request finishes while this one is waiting
+        mockSleep.side_effect = lambda seconds: renderBundle.save(self.config, bundleData)
+
+        data = viewUtils.get_data_for_view(self.config)
+        self.assertEqual(data['title'], bundleData['title'])
+        self.assertNotIn('isStale', data)
+        mockRender.assert_not_called()
+        self.assertEqual(mockSleep.call_count, 1)
+
+    @patch('common.viewUtils.RENDER_LOCK_SECONDS', 0)
+    def test_renders_after_lock_timeout(self):
+        """ If the other renderer never finishes, render it here """
+        RenderBundle.objects.filter(jsonConfig=self.config).delete()
+        cache.clear()
+        cache.add(self._get_lock_key(), True)
+
+        data = viewUtils.get_data_for_view(self.config)
+        self.assertEqual(data['title'], self.config.title)
+        self.assertIsNotNone(renderBundle.load(self.config))
+
+
+class WikicodeCacheTests(TestCase):
+    """ Tests for the on-demand, cached wikicode export """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+        self.url = reverse('visualizeWikicode', args=(self.config.slug,))
+
+    def tearDown(self):
+        TestHelpers.logout(self.client)
+
+    def _get_wikicode(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def _feature(self):
+        column = HomepageFeaturedElectionColumn.objects.create(title='Column', order=0)
+        HomepageFeaturedElection.objects.create(
+            title='Featured', order=0, column=column, jsonConfig=self.config)
+
+    def test_wikicode_is_generated_once(self):
+        """ The export is streamed, and only generated the first time it's asked for """
+        with patch('common.wikicodeCache.WikipediaExport', wraps=WikipediaExport) as mockExport:
+            wikicode = self._get_wikicode()
+            self.assertEqual(self._get_wikicode(), wikicode)
+            self.assertEqual(mockExport.call_count, 1)
+        self.assertTrue(wikicode.endswith('|}'))
+
+        # The share tab's fragment is the same export
+        fragmentUrl = reverse('visualizeFragment', args=(self.config.slug, 'wikicode'))
+        self.assertEqual(self.client.get(fragmentUrl).json()['wikicode'], wikicode)
+
+    def test_featured_wikicode_is_precomputed(self):
+        """ Featured elections have their wikicode generated as soon as they're featured """
+        self._feature()
+        referenceUrl = wikicodeCache.get_reference_url_for_host('example.com', self.config.slug)
+
+        with patch('common.wikicodeCache.WikipediaExport') as mockExport:
+            wikicode = wikicodeCache.get_wikicode(self.config, referenceUrl)
+            mockExport.assert_not_called()
+        graph = viewUtils.make_graph(self.config)
+        self.assertEqual(wikicode, WikipediaExport(graph, referenceUrl).create_wikicode())
+
+        # Unless the election changes
+        self.config.save()
+        with patch('common.wikicodeCache.WikipediaExport', wraps=WikipediaExport) as mockExport:
+            wikicodeCache.get_wikicode(self.config, referenceUrl)
+            mockExport.assert_called_once()
+
+        # Then warming the caches generates it again
+        self.config.save()
+        with patch('visualizer.management.commands.warmCache.PROCESS_LOCAL_CACHE_BACKENDS', ()):
+            call_command('warmCache', recent=0, workers=1, host='testserver', http=True,
+                         stdout=StringIO())
+        referenceUrl = wikicodeCache.get_reference_url_for_host(
+            'testserver', self.config.slug, secure=False)
+        with patch('common.wikicodeCache.WikipediaExport') as mockExport:
+            wikicodeCache.get_wikicode(self.config, referenceUrl)
+            mockExport.assert_not_called()
+
+
+class ConditionalGetTests(TestCase):
+    """ Tests for the ETags and Last-Modified dates of the visualizations """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+        slug = self.config.slug
+        self.urls = [reverse('visualize', args=(slug,)),
+                     reverse('visualizeEmbedded', args=(slug,)) + '?vistype=sankey',
+                     reverse('visualizeBallotpedia', args=(slug,)),
+                     reverse('oembed') + '?url=https://example.com/v/' + slug]
+
+    def tearDown(self):
+        TestHelpers.logout(self.client)
+
+    def test_unchanged_pages_are_not_rendered(self):
+        """ Revalidating an unchanged page gets a 304 without rendering anything """
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+            # Not even from the page cache
+            cache.clear()
+            with patch('common.viewUtils.get_data_for_view') as mockGetData:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                mockGetData.assert_not_called()
+            self.assertEqual(response.status_code, 304)
+
+    def test_last_modified(self):
+        """ Pages which are unchanged since the render bundle was created get a 304 """
+        response = self.client.get(self.urls[0])
+        lastModified = response['Last-Modified']
+        response = self.client.get(self.urls[0], HTTP_IF_MODIFIED_SINCE=lastModified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_change_etags(self):
+        """ The ETag changes with the options, the query string and the code """
+        etag = self.client.get(self.urls[0])['ETag']
+
+        self.config.hideSankey = True
+        self.config.save()
+        newEtag = self.client.get(self.urls[0])['ETag']
+        self.assertNotEqual(etag, newEtag)
+        self.assertEqual(
+            self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.assertNotEqual(self.client.get(self.urls[0] + '?vistype=sankey')['ETag'], newEtag)
+
+        cache.clear()
+        with patch('common.renderBundle.get_code_version', return_value='new code'):
+            self.assertNotEqual(self.client.get(self.urls[0])['ETag'], newEtag)
+
+
+class StageTimingTests(TestCase):
+    """ Tests for the per-stage timings of sampled requests """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.login(self.client)
+        TestHelpers.setup_host_mocks(self)
+
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+        self.url = reverse('visualize', args=(self.config.slug,))
+        TestHelpers.logout(self.client)
+
+    @staticmethod
+    def _get_stage_names(response):
+        return [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+
+    @override_settings(STAGE_TIMING_SAMPLE_RATE=1)
+    def test_stages_are_timed(self):
+        """ A cold render reports each stage, and a cached page only its total """
+        RenderBundle.objects.all().delete()
+        CanonicalJson.objects.all().delete()
+
+        with self.assertLogs('common.stageTiming') as logs:
+            response = self.client.get(self.url)
+        stageNames = self._get_stage_names(response)
+        self.assertEqual(stageNames[0], 'total')
+        for stageName in ('bundleRead', 'canonicalRead', 'fileRead', 'migrate', 'graph',
+                          'summary', 'bundleWrite', 'render.sankeyjs', 'render.faqsPerRound'):
+            self.assertIn(stageName, stageNames)
+
+        logged = json.loads(logs.output[0].split('Stage timings: ', 1)[1])
+        self.assertEqual(logged['path'], self.url)
+        self.assertEqual(list(logged['stages']), stageNames)
+        self.assertIn('allocatedBlocks', logged['stages']['graph'])
+
+        # The page is now cached, without the timings of the request which rendered it
+        self.assertEqual(self._get_stage_names(self.client.get(self.url)), ['total'])
+
+    def test_unsampled_requests_are_not_timed(self):
+        """ By default, requests aren't timed """
+        with override_settings(STAGE_TIMING_SAMPLE_RATE=0):
+            self.assertFalse(self.client.get(self.url).has_header('Server-Timing'))
@@ -14,6 +14,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_tracking.models import APIRequestLog
 
+from common import renderBundle, viewUtils
 from common.testUtils import TestHelpers
 from visualizer.tests import filenames
 
@@ -306,6 +307,19 @@ class RestAPITests(APITestCase):
         response = self.client.patch(url, format='json', data=editedData)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_upload_stores_render_bundle(self):
+        """ The render done while validating is stored, so viewing doesn't render again """
+        self._authenticate_as('notadmin')
+        with patch('common.viewUtils.get_data_for_graph',
+                   wraps=viewUtils.get_data_for_graph) as mockRender:
+            self._upload_file_for_api(filenames.ONE_ROUND)
+            self.assertEqual(mockRender.call_count, 1)
+
+            config = TestHelpers.get_latest_upload()
+            self.assertIsNotNone(renderBundle.load(config))
+            self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(mockRender.call_count, 1)
+
     def test_large_file_fails(self):
         """ Ensure that large files fail via the API as well """
         self._authenticate_as('notadmin')
@@ -1,30 +1,49 @@
 """ Integration tests without a server
 """
 
-from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+import functools
+from io import BytesIO, StringIO
 import json
+import multiprocessing
+import os
+import re
+import tempfile
 from mock import patch
 
 from django.core.files import File
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 from django.test.client import RequestFactory
 from django.urls import reverse
 from rcvformats.schemas.universaltabulator import SchemaV0 as UTSchema
 
 from common.testUtils import TestHelpers
+from common import batchValidation, electionGenerator, loadTest, viewUtils
 from common.viewUtils import get_data_for_view
 from common.cloudflare import CloudflareAPI
 from visualizer.graph.graphCreator import BadJSONError
-from visualizer.graph.graphCreator import make_graph_with_file
-from visualizer.graph.readRCVRCJSON import JSONReader
+from visualizer.graph.graphCreator import make_graph_with_file, sniff_format, ParsePath
+from visualizer.graph import jsonStream
+from visualizer.graph.readRCVRCJSON import JSONReader, JSONMigrator
+from visualizer.graph.readRCVRCJSON import FixNoTransfersTask, FixRankitMissingWinners
+from visualizer import views
 from visualizer.views import Oembed
+from visualizer.sankey.graphToD3 import D3Sankey
+from visualizer.sankey.graphToPlotly import PlotlySankey
 from visualizer.models import JsonConfig, HomepageFeaturedElection, HomepageFeaturedElectionColumn
+from visualizer.sidecar.reader import SidecarReader
 from visualizer.forms import JsonConfigForm
 from visualizer.tests import filenames
 from visualizer.wikipedia.wikipedia import WikipediaExport
 
 
+def check_models_are_ready(_):
+    """ A check for the BatchValidator, defined in this module, which imports models """
+    JsonConfig.check()
+
+
 # pylint: disable=too-many-public-methods
 class SimpleTests(TestCase):
     """ Simple tests that do not require a live browser """
@@ -41,7 +60,7 @@ class SimpleTests(TestCase):
         """ Opens the given file and creates a graph with it """
         with open(fn, 'rb+') as f:
             config = JsonConfig(jsonFile=File(f))
-            return get_data_for_view(config)
+            return get_data_for_view(config).resolve_all()
 
     def test_opavote_loads(self):
         """ Opens the opavote file """
@@ -72,6 +91,29 @@ class SimpleTests(TestCase):
         # Uses FixRankitMissingWinners
         self._get_data_for_view(filenames.BROKEN_RANKIT_2)
 
+    def test_synthetic_elections_load(self):
+        """ Synthetic elections have every feature the readers handle, and their sidecars match """
+        with tempfile.TemporaryDirectory() as directory:
+            for isRankit in (False, True):
+                jsonPath, sidecarPath = electionGenerator.write_election(
+                    directory, 30, 25, 3, isRankit=isRankit)
+                with open(jsonPath, 'r') as f:
+                    graph = make_graph_with_file(f, False)
+                with open(sidecarPath, 'r') as f:
+                    SidecarReader(f).assert_valid(graph)
+
+                summary = graph.summarize()
+                self.assertEqual(sum(len(r.winnerNames) for r in summary.rounds), 3)
+                names = [candidate.name for candidate in summary.candidates]
+                self.assertIn('Inactive Ballots', names)
+                self.assertIn('Residual Surplus', names)
+                self.assertTrue(any(len(r.eliminatedNames) > 1 for r in summary.rounds))
+                self.assertEqual(graph.parsePath, ParsePath.UNIVERSAL_TABULATOR)
+
+        # The same arguments generate the same election
+        self.assertEqual(electionGenerator.generate_election(10, 9, 1),
+                         electionGenerator.generate_election(10, 9, 1))
+
     def test_zero_vote_election_loads(self):
         """ Ensures no divisions by zero in zero-vote elections """
         self._get_data_for_view(filenames.ZERO_VOTE_ELECTION)
@@ -136,7 +178,7 @@ class SimpleTests(TestCase):
             with open(fn, 'r+') as f:
                 config = JsonConfig(jsonFile=File(f))
                 config.__dict__[configBoolToToggle] = not config.__dict__[configBoolToToggle]
-                get_data_for_view(config)
+                get_data_for_view(config).resolve_all()
 
     def test_home_page(self):
         """ Tests that the home page loads """
@@ -241,6 +283,35 @@ class SimpleTests(TestCase):
 
         assert 'sankey' in response.context_data['oembed_url']
 
+    def test_fragments(self):
+        """ The tabs which aren't shown first are fetched separately, and are ETag-aware """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        slug = TestHelpers.get_latest_upload().slug
+
+        # The page only includes the placeholders
+        response = self.client.get(reverse('visualize', args=(slug,)))
+        self.assertNotContains(response, 'single-table-summary-table')
+        self.assertContains(response, reverse('visualizeFragment', args=(slug, 'wikicode')))
+
+        for fragment in views.FRAGMENTS:
+            url = reverse('visualizeFragment', args=(slug, fragment))
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            assert response.json()
+
+            # Unchanged fragments aren't sent again
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+        url = reverse('visualizeFragment', args=(slug, 'tabular-candidate-by-round'))
+        self.assertIn('single-table-summary-table', self.client.get(url).json()['html'])
+
+        response = self.client.get(reverse('visualizeFragment', args=(slug, 'nonexistent')))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('visualizeFragment', args=('nonexistent', 'sankey')))
+        self.assertEqual(response.status_code, 404)
+
     @patch('visualizer.wikipedia.wikipedia.WikipediaExport._get_todays_date_string')
     def test_wikicode(self, mockGetDateString):
         """ Validate that the wikicode can be generated and hasn't inadvertently changed """
@@ -279,6 +350,42 @@ class SimpleTests(TestCase):
         assert summary.rounds[0].winnerNames[0] == 'Strawberry'
         assert summary.rounds[2].winnerNames[0] == 'Vanilla'
 
+    def test_components_are_rendered_lazily(self):
+        """ Each component is only rendered when it is first used, and only once """
+        with open(filenames.MULTIWINNER, 'r+') as f:
+            graph = make_graph_with_file(f, excludeFinalWinnerAndEliminatedCandidate=False)
+
+        with patch('common.viewUtils.D3Sankey', wraps=D3Sankey) as mockSankey:
+            data = viewUtils.get_data_for_graph(graph, viewUtils.DefaultConfig())
+            mockSankey.assert_not_called()
+            self.assertEqual(data['sankeyjs'], D3Sankey(graph).js)
+            self.assertEqual(data['sankeyjs'], D3Sankey(graph).js)
+            self.assertEqual(mockSankey.call_count, 1)
+
+    def test_summary_matrices(self):
+        """ The tally matrices agree with the per-candidate lists and the transfers """
+        with open(filenames.MULTIWINNER, 'r+') as f:
+            graph = make_graph_with_file(f, excludeFinalWinnerAndEliminatedCandidate=False)
+        summary = graph.summarize()
+
+        numRounds = len(graph.nodesPerRound)
+        self.assertEqual(summary.tallies.shape, (numRounds, len(summary.items)))
+        for item, candidateInfo in summary.candidates.items():
+            i = summary.itemIndices[item]
+            numRounds = candidateInfo.numRounds
+            self.assertEqual(candidateInfo.totalVotesPerRound,
+                             summary.tallies[:numRounds, i].tolist())
+            self.assertEqual(candidateInfo.votesAddedPerRound,
+                             summary.votesAdded[:numRounds, i].tolist())
+            self.assertFalse(summary.isPresent[numRounds:, i].any())
+
+        # Every vote transferred away from a candidate arrives somewhere
+        for round_i, transfersThisRound in enumerate(graph.transfersPerRound):
+            for transfer in transfersThisRound:
+                source = summary.itemIndices[transfer.item]
+                self.assertAlmostEqual(summary.transfers[round_i, source].sum(),
+                                       sum(transfer.transfersByItem.values()))
+
     def test_uniqueness(self):
         """ Ensures filenames are not overwritten """
         slug0 = "macomb-multiwinner-surplus"
@@ -310,10 +417,103 @@ class SimpleTests(TestCase):
         self.assertIn('1: Successfully loaded macomb-multiwinner-surplus', out.getvalue())
         self.assertIn('Successfully loaded configs', out.getvalue())
 
-        # Load all files in the testData/ directory (one of which raises a TypeError)
+        # Load all files in the testData/ directory: some fail, but the others are still loaded
         out = StringIO()
-        with self.assertRaises(TypeError):
-            call_command('checkLocalFiles', 'testData/', stdout=out)
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('checkLocalFiles', 'testData/', workers=2, stdout=out, stderr=err)
+        self.assertIn('Successfully loaded testData/oneRound.json', out.getvalue())
+        self.assertIn('Could not load testData/test-baddata.json', err.getvalue())
+
+    def test_benchmark_command(self):
+        """ The benchmark command saves a baseline, and fails on regressions against it """
+        options = {'corpus': 'testData/oneRound.json', 'electionSizes': [(5, 4, 1)],
+                   'repeat': 1, 'stdout': StringIO(), 'stderr': StringIO()}
+        with tempfile.TemporaryDirectory() as directory:
+            baselinePath = os.path.join(directory, 'baseline.json')
+            call_command('benchmark', save=baselinePath, **options)
+            with open(baselinePath, 'r') as f:
+                baseline = json.load(f)
+            self.assertEqual(set(baseline['results']), {'oneRound.json', 'synthetic-5c-4r-1w'})
+            self.assertIn('FAQGenerator', baseline['results']['oneRound.json'])
+
+            # A generous threshold doesn't flag noise...
+            call_command('benchmark', compare=baselinePath, threshold=100, **options)
+
+            # ...but everything is slower than a baseline which took no time at all
+            for timings in baseline['results'].values():
+                timings['make_graph_with_file'] = 0
+            with open(baselinePath, 'w') as f:
+                json.dump(baseline, f)
+            with patch('common.benchmark.NOISE_FLOOR_SECONDS', 0):
+                with self.assertRaises(CommandError):
+                    call_command('benchmark', compare=baselinePath, threshold=100, **options)
+
+    def test_batch_validation_without_fork(self):
+        """ Workers which aren't forked set up Django before they import the check """
+        spawningPool = functools.partial(ProcessPoolExecutor,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        with patch('common.batchValidation.ProcessPoolExecutor', spawningPool):
+            validator = batchValidation.BatchValidator(check_models_are_ready, workers=2)
+            validator.run([('first', None), ('second', None)])
+        self.assertEqual(len(validator.results), 2)
+        self.assertEqual(validator.failures, [])
+
+    def test_check_uploads_report_and_checkpoint(self):
+        """ checkUploads writes a report, and resumes from its checkpoint """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        slugs = list(JsonConfig.objects.order_by('-id').values_list('slug', flat=True))
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint.jsonl')
+            report = os.path.join(directory, 'report.json')
+            with open(checkpoint, 'w') as f:
+                f.write(json.dumps({'name': slugs[0], 'seconds': 100.0, 'error': None}) + '\n')
+                # e.g. a bug which was fixed since
+                f.write(json.dumps({'name': slugs[1], 'seconds': 1.0, 'error': 'Bug'}) + '\n')
+
+            out = StringIO()
+            call_command('checkUploads', 0, 100, workers=1, checkpoint=checkpoint,
+                         report=report, stdout=out)
+            self.assertNotIn(f'0: Successfully loaded {slugs[0]} ', out.getvalue())
+            self.assertIn(f'1: Successfully loaded {slugs[1]} ', out.getvalue())
+
+            with open(report, 'r') as f:
+                reportJson = json.load(f)
+            self.assertEqual(reportJson['numChecked'], 2)
+            self.assertEqual(reportJson['failures'], [])
+            self.assertEqual(reportJson['slowest'][0]['name'], slugs[0])
+            with open(checkpoint, 'r') as f:
+                self.assertEqual(len(f.readlines()), 3)
+
+    def test_load_test_elections_and_report(self):
+        """ The load test seeds elections which render, and reports percentiles per endpoint """
+        # A user's upload which happens to be named like the seeded elections
+        tf = TestHelpers.copy_with_new_name(filenames.MULTIWINNER, 'Load test',
+                                            newFilenamePrefix='loadtest-small')
+        self.client.post('/upload.html', {'jsonFile': tf})
+        upload = TestHelpers.get_latest_upload()
+
+        with tempfile.TemporaryDirectory() as directory:
+            configs = loadTest.seed_elections(directory, {'small': (5, 4, 1)})
+        self.addCleanup(loadTest.delete_seeded_elections)
+        test = loadTest.LoadTest('', 'localhost', configs, 'update-storm', 20, 1)
+        for endpoint in ('visualize', 'embed', 'ballotpedia', 'oembed'):
+            response = self.client.get(test.get_path(endpoint, configs['small'].slug))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(test.pick_requests()), 20)
+
+        test.latencies = {('visualize', 'small'): [0.003, 0.001, 0.002, 0.004]}
+        test.numErrors = {('visualize', 'small'): 1}
+        row = test.get_report(2)['rows'][0]
+        self.assertEqual((row['numRequests'], row['numErrors'], row['requestsPerSecond']),
+                         (4, 1, 2))
+        self.assertEqual((row['p50Ms'], row['p99Ms'], row['maxMs']), (2, 4, 4))
+
+        loadTest.delete_seeded_elections()
+        self.assertFalse(JsonConfig.objects.filter(pk=configs['small'].pk).exists())
+        self.assertTrue(JsonConfig.objects.filter(pk=upload.pk).exists())
 
     @patch('requests.post')
     def test_cloudflare_purge(self, requestPostResponse):
@@ -428,3 +628,143 @@ class SimpleTests(TestCase):
         # so it's smaller
         JSONReader(data)  # note: this happens to modify data in-place, but it may not always do so
         self.assertEqual(data['results'][-1]['tally']['Inactive Ballots'], 99186.0)
+
+    def test_rankit_migrations_only_run_on_rankit_data(self):
+        """ RankIt-only migrations are skipped, without being visited, for other files """
+        with open(filenames.MULTIWINNER, 'r') as f:
+            data = json.load(f)
+        taskClasses = [FixNoTransfersTask, FixRankitMissingWinners]
+
+        migrator = JSONMigrator(data, taskClasses)
+        self.assertEqual([type(task) for task in migrator.tasks], [FixNoTransfersTask])
+
+        data['config']['jurisdiction'] = 'RankIt Export'
+        migrator = JSONMigrator(data, taskClasses)
+        self.assertEqual([type(task) for task in migrator.tasks], taskClasses)
+
+        # Every tallyResult is fixed in the one pass
+        migrator.migrate()
+        for result in data['results']:
+            for tallyResult in result['tallyResults']:
+                self.assertIn('transfers', tallyResult)
+
+    @patch('visualizer.graph.jsonStream.CHUNK_SIZE', 7)
+    def test_streaming_json_matches_json_load(self):
+        """ The streaming reader must parse exactly what json.load does, across chunks """
+        jsonFilenames = [filenames.MULTIWINNER, filenames.OPAVOTE, filenames.BROKEN_RANKIT_1,
+                         filenames.CRAZY_NAMES, filenames.THREE_ROUND, filenames.ONE_ROUND]
+        for filename in jsonFilenames:
+            with open(filename, 'rb') as f:
+                expected = json.load(f)
+                f.seek(0)
+                self.assertEqual(jsonStream.load(f), expected)
+
+            # Text mode, with a byte order mark, and split multibyte characters
+            with open(filename, 'r', encoding='utf-8') as f:
+                self.assertEqual(jsonStream.load(f), expected)
+            with open(filename, 'rb') as f:
+                self.assertEqual(jsonStream.load(BytesIO(b'\xef\xbb\xbf' + f.read())), expected)
+
+        self.assertEqual(jsonStream.load(StringIO('{"results": [], "n": 1.5e3}')),
+                         {'results': [], 'n': 1500.0})
+        self.assertEqual(jsonStream.load(StringIO(' { } ')), {})
+
+        invalidJsons = ['', '[]', '{"results": [1, ]}', '{"a": 1} {}', '{"a": 1,}', '{1: 2}']
+        for invalidJson in invalidJsons:
+            with self.assertRaises(json.JSONDecodeError):
+                jsonStream.load(StringIO(invalidJson))
+
+        # Spreadsheets fail without reading the whole file
+        with open(filenames.DOMINION, 'rb') as f:
+            with self.assertRaises(json.JSONDecodeError):
+                jsonStream.load(f)
+            self.assertLess(f.tell(), 100)
+
+    def test_file_size_limit_setting(self):
+        """ The upload size limit is configurable """
+        acceptableSizeJson = TestHelpers.generate_random_valid_json_of_size(1024 * 100)
+        with self.settings(MAX_UPLOAD_SIZE_BYTES=1024 * 50):
+            with open(acceptableSizeJson) as f:
+                response = self.client.post('/upload.html', {'jsonFile': f})
+            self.assertTemplateUsed(response, 'visualizer/errorUploadFailedGeneric.html')
+
+    def test_format_sniffing(self):
+        """ Each format is sent straight to its reader, without trying the others """
+        expectedPaths = {
+            filenames.MULTIWINNER: ParsePath.UNIVERSAL_TABULATOR,
+            filenames.BROKEN_RANKIT_1: ParsePath.UNIVERSAL_TABULATOR,
+            filenames.OPAVOTE: ParsePath.OPAVOTE,
+            filenames.ELECTIONBUDDY: ParsePath.ELECTIONBUDDY,
+            filenames.DOMINION: ParsePath.DOMINION,
+        }
+        for filename, expectedPath in expectedPaths.items():
+            with open(filename, 'rb') as f:
+                self.assertEqual(sniff_format(f), expectedPath)
+                self.assertEqual(f.tell(), 0)
+
+                with patch('visualizer.graph.graphCreator.AutomaticConverter') as mockAutomatic:
+                    graph = make_graph_with_file(f, False)
+                    mockAutomatic.assert_not_called()
+                self.assertEqual(graph.parsePath, expectedPath)
+
+        # When sniffing guesses wrong, every converter is still tried
+        with open(filenames.OPAVOTE, 'rb') as f:
+            with patch('visualizer.graph.graphCreator.sniff_format') as mockSniff:
+                mockSniff.return_value = ParsePath.ELECTIONBUDDY
+                graph = make_graph_with_file(f, False)
+        self.assertEqual(graph.parsePath, ParsePath.AUTOMATIC)
+
+    def test_sankey_payload_is_columnar(self):
+        """ The sankey is sent as one list per attribute, with consistent lengths """
+        with open(filenames.MULTIWINNER, 'rb') as f:
+            graph = make_graph_with_file(f, False)
+        sankeyJs = D3Sankey(graph).js
+        columns = json.loads(re.search(r'graph = makeSankeyGraph\((.*)\);', sankeyJs).group(1))
+
+        numActiveNodes = len([n for n in graph.nodes if n.item.isActive])
+        for column in ('candidate', 'round', 'value', 'isWinner', 'isEliminated'):
+            self.assertEqual(len(columns['nodes'][column]), numActiveNodes)
+        self.assertEqual(len(columns['nodes']['name']), len(graph.eliminationOrder))
+
+        numLinks = len(columns['links']['source'])
+        self.assertEqual(len(columns['links']['target']), numLinks)
+        self.assertEqual(len(columns['links']['value']), numLinks)
+        self.assertTrue(all(0 <= i < numActiveNodes for i in columns['links']['source']))
+
+    def test_export_sankey(self):
+        """ The plotly sankey matches the graph, and exports to standalone HTML """
+        with open(filenames.MULTIWINNER, 'rb') as f:
+            graph = make_graph_with_file(f, False)
+        trace = PlotlySankey(graph).figure['data'][0]
+        activeNodes = [n for n in graph.nodes if n.item.isActive]
+        self.assertEqual(trace['node']['label'], [n.label for n in activeNodes])
+        for source, target in zip(trace['link']['source'], trace['link']['target']):
+            self.assertEqual(activeNodes[source].roundNum + 1, activeNodes[target].roundNum)
+
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        slug = TestHelpers.get_latest_upload().slug
+        with tempfile.TemporaryDirectory() as outputDir:
+            call_command('exportSankey', slug, output_dir=outputDir, stdout=StringIO())
+            with open(os.path.join(outputDir, f'{slug}.html'), encoding='utf-8') as f:
+                html = f.read()
+        # (Don't use assertIn: plotly.js is embedded, so failures would print megabytes)
+        self.assertTrue(re.search(r'"type":\s*"sankey"', html))
+        self.assertTrue(graph.title in html)
+
+        with self.assertRaises(CommandError):
+            call_command('exportSankey', 'no-such-slug', stdout=StringIO())
+
+    def test_elimination_order_by_name(self):
+        """ Items are ordered by the given names, and unknown orders are rejected """
+        with open(filenames.THREE_ROUND, 'rb') as f:
+            graph = make_graph_with_file(f, False)
+        names = [item.name for item in graph.eliminationOrder]
+
+        reorderedItems = graph.get_items_for_names(names)
+        graph.set_elimination_order(reorderedItems)
+        self.assertEqual([item.name for item in graph.eliminationOrder], names[::-1])
+        self.assertEqual(graph.eliminationOrderIndices[reorderedItems[0]], 0)
+        self.assertEqual(graph.nodes[0].item, reorderedItems[-1])
+
+        with self.assertRaises(ValueError):
+            graph.get_items_for_names(names[1:])
@@ -23,6 +23,8 @@ urlpatterns = [
     path('', views.Index.as_view()),
     path('index.html', views.Index.as_view(), name='index'),
     path('v/<slug>', views.Visualize.as_view(), name='visualize'),
+    path('v/<slug>/wikicode.txt', views.VisualizeWikicode.as_view(), name='visualizeWikicode'),
+    path('v/<slug>/<fragment>', views.VisualizeFragment.as_view(), name='visualizeFragment'),
     path('ve/<slug>', views.VisualizeEmbedded.as_view(), name='visualizeEmbedded'),
     path('vb/<slug>', views.VisualizeBallotpedia.as_view(), name='visualizeBallotpedia'),
     path('upload.html', views.Upload.as_view(), name='upload'),
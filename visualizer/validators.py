@@ -1,15 +1,17 @@
 """ Data validation - to be used across REST and HTTP access """
 
+from django.conf import settings
 import rest_framework.serializers as serializers
 
-from common import viewUtils
-from visualizer.graph.graphCreator import make_graph_with_file
+from common import canonicalJson, renderBundle, viewUtils
+from visualizer.graph.graphCreator import make_graph_and_canonical_data, \
+    make_graph_with_canonical_data
 from visualizer.sidecar.reader import SidecarReader
 
 
-def ensure_file_is_under_2_mb(jsonFileObj):
-    """ Limit file size to 2mb"""
-    maxFileSize = 1024 * 1024 * 2  # 2MB
+def ensure_file_is_under_size_limit(jsonFileObj):
+    """ Limit file size to settings.MAX_UPLOAD_SIZE_BYTES (2mb by default) """
+    maxFileSize = settings.MAX_UPLOAD_SIZE_BYTES
     if jsonFileObj.size > maxFileSize:
         raise serializers.ValidationError('Max file size is {} and your file size is {}'.
                                           format(maxFileSize, jsonFileObj.size))
@@ -23,27 +25,44 @@ def ensure_title_is_under_256_chars(graph):
                                           format(maxTitleSize, len(graph.title)))
 
 
-def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj):
-    """ Checks that the JSON can be loaded and is under 2mb.
-        Raises:
-         - BadJSONError: Summary JSON cannot be loaded
-         - BadSidecarError: Sidecar JSON cannot be loaded
-         - ValidationError: 2mb limit is reached
-         - Anything else: unknown error
-        Returns:
-         - Loaded graph
+class LoadedJsons():
+    """
+    Everything computed while validating the uploaded files. Once the JsonConfig is saved,
+    store() it, so the first page view doesn't have to compute it all again.
     """
+
+    def __init__(self, graph, canonicalData):
+        self.graph = graph
+        self.canonicalData = canonicalData
+        self.renderData = None
+
+    def render(self, config):
+        """
+        Runs the full rendering pipeline with the config's options. The config does
+        not need to be saved yet.
+        """
+        graph = self.graph
+        if config.excludeFinalWinnerAndEliminatedCandidate:
+            # The graph was loaded without this option: reload it, skipping the conversion
+            graph = make_graph_with_canonical_data(self.canonicalData, True)
+        renderData = viewUtils.get_render_data_for_graph(graph, config)
+        self.renderData = renderData.resolve_all()
+
+    def store(self, config):
+        """ Stores the canonical JSON and the render bundle of the (now saved) config """
+        canonicalJson.store(config, self.canonicalData)
+        renderBundle.save(config, self.renderData)
+
+
+def load_jsons(jsonFileObj, sidecarJsonFileObj):
+    """ Like try_to_load_jsons, but without rendering """
     # Check filesize before opening a massive file
-    ensure_file_is_under_2_mb(jsonFileObj)
+    ensure_file_is_under_size_limit(jsonFileObj)
     if sidecarJsonFileObj is not None:
-        ensure_file_is_under_2_mb(sidecarJsonFileObj)
+        ensure_file_is_under_size_limit(sidecarJsonFileObj)
 
     # Try to make the graph
-    graph = make_graph_with_file(jsonFileObj, False)
-
-    # Sanity check that the entire pipeline works
-    # (If not, this could be the source of 500 errors)
-    viewUtils.get_data_for_graph(graph, config=viewUtils.DefaultConfig())
+    graph, canonicalData = make_graph_and_canonical_data(jsonFileObj, False)
 
     # Check title length
     ensure_title_is_under_256_chars(graph)
@@ -53,4 +72,24 @@ def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj):
         reader = SidecarReader(sidecarJsonFileObj)
         reader.assert_valid(graph)
 
-    return graph
+    return LoadedJsons(graph, canonicalData)
+
+
+def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj, config=None):
+    """ Checks that the JSON can be loaded and is under the size limit,
+        and renders it with the options of the given (possibly unsaved) config.
+        Raises:
+         - BadJSONError: Summary JSON cannot be loaded
+         - BadSidecarError: Sidecar JSON cannot be loaded
+         - ValidationError: size limit is reached
+         - Anything else: unknown error
+        Returns:
+         - LoadedJsons, with the loaded graph
+    """
+    loadedJsons = load_jsons(jsonFileObj, sidecarJsonFileObj)
+
+    # Sanity check that the entire pipeline works
+    # (If not, this could be the source of 500 errors)
+    loadedJsons.render(config or viewUtils.DefaultConfig())
+
+    return loadedJsons
@@ -1,5 +1,6 @@
 """ The django views file """
 
+import json
 import logging
 import traceback
 import urllib.parse
@@ -7,12 +8,14 @@ import urllib.parse
 # Django helpers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse, HttpResponse
-from django.shortcuts import render
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
 from django.templatetags.static import static
 from django.urls import resolve
 from django.urls import reverse
 from django.urls import Resolver404
+from django.utils.cache import add_never_cache_headers
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.clickjacking import xframe_options_exempt
@@ -24,7 +27,7 @@ from rest_framework_tracking.mixins import LoggingMixin
 
 # rcvis helpers
 from accounts.permissions import IsOwnerOrReadOnly, HasAPIAccess
-from common import viewUtils
+from common import conditionalGet, viewUtils, wikicodeCache
 from visualizer import validators
 from visualizer.common import make_complete_url, intify
 from visualizer.forms import JsonConfigForm
@@ -32,10 +35,12 @@ from visualizer.graph.graphCreator import BadJSONError
 from visualizer.sidecar.reader import BadSidecarError
 from visualizer.models import JsonConfig, HomepageFeaturedElectionColumn
 from visualizer.serializers import JsonOnlySerializer, BallotpediaSerializer, UserSerializer
-from visualizer.wikipedia.wikipedia import WikipediaExport
 
 logger = logging.getLogger(__name__)
 
+# How many of the most recent uploads the homepage lists
+NUM_MOST_RECENT = 10
+
 
 class Index(TemplateView):
     """ The homepage """
@@ -46,7 +51,7 @@ class Index(TemplateView):
         context = super().get_context_data(**kwargs)
 
         # most recent uploads
-        models = JsonConfig.objects.all().order_by('-uploadedAt')[:10]
+        models = JsonConfig.objects.all().order_by('-uploadedAt')[:NUM_MOST_RECENT]
         context['mostRecent'] = [{'slug': model.slug,
                                   'title': model.title,
                                   'numRounds': model.numRounds,
@@ -82,17 +87,22 @@ class Upload(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         try:
-            graph = validators.try_to_load_jsons(
+            # Validate with the options being uploaded, so the render is reused
+            self.model = form.save(commit=False)
+            loadedJsons = validators.try_to_load_jsons(
                 form.cleaned_data['jsonFile'],
-                form.cleaned_data['candidateSidecarFile'])
+                form.cleaned_data['candidateSidecarFile'],
+                self.model)
+            graph = loadedJsons.graph
 
-            self.model = form.save(commit=False)
             self.model.owner = self.request.user
             self.model.title = graph.title
             self.model.numRounds = len(graph.summarize().rounds)
             self.model.numCandidates = len(graph.summarize().candidates)
             self.model.save()
 
+            loadedJsons.store(self.model)
+
         except BadJSONError as exception:
             form.add_error('jsonFile', str(exception))
             tbText = traceback.format_exc()
@@ -123,7 +133,19 @@ class Upload(LoginRequiredMixin, CreateView):
         return render(self.request, 'visualizer/errorBadJson.html', context=context)
 
 
-class Visualize(DetailView):
+class StaleDataNeverCacheMixin():  # pylint: disable=too-few-public-methods
+    """ Pages rendered from a stale render bundle must not be cached """
+
+    def render_to_response(self, context, **responseKwargs):
+        """ Called by the DetailView with the data from get_context_data """
+        response = super().render_to_response(context, **responseKwargs)
+        if context.get('isStale'):
+            add_never_cache_headers(response)
+        return response
+
+
+@method_decorator(conditionalGet.config_condition, name='get')
+class Visualize(StaleDataNeverCacheMixin, DetailView):
     """ Visualizing a single JsonConfig """
     model = JsonConfig
     template_name = 'visualizer/visualize.html'
@@ -148,16 +170,74 @@ class Visualize(DetailView):
         data['htmlEmbedExport'] = viewUtils.get_embed_html(
             embedUrl, self.request, 'barchart-interactive', 400, 800)
 
-        # wikipedia embedding
-        referenceUrl = make_complete_url(self.request, reverse("visualize", args=(slug,)))
-        referenceUrl += "#tabular-candidate-by-round"
-        data['wikicodeExport'] = WikipediaExport(data['graph'], referenceUrl).create_wikicode()
-
         return data
 
 
+def _get_html_fragment(templateName):
+    """ A fragment which is the given template, rendered """
+    def get_fragment(request, data):
+        return {'html': render_to_string(templateName, data, request)}
+    return get_fragment
+
+
+def _get_wikicode_fragment(request, data):
+    """ The wikipedia embedding """
+    config = data['config']
+    referenceUrl = wikicodeCache.get_reference_url(request, config.slug)
+    return {'wikicode': wikicodeCache.get_wikicode(config, referenceUrl)}
+
+
+# The parts of the visualize page which are fetched separately, by name:
+# a function of (request, data) returning the JSON-serializable fragment.
+FRAGMENTS = {
+    'sankey': lambda request, data: {'js': data['sankeyjs']},
+    'faqs': lambda request, data: {'faqsPerRound': json.loads(data['faqsPerRound'])},
+    'tabular-by-candidate': _get_html_fragment('tabular/tabular-by-candidate.html'),
+    'tabular-by-round': _get_html_fragment('tabular/tabular-by-round.html'),
+    'tabular-by-round-interactive':
+        _get_html_fragment('tabular/tabular-by-round-interactive.html'),
+    'tabular-candidate-by-round': _get_html_fragment('tabular/tabular-candidate-by-round.html'),
+    'wikicode': _get_wikicode_fragment,
+}
+
+
+@method_decorator(conditionalGet.config_condition, name='get')
+class VisualizeFragment(View):
+    """
+    One of the FRAGMENTS of the visualize page, as JSON. The page only includes its first
+    tab, and fetches each of the others when it's first shown.
+    """
+
+    def get(self, request, slug, fragment):
+        """ Overriding the getter for this class-based view """
+        if fragment not in FRAGMENTS:
+            raise Http404(f"No such fragment: {fragment}")
+        config = get_object_or_404(JsonConfig, slug=slug)
+
+        data = viewUtils.get_data_for_view(config)
+        response = JsonResponse(FRAGMENTS[fragment](request, data))
+        if data.get('isStale'):
+            add_never_cache_headers(response)
+        return response
+
+
+@method_decorator(conditionalGet.config_condition, name='get')
+class VisualizeWikicode(View):
+    """ The wikipedia embedding, as text. It's streamed as it's generated. """
+
+    def get(self, request, slug):
+        """ Overriding the getter for this class-based view """
+        config = get_object_or_404(JsonConfig, slug=slug)
+
+        referenceUrl = wikicodeCache.get_reference_url(request, slug)
+        return StreamingHttpResponse(
+            wikicodeCache.iter_wikicode(config, referenceUrl),
+            content_type='text/plain; charset=utf-8')
+
+
 @method_decorator(xframe_options_exempt, name='dispatch')
-class VisualizeEmbedded(DetailView):
+@method_decorator(conditionalGet.config_condition, name='get')
+class VisualizeEmbedded(StaleDataNeverCacheMixin, DetailView):
     """ The embedded visualization, pointed to from Oembed """
     model = JsonConfig
     template_name = 'visualizer/visualize-embedded.html'
@@ -174,7 +254,8 @@ class VisualizeEmbedded(DetailView):
 
 
 @method_decorator(xframe_options_exempt, name='dispatch')
-class VisualizeBallotpedia(DetailView):
+@method_decorator(conditionalGet.config_condition, name='get')
+class VisualizeBallotpedia(StaleDataNeverCacheMixin, DetailView):
     """ The embedded visualization, pointed to from Oembed """
     model = JsonConfig
     template_name = 'visualizer/visualize-ballotpedia.html'
@@ -182,7 +263,7 @@ class VisualizeBallotpedia(DetailView):
     def get_context_data(self, **kwargs):
         config = super().get_context_data(**kwargs)
         data = viewUtils.get_data_for_view(config['jsonconfig'])
-        data['numVotesFirstRound'] = intify(data['graph'].summarize().rounds[0].totalActiveVotes)
+        data['numVotesFirstRound'] = intify(data['numVotesFirstRound'])
 
         sidecarData = data['candidateSidecarDataPyObj']
         if sidecarData is None:
@@ -193,6 +274,7 @@ class VisualizeBallotpedia(DetailView):
 
 
 @method_decorator(xframe_options_exempt, name='dispatch')
+@method_decorator(conditionalGet.oembed_condition, name='get')
 class Oembed(View):
     """ The oembed protocol, pointing to VisualizeEmbedded """
 
@@ -253,25 +335,43 @@ class Oembed(View):
 # For django REST
 
 
-class JsonOnlyViewSet(LoggingMixin, viewsets.ModelViewSet):
+def _precompute_wikicode_if_featured(request, config):
+    """ Featured elections get the most visits: have the wikicode which saving evicted ready """
+    referenceUrl = wikicodeCache.get_reference_url(request, config.slug)
+    wikicodeCache.precompute_if_featured(config, referenceUrl)
+
+
+class JsonConfigSaveMixin():
+    """
+    Sets the owner on creation, and on every save, stores the render bundle
+    which the serializer rendered while validating
+    """
+
+    def perform_create(self, serializer):
+        """ Called by the ModelViewSet when a JsonConfig is created """
+        serializer.save(owner=self.request.user)
+        serializer.loadedJsons.store(serializer.instance)
+
+    def perform_update(self, serializer):
+        """ Called by the ModelViewSet when a JsonConfig is updated """
+        serializer.save()
+        serializer.loadedJsons.store(serializer.instance)
+        _precompute_wikicode_if_featured(self.request, serializer.instance)
+
+
+class JsonOnlyViewSet(LoggingMixin, JsonConfigSaveMixin, viewsets.ModelViewSet):
     """ API endpoint that allows tabulated JSONs to be viewed or edited. """
     queryset = JsonConfig.objects.all().order_by('-uploadedAt')
     serializer_class = JsonOnlySerializer
     permission_classes = [HasAPIAccess, IsOwnerOrReadOnly]
 
-    def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
 
-
-class BallotpediaViewSet(LoggingMixin, viewsets.ModelViewSet):
+class BallotpediaViewSet(LoggingMixin, JsonConfigSaveMixin, viewsets.ModelViewSet):
     """ API endpoint with all ballotpedia fields """
     queryset = JsonConfig.objects.all().order_by('-uploadedAt')
     serializer_class = BallotpediaSerializer
     permission_classes = [HasAPIAccess, IsOwnerOrReadOnly]
 
-    def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
-
 
 class UserViewSet(LoggingMixin, viewsets.ReadOnlyModelViewSet):
     """ API endpoint that allows you to view but not edit Users. """
@@ -1,5 +1,9 @@
 """
 Export a single table summary to Wikipedia
+
+The wikicode is built as a list of strings which are joined once, rather than by
+repeatedly concatenating one ever-growing string. It can also be generated a candidate
+at a time, for streaming: see iter_wikicode.
 """
 
 import datetime
@@ -46,29 +50,28 @@ class WikipediaExport():
         numColumns = str(self.numRounds * 2 + 1)
 
         # Overall header (rowspan across all rows)
-        header = """
+        header = ["""
             {| class="wikitable sortable"
-            ! colspan=" """ + numColumns + """ " | """ + title + " " + reference + """
-            |- style="background:#eee; text-align:center;" """
+            ! colspan=" """, numColumns, """ " | """, title, " ", reference, """
+            |- style="background:#eee; text-align:center;" """]
 
         # Candidate header (rowspan 2)
-        header += """
-            ! rowspan=2 style="text-align:center;" | Candidate"""
+        header.append("""
+            ! rowspan=2 style="text-align:center;" | Candidate""")
 
         # Each round header (top row - round enumeration)
         for i in range(1, self.numRounds + 1):
-            header += f"""
-                ! colspan=2 style="text-align:center;" | Round {i}"""
+            header.append(f"""
+                ! colspan=2 style="text-align:center;" | Round {i}""")
 
         # Each round header (bottom row - votes vs percent)
-        header += """
-            |-"""
-        for i in range(1, self.numRounds + 1):
-            header += """
+        header.append("""
+            |-""")
+        header.extend("""
                 ! Votes
-                ! %"""
+                ! %""" for _ in range(self.numRounds))
 
-        return header
+        return ''.join(header)
 
     def _get_sortable_referenced_name_if_possible(self, name):
         """ Create a sortable name, with a reference if we can """
@@ -114,54 +117,55 @@ class WikipediaExport():
         """ Does this candidate need an elimination row bar now? """
         return not roundTabulation and not self._already_has_elimination_bar(name)
 
-    def _create_table_body(self):
-        """ Creates the body of the table """
-        singleTableSummary = SingleTableSummary(self.graph).tabulation
-
-        body = ""
-        for candidateTabulation in singleTableSummary:
-            # Get the candidate name - sorted if possible
-            name = candidateTabulation.name
-            sortableName = self._get_sortable_referenced_name_if_possible(name)
-            body += """
+    def _create_candidate_rows(self, candidateTabulation):
+        """ Creates the rows of the table for a single candidate """
+        # Get the candidate name - sorted if possible
+        name = candidateTabulation.name
+        sortableName = self._get_sortable_referenced_name_if_possible(name)
+        rows = ["""
                 |-
-                ! scope="row" style="text-align:left;" | """ + sortableName
-
-            # Go over each round
-            for round_i, roundTabulation in enumerate(candidateTabulation.eachRound):
-                # Get the elimination bar if needed
-                if self._is_elimination_row_bar_needed(name, roundTabulation):
-                    roundsRemaining = self.numRounds - round_i
-                    body += self._get_elimination_row_bar(name, roundsRemaining)
-                    continue
-                elif self._already_has_elimination_bar(name):
-                    continue
-
-                assert roundTabulation  # should be handled by _already_has_elimination_bar
-
-                # Get the green background class text if elected
-                classText = self._get_class_text_for(name, roundTabulation)
-
-                pctVotes = roundTabulation.pctVotes
-                numVotes = roundTabulation.numVotes
-                if name == common.INACTIVE_TEXT:
-                    # No percentages in inactive ballots
-                    body += f"""
-                        ! colspan="2" |  {classText} {numVotes} ballots"""
-                else:
-                    body += f"""
+                ! scope="row" style="text-align:left;" | """, sortableName]
+
+        # Go over each round
+        for round_i, roundTabulation in enumerate(candidateTabulation.eachRound):
+            # Get the elimination bar if needed
+            if self._is_elimination_row_bar_needed(name, roundTabulation):
+                roundsRemaining = self.numRounds - round_i
+                rows.append(self._get_elimination_row_bar(name, roundsRemaining))
+                continue
+            if self._already_has_elimination_bar(name):
+                continue
+
+            assert roundTabulation  # should be handled by _already_has_elimination_bar
+
+            # Get the green background class text if elected
+            classText = self._get_class_text_for(name, roundTabulation)
+
+            pctVotes = roundTabulation.pctVotes
+            numVotes = roundTabulation.numVotes
+            if name == common.INACTIVE_TEXT:
+                # No percentages in inactive ballots
+                rows.append(f"""
+                        ! colspan="2" |  {classText} {numVotes} ballots""")
+            else:
+                rows.append(f"""
                         | {classText} {numVotes}
-                        | {classText} {pctVotes}"""
-            body += """
-                |-"""
-        body += """
-            |}"""
+                        | {classText} {pctVotes}""")
+        rows.append("""
+                |-""")
 
-        return body
+        return ''.join(rows)
+
+    def iter_wikicode(self):
+        """ Yields the wikicode a piece at a time: the header, then each candidate's rows """
+        yield self._create_header()
+
+        for candidateTabulation in SingleTableSummary(self.graph).tabulation:
+            yield self._create_candidate_rows(candidateTabulation)
+
+        yield """
+            |}"""
 
     def create_wikicode(self):
         """ Return the text to generate the wikicode table """
-        text = ""
-        text += self._create_header()
-        text += self._create_table_body()
-        return text
+        return ''.join(self.iter_wikicode())